@@ -0,0 +1,140 @@
+"""
+Microbenchmark: per-cell type sniffing vs compiled converter plan
+
+Builds a synthetic BI-shaped batch (same column types as TABLE_CONFIGS["bi"])
+and times:
+- before: the original per-cell loop (column type substring tests and
+  table/column special cases checked for every cell)
+- after:  compile_converter_plan() + apply_converter_plan()
+
+Usage:
+    python scripts/etl/bench_row_converters.py [rows]   # default 1,000,000
+
+No database connection is needed.
+"""
+from __future__ import annotations
+
+import random
+import sys
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl_core"))
+
+from selective_sync import (  # noqa: E402
+    TABLE_CONFIGS,
+    apply_converter_plan,
+    compile_converter_plan,
+)
+
+
+def legacy_clean_rows(table_name: str, columns: dict, rows) -> list[tuple]:
+    """The pre-plan _prepare_clean_rows cell loop (BI has no DATE columns to parse)."""
+    column_names = list(columns.keys())
+    clean_rows = []
+    for row in rows:
+        clean_row = []
+        for i, col_name in enumerate(column_names):
+            col_type = columns[col_name].upper()
+            val = row[i]
+
+            if val is None:
+                if table_name == "cl" and col_name == "vendnm":
+                    clean_row.append("IMACX")
+                elif table_name == "bi" and col_name == "ccusto":
+                    clean_row.append("ID-Impressão Digital")
+                else:
+                    clean_row.append(None)
+                continue
+
+            if "INTEGER" in col_type:
+                try:
+                    clean_row.append(int(float(val)))
+                except (ValueError, TypeError):
+                    clean_row.append(None)
+            elif "NUMERIC" in col_type:
+                try:
+                    clean_row.append(float(val))
+                except (ValueError, TypeError):
+                    clean_row.append(None)
+            elif "BOOLEAN" in col_type:
+                clean_row.append(bool(val))
+            elif "DATE" in col_type:
+                if isinstance(val, date):
+                    clean_row.append(val)
+                elif isinstance(val, datetime):
+                    clean_row.append(val.date())
+                else:
+                    clean_row.append(None)
+            else:
+                str_val = str(val).strip()
+                if table_name == "cl" and col_name == "vendnm" and not str_val:
+                    clean_row.append("IMACX")
+                elif table_name == "bi" and col_name == "ccusto" and not str_val:
+                    clean_row.append("ID-Impressão Digital")
+                else:
+                    clean_row.append(str_val if str_val else None)
+        clean_rows.append(tuple(clean_row))
+    return clean_rows
+
+
+def make_bi_rows(count: int) -> list[tuple]:
+    """Rows shaped like the pyodbc tuples for BI (padded CHAR stamps, Decimals)."""
+    rng = random.Random(42)
+    cost_centers = ["ID-Impressão Digital", "BR-Brindes", "", None]
+    rows = []
+    for i in range(count):
+        qtt = Decimal(rng.randint(1, 500))
+        price = Decimal(rng.randint(1, 100000)).scaleb(-2)
+        rows.append(
+            (
+                f"ADM{i:017d}     ",
+                f"ADM{i // 8:017d}     ",
+                f"Impressão digital {rng.randint(1, 9999)} folhas A4   ",
+                qtt,
+                qtt * price,
+                price,
+                f"REF{rng.randint(1, 999):05d}",
+                rng.choice(cost_centers),
+            )
+        )
+    return rows
+
+
+def _time(label: str, func, rows) -> float:
+    started = time.perf_counter()
+    func(rows)
+    elapsed = time.perf_counter() - started
+    rate = len(rows) / elapsed if elapsed else float("inf")
+    print(f"   {label:<32} {elapsed:8.2f}s  {rate:>12,.0f} rows/s")
+    return rate
+
+
+def main() -> int:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    config = TABLE_CONFIGS["bi"]
+    columns = config["columns"]
+
+    print(f"Building {count:,} BI-shaped rows...")
+    rows = make_bi_rows(count)
+
+    print("Converting:")
+    before = _time(
+        "before (per-cell sniffing)",
+        lambda batch: legacy_clean_rows("bi", columns, batch),
+        rows,
+    )
+    plan = compile_converter_plan(config)
+    after = _time(
+        "after (compiled plan)",
+        lambda batch: apply_converter_plan(plan, batch),
+        rows,
+    )
+    print(f"Speed-up: {after / before:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
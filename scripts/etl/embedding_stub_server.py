@@ -0,0 +1,199 @@
+"""
+Embedding API Stub Server
+=========================
+
+Local stand-in for the OpenRouter /embeddings endpoint, for benchmarking and
+load-testing generate_quote_embeddings.py without network access or API cost.
+
+Answers POST /v1/embeddings in the OpenAI format (data[].embedding, index,
+usage) with deterministic hashing vectors, after a simulated latency. It can
+also enforce a requests-per-minute limit (429 with Retry-After) and fail a
+share of requests with 503, so the client's rate limiting and retries are
+exercised too.
+
+Usage:
+    python scripts/etl/embedding_stub_server.py --latency-ms 300 --requests-per-minute 120
+    python scripts/etl/generate_quote_embeddings.py --provider stub --allow-fake-vectors
+
+The vectors are not semantic embeddings: point the generator at a local /
+test database only.
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl_core"))
+
+from embedding_providers import EMBEDDING_DIMENSIONS, estimate_tokens, hashing_vector
+
+
+class RequestLimiter:
+    """Thread-safe token bucket; returns the wait before the next free slot."""
+
+    def __init__(self, requests_per_minute: float):
+        self.rate = requests_per_minute / 60
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.texts = 0
+        self.rate_limited = 0
+        self.errors = 0
+
+    def add(self, field: str, amount: int = 1) -> None:
+        with self.lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+
+def make_handler(args: argparse.Namespace, limiter: RequestLimiter, stats: Stats):
+    class EmbeddingHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length)
+            if self.path.rstrip("/") not in ("/v1/embeddings", "/embeddings"):
+                self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+
+            wait = limiter.try_acquire()
+            if wait > 0:
+                stats.add("rate_limited")
+                self.send_json(
+                    429,
+                    {"error": {"message": "Rate limit exceeded"}},
+                    {"Retry-After": f"{max(1, round(wait))}"},
+                )
+                return
+
+            try:
+                payload = json.loads(body)
+                texts = payload["input"]
+                if isinstance(texts, str):
+                    texts = [texts]
+            except (ValueError, KeyError, TypeError):
+                self.send_json(400, {"error": {"message": "Expected JSON with an 'input' list"}})
+                return
+
+            latency = args.latency_ms + args.per_text_ms * len(texts)
+            if args.jitter_ms:
+                latency += random.uniform(-args.jitter_ms, args.jitter_ms)
+            time.sleep(max(0.0, latency) / 1000)
+
+            if args.error_rate and random.random() < args.error_rate:
+                stats.add("errors")
+                self.send_json(503, {"error": {"message": "Simulated upstream error"}})
+                return
+
+            stats.add("requests")
+            stats.add("texts", len(texts))
+            tokens = estimate_tokens(texts)
+            self.send_json(
+                200,
+                {
+                    "object": "list",
+                    "model": payload.get("model", "stub"),
+                    "data": [
+                        {
+                            "object": "embedding",
+                            "index": index,
+                            "embedding": hashing_vector(text, args.dimensions),
+                        }
+                        for index, text in enumerate(texts)
+                    ],
+                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+                },
+            )
+
+        def send_json(self, status: int, body: dict, headers: dict | None = None) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *log_args):
+            if args.verbose:
+                super().log_message(format, *log_args)
+
+    return EmbeddingHandler
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Local stand-in for the embeddings API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200, help="Base latency per request")
+    parser.add_argument("--per-text-ms", type=float, default=2, help="Extra latency per text")
+    parser.add_argument("--jitter-ms", type=float, default=50, help="Random +/- latency")
+    parser.add_argument(
+        "--requests-per-minute",
+        type=float,
+        default=0,
+        help="Answer 429 with Retry-After above this rate (0 = unlimited)",
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0, help="Share of requests failed with 503 (0-1)"
+    )
+    parser.add_argument("--dimensions", type=int, default=EMBEDDING_DIMENSIONS)
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    limiter = RequestLimiter(args.requests_per_minute)
+    stats = Stats()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args, limiter, stats))
+    server.daemon_threads = True
+
+    print(f"Embedding stub listening on http://{args.host}:{args.port}/v1/embeddings")
+    print(
+        f"Latency: {args.latency_ms:.0f}ms + {args.per_text_ms:.0f}ms/text "
+        f"(+/- {args.jitter_ms:.0f}ms) | "
+        f"Rate limit: {args.requests_per_minute or 'unlimited'} requests/min | "
+        f"Error rate: {args.error_rate:.0%}"
+    )
+    started = time.monotonic()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        elapsed = time.monotonic() - started
+        print(
+            f"\nServed {stats.requests:,} requests ({stats.texts:,} texts) in {elapsed:.0f}s; "
+            f"{stats.rate_limited:,} rate limited, {stats.errors:,} simulated errors"
+        )
+
+
+if __name__ == "__main__":
+    main()
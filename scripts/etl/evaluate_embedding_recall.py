@@ -0,0 +1,196 @@
+"""
+Evaluate Reduced Embedding Recall
+=================================
+
+Measures how much of the full-vector search result each reduced storage
+form keeps, on our own quote texts: every query is one of the stored
+vectors, its exact top-k neighbours (full float32 cosine, itself excluded)
+are the reference, and each form reports recall@k - the share of those
+neighbours it also ranks in its top k - plus the mean similarity error on
+them (the search threshold is applied to the reduced similarity).
+
+Forms compared:
+- halfvec: the vectors rounded to float16
+- pca-<d>: projections fitted on the vectors that are not queries
+- active:  the stored active projection (with --source db; it may have been
+           fitted on the queries too)
+
+Usage:
+    python scripts/etl/evaluate_embedding_recall.py
+    python scripts/etl/evaluate_embedding_recall.py --source cache --k 1,10,20 --dimensions 128,256,512
+
+Requirements:
+    - numpy
+    - PG_HOST, PG_DB, PG_USER, PG_PASSWORD for --source db (default)
+
+Nothing is written.
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl_core"))
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+from embedding_cache import EmbeddingCache
+from vector_reduction import (
+    REDUCED_DIMENSIONS,
+    STORAGE_COMPONENT_BYTES,
+    cosine_top_k,
+    fetch_active_projection,
+    fetch_full_vectors,
+    fit_projection,
+    normalize_rows,
+    recall_at_k,
+    to_halfvec,
+)
+
+load_dotenv()
+load_dotenv(".env.local")
+
+EMBEDDING_MODEL = "openai/text-embedding-3-small"
+CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    str(Path(__file__).resolve().parent / ".cache" / "quote_embeddings.sqlite3"),
+)
+
+
+def connect():
+    return psycopg2.connect(
+        host=os.getenv("PG_HOST"),
+        dbname=os.getenv("PG_DB"),
+        user=os.getenv("PG_USER"),
+        password=os.getenv("PG_PASSWORD"),
+        port=os.getenv("PG_PORT", "5432"),
+        sslmode=os.getenv("PG_SSLMODE", "require"),
+    )
+
+
+def load_vectors(args):
+    """(vectors, active projection or None)"""
+    if args.source == "cache":
+        cache = EmbeddingCache(CACHE_PATH, args.model)
+        try:
+            vectors = [vector for _, vector in cache.items()]
+        finally:
+            cache.close()
+        print(f"Loaded {len(vectors):,} vectors from {CACHE_PATH} ({args.model})")
+        return vectors, None
+    conn = connect()
+    try:
+        _, vectors = fetch_full_vectors(conn)
+        projection = fetch_active_projection(conn)
+    finally:
+        conn.close()
+    print(f"Loaded {len(vectors):,} full / halfvec vectors from quote_embedding_vectors")
+    return vectors, projection
+
+
+def evaluate(name, corpus, queries, query_index, exact, exact_scores, ks, bytes_per_vector):
+    """One result row: recall@k for each k and the similarity error on the exact neighbours."""
+    approx = cosine_top_k(corpus, queries, max(ks), exclude=query_index)
+    corpus_unit = normalize_rows(corpus)
+    queries_unit = normalize_rows(queries)
+    approx_scores = np.einsum("qd,qkd->qk", queries_unit, corpus_unit[exact])
+    return {
+        "name": name,
+        "bytes": bytes_per_vector,
+        "recall": {k: recall_at_k(exact[:, :k], approx[:, :k]) for k in ks},
+        "similarity_error": float(np.abs(approx_scores - exact_scores).mean()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="recall@k of reduced vs full quote embeddings")
+    parser.add_argument("--source", choices=("db", "cache"), default="db")
+    parser.add_argument("--model", default=EMBEDDING_MODEL, help="Cache model (--source cache)")
+    parser.add_argument("--queries", type=int, default=200, help="Stored vectors used as queries")
+    parser.add_argument("--k", default="1,10,20", help="Comma-separated k values")
+    parser.add_argument(
+        "--dimensions",
+        default=f"64,128,{REDUCED_DIMENSIONS},512",
+        help="Comma-separated PCA sizes to try",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    ks = sorted({int(k) for k in args.k.split(",")})
+    dimensions = sorted({int(d) for d in args.dimensions.split(",")})
+
+    vectors, active = load_vectors(args)
+    if len(vectors) <= max(ks) + 1:
+        print(f"ERROR: need more than {max(ks) + 1} vectors, got {len(vectors)}")
+        sys.exit(1)
+    full = normalize_rows(vectors)
+    count, source_dimensions = full.shape
+
+    rng = np.random.default_rng(args.seed)
+    query_index = rng.choice(count, size=min(args.queries, count), replace=False)
+    fit_mask = np.ones(count, dtype=bool)
+    fit_mask[query_index] = False
+    print(f"{len(query_index):,} queries against {count:,} vectors; projections fitted on {fit_mask.sum():,}")
+
+    exact = cosine_top_k(full, full[query_index], max(ks), exclude=query_index)
+    exact_scores = np.einsum("qd,qkd->qk", full[query_index], full[exact])
+
+    def run(name, corpus, queries, bytes_per_vector):
+        return evaluate(
+            name, corpus, queries, query_index, exact, exact_scores, ks, bytes_per_vector
+        )
+
+    results = [run("full", full, full[query_index], source_dimensions * STORAGE_COMPONENT_BYTES["full"])]
+
+    half = to_halfvec(full)
+    results.append(
+        run("halfvec", half, half[query_index], source_dimensions * STORAGE_COMPONENT_BYTES["halfvec"])
+    )
+
+    for size in dimensions:
+        if size >= source_dimensions or fit_mask.sum() < size:
+            print(f"Skipping pca-{size}: needs fewer than {source_dimensions} dimensions and {size}+ vectors")
+            continue
+        projection = fit_projection(full[fit_mask], size, f"pca-{size}", args.model)
+        reduced = projection.project(full)
+        results.append(
+            run(
+                f"pca-{size} ({projection.explained_variance:.1%} var)",
+                reduced,
+                reduced[query_index],
+                size * STORAGE_COMPONENT_BYTES["pca"],
+            )
+        )
+
+    if active is not None and active.source_dimensions == source_dimensions:
+        reduced = active.project(full)
+        results.append(
+            run(
+                f"active {active.name}",
+                reduced,
+                reduced[query_index],
+                active.dimensions * STORAGE_COMPONENT_BYTES["pca"],
+            )
+        )
+
+    name_width = max(len(result["name"]) for result in results)
+    header = f"{'Form':<{name_width}}  {'Bytes':>6}  " + "  ".join(f"{f'R@{k}':>6}" for k in ks)
+    print("\n" + header + "  Sim err")
+    print("-" * (len(header) + 9))
+    for result in results:
+        recalls = "  ".join(f"{result['recall'][k]:>6.3f}" for k in ks)
+        print(
+            f"{result['name']:<{name_width}}  {result['bytes']:>6,}  {recalls}  "
+            f"{result['similarity_error']:>7.4f}"
+        )
+    print(
+        f"\nBytes = vector storage per text (before index overhead). "
+        f"Full storage for {count:,} texts: {count * results[0]['bytes'] / 1_048_576:.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -10,31 +10,77 @@ exact keyword matches.
 
 Usage:
     python scripts/etl/generate_quote_embeddings.py
+    python scripts/etl/generate_quote_embeddings.py --concurrency 8 --requests-per-minute 300
+    python scripts/etl/generate_quote_embeddings.py --provider hashing --allow-fake-vectors
 
 Requirements:
     - OPENROUTER_API_KEY environment variable
     - NEXT_PUBLIC_SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables
     - pgvector extension enabled in Supabase (run migration first)
 
+Throughput (environment variables, or the matching command-line options):
+    - EMBEDDING_BATCH_SIZE (50): texts per API request
+    - EMBEDDING_CONCURRENCY (4): API requests in flight
+    - EMBEDDING_REQUESTS_PER_MINUTE (120): token bucket for requests, 0 = unlimited
+    - EMBEDDING_TOKENS_PER_MINUTE (0): token bucket for input tokens (~4 chars each), 0 = unlimited
+    - EMBEDDING_MAX_RETRIES (6): retries of a 429 / 5xx / network error per batch
+
+Storage (EMBEDDING_STORAGE or --storage, see etl_core/vector_reduction.py):
+full vector(1536) by default, halfvec(1536), or pca - vector(256) projected
+with the projection fitted by reduce_quote_embeddings.py. The local cache
+always keeps the full vectors.
+
+Each distinct text is embedded once: quote lines are keyed by the SHA-256 of
+their whitespace-normalised description, the vector is stored once in
+quote_embedding_vectors and quote_embeddings rows reference it by
+content_hash. The texts still missing a vector are read page by page from
+get_quote_texts_needing_embeddings() with a keyset cursor on the hash,
+looked up in a local SQLite cache (EMBEDDING_CACHE_PATH, default
+scripts/etl/.cache/quote_embeddings.sqlite3) and only then sent to the API.
+At the end link_quote_embeddings() links every quote line to its vector.
+
+Requests run concurrently through an embedding provider (EMBEDDING_PROVIDER /
+--provider, see etl_core/embedding_providers.py) while finished batches are
+written to Supabase by a separate writer. The openrouter provider is the
+default; stub talks to embedding_stub_server.py and hashing computes vectors
+locally, so throughput can be measured without network access. Their vectors
+are not semantic, so they only run with --allow-fake-vectors. A 429 honours
+Retry-After and pauses every worker; other failures back off exponentially.
+
 Cost estimate:
     - ~2000 quotes * ~100 tokens avg = 200K tokens
     - text-embedding-3-small (via OpenRouter): $0.02 per 1M tokens
     - Total: ~$0.004 (very cheap!)
 """
 
+import argparse
+import asyncio
+import io
 import os
 import sys
 import time
 from datetime import datetime
+from pathlib import Path
 from typing import Any, Dict, List
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl_core"))
 
-import httpx
+import psycopg2
 from dotenv import load_dotenv
 
+from embedding_cache import EmbeddingCache, normalize_text
+from embedding_providers import PROVIDERS, EmbeddingProvider, create_provider
+from pg_copy import encode_rows, encoders_for_columns
 from supabase import Client, create_client
+from vector_reduction import (
+    STORAGE_COLUMNS,
+    STORAGE_MODES,
+    Projection,
+    fetch_active_projection,
+    parse_vector,
+)
 
 # Load environment variables - check both .env and .env.local
 load_dotenv()  # Load .env first
@@ -48,9 +94,28 @@ SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 # Embedding model configuration - using OpenRouter
 # OpenRouter supports OpenAI embedding models
 EMBEDDING_MODEL = "openai/text-embedding-3-small"  # 1536 dimensions via OpenRouter
-BATCH_SIZE = 50  # Smaller batches for OpenRouter
+# openrouter | stub (embedding_stub_server.py) | hashing (local, offline)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openrouter")
+# Overrides the provider's endpoint (openrouter / stub)
+EMBEDDING_API_URL = os.getenv("EMBEDDING_API_URL")
+# full | halfvec | pca (needs a projection from reduce_quote_embeddings.py)
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "full")
 MAX_TOKENS_PER_TEXT = 8000  # Model limit is 8191
 
+# Throughput
+BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "50"))
+CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+REQUESTS_PER_MINUTE = float(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "120"))
+TOKENS_PER_MINUTE = float(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "0"))
+MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+# Batches fetched per work-queue query, per request slot
+BATCHES_AHEAD = 8
+# Local vector cache, consulted before Supabase and the API
+CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    str(Path(__file__).resolve().parent / ".cache" / "quote_embeddings.sqlite3"),
+)
+
 
 def get_supabase_client() -> Client:
     """Create Supabase client."""
@@ -61,24 +126,12 @@ def get_supabase_client() -> Client:
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
-def get_embeddings(texts: List[str]) -> List[List[float]]:
-    """
-    Get embeddings from OpenRouter API for a batch of texts.
-
-    Args:
-        texts: List of text strings to embed
-
-    Returns:
-        List of embedding vectors (1536 floats each)
-    """
-    if not OPENROUTER_API_KEY:
-        raise ValueError("Missing OPENROUTER_API_KEY environment variable")
-
-    # Truncate texts that are too long and clean them
+def prepare_texts(texts: List[str]) -> List[str]:
+    """Clean texts and truncate the ones over the model's input limit."""
     truncated_texts = []
     for text in texts:
         # Clean the text
-        clean_text = (text or "").strip()
+        clean_text = normalize_text(text)
         if not clean_text:
             clean_text = "empty"
         # Rough estimate: 4 chars per token
@@ -86,200 +139,466 @@ def get_embeddings(texts: List[str]) -> List[List[float]]:
             truncated_texts.append(clean_text[: MAX_TOKENS_PER_TEXT * 4])
         else:
             truncated_texts.append(clean_text)
-
-    response = httpx.post(
-        "https://openrouter.ai/api/v1/embeddings",
-        headers={
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://imacx.pt",
-            "X-Title": "IMACX Quote Embeddings",
-        },
-        json={"model": EMBEDDING_MODEL, "input": truncated_texts},
-        timeout=120.0,
+    return truncated_texts
+
+
+def connect_postgres():
+    """Direct Postgres connection when PG_* variables are configured, else None."""
+    if not os.getenv("PG_HOST"):
+        return None
+    return psycopg2.connect(
+        host=os.getenv("PG_HOST"),
+        dbname=os.getenv("PG_DB"),
+        user=os.getenv("PG_USER"),
+        password=os.getenv("PG_PASSWORD"),
+        port=os.getenv("PG_PORT", "5432"),
+        sslmode=os.getenv("PG_SSLMODE", "require"),
     )
 
-    if response.status_code != 200:
-        raise Exception(
-            f"OpenRouter API error: {response.status_code} - {response.text}"
-        )
-
-    data = response.json()
-
-    # Sort by index to ensure correct order
-    embeddings_data = sorted(data["data"], key=lambda x: x["index"])
-    embeddings = [item["embedding"] for item in embeddings_data]
 
-    return embeddings
+class TextQueue:
+    """
+    Keyset cursor over the distinct quote texts that have no vector yet.
 
+    get_quote_texts_needing_embeddings() walks the content_hash expression
+    index of phc.temp_quotes_bi past the last hash returned and skips hashes
+    already in quote_embedding_vectors, so every page costs O(page) and the
+    run never rescans what it has passed (texts that fail are retried on
+    the next run).
 
-def get_quotes_needing_embeddings(
-    supabase: Client, limit: int = 1000
-) -> List[Dict[str, Any]]:
+    Pages are read in a worker thread while the writer's COPY + merge is in
+    flight, so the queue has its own connection: committing or rolling back
+    the writer's would split a COPY from its merge.
     """
-    Fetch quotes from temp_quotes_bi that don't have embeddings yet.
 
-    Returns unique document_number + description combinations that aren't
-    already in the quote_embeddings table.
-    """
-    # Get distinct document_number + description from temp_quotes_bi
-    # that don't exist in quote_embeddings yet
-    response = supabase.rpc(
-        "get_quotes_needing_embeddings", {"limit_count": limit}
-    ).execute()
+    def __init__(self, supabase: Client, pg_conn=None):
+        self.supabase = supabase
+        self.pg_conn = pg_conn
+        self.after_hash = ""
 
-    return response.data or []
+    def close(self) -> None:
+        if self.pg_conn:
+            self.pg_conn.close()
 
+    def _query_rows(self, sql: str, params=None) -> List[tuple]:
+        """Run a read query on the queue's connection (its own short transaction)."""
+        cursor = self.pg_conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            self.pg_conn.commit()
+            cursor.close()
+
+    def remaining(self) -> int:
+        """Distinct texts without a vector (one full scan, for progress/ETA)."""
+        if self.pg_conn:
+            return self._query_rows("SELECT public.count_quote_texts_needing_embeddings()")[0][0]
+        return self.supabase.rpc("count_quote_texts_needing_embeddings", {}).execute().data or 0
+
+    def next_page(self, limit: int) -> List[Dict[str, Any]]:
+        """Next texts after the cursor: [{content_hash, description}] ordered by hash."""
+        params = {"p_after_hash": self.after_hash, "p_limit": limit}
+        if self.pg_conn:
+            rows = [
+                {"content_hash": content, "description": description}
+                for content, description in self._query_rows(
+                    "SELECT content_hash, description "
+                    "FROM public.get_quote_texts_needing_embeddings(%(p_after_hash)s, %(p_limit)s)",
+                    params,
+                )
+            ]
+        else:
+            rows = (
+                self.supabase.rpc("get_quote_texts_needing_embeddings", params).execute().data
+                or []
+            )
+        if rows:
+            self.after_hash = rows[-1]["content_hash"]
+        return rows
 
-def get_quotes_needing_embeddings_fallback(
-    supabase: Client, limit: int = 1000
-) -> List[Dict[str, Any]]:
-    """
-    Fallback method if the RPC doesn't exist yet.
-    Gets all unique descriptions from temp_quotes_bi joined with temp_quotes_bo.
 
-    Schema:
-    - phc.temp_quotes_bo: document_id (PK), document_number
-    - phc.temp_quotes_bi: document_id (FK), description
+class EmbeddingWriter:
     """
-    # First get ALL existing embeddings (paginate to avoid 1000 row limit)
-    existing_set = set()
-    page_size = 1000
-    offset = 0
+    Stores one vector per content hash in quote_embedding_vectors; link()
+    then points the quote_embeddings rows (document_number, description)
+    at them.
 
-    while True:
-        existing = (
-            supabase.table("quote_embeddings")
-            .select("document_number, description")
-            .range(offset, offset + page_size - 1)
-            .execute()
-        )
-        if not existing.data:
-            break
-        for row in existing.data:
-            existing_set.add((row["document_number"], row["description"]))
-        if len(existing.data) < page_size:
-            break
-        offset += page_size
-
-    # Paginate through BI lines to find ones without embeddings.
-    # This avoids stopping early if the first chunk is already embedded.
-    page_size = 1000
-    offset = 0
-    quotes_to_process: List[Dict[str, Any]] = []
-    seen = set()
-
-    while len(quotes_to_process) < limit:
-        response = (
-            supabase.schema("phc")
-            .table("temp_quotes_bi")
-            .select("document_id, description, temp_quotes_bo!inner(document_number)")
-            .not_.is_("description", "null")
-            .range(offset, offset + page_size - 1)
-            .execute()
-        )
+    With PG_HOST set, a write is a binary COPY (vectors packed by
+    pg_copy.py) into a temporary staging table merged with INSERT ... ON
+    CONFLICT. Otherwise each write is a single multi-row PostgREST upsert.
 
-        rows = response.data or []
-        if not rows:
-            break
+    `storage` picks the column written (see vector_reduction.py); for pca
+    the vectors are projected with the active projection first.
+    """
 
-        for row in rows:
-            bo_data = row.get("temp_quotes_bo")
-            if not bo_data:
-                continue
-            doc_num = (
-                bo_data.get("document_number") if isinstance(bo_data, dict) else None
+    def __init__(self, supabase: Client, storage: str = "full"):
+        self.supabase = supabase
+        self.pg_conn = None
+        self.storage = storage
+        self.column, self.column_type = STORAGE_COLUMNS[storage]
+        self.vector_columns = ("content_hash", self.column)
+        self.projection: Projection | None = None
+
+    def connect(self) -> None:
+        """Use a direct Postgres connection when PG_* variables are configured."""
+        conn = connect_postgres()
+        if conn is None:
+            return
+        cursor = conn.cursor()
+        # Same column types as the target, so binary COPY matches exactly
+        cursor.execute(
+            f"""
+            CREATE TEMP TABLE quote_embedding_vectors_stage ON COMMIT DELETE ROWS AS
+            SELECT {", ".join(self.vector_columns)} FROM public.quote_embedding_vectors WITH NO DATA
+            """
+        )
+        conn.commit()
+        cursor.close()
+        self.pg_conn = conn
+
+    def close(self) -> None:
+        if self.pg_conn:
+            self.pg_conn.close()
+
+    @property
+    def method(self) -> str:
+        return "COPY + merge" if self.pg_conn else "PostgREST bulk upsert"
+
+    def load_projection(self) -> Projection:
+        """Load the active projection (pca storage); raises if none is active."""
+        if self.pg_conn:
+            self.projection = fetch_active_projection(self.pg_conn)
+        else:
+            active = (
+                self.supabase.table("quote_embedding_projections")
+                .select("name, model, explained_variance, sample_count")
+                .eq("is_active", True)
+                .execute()
+                .data
             )
-            if not doc_num:
-                continue
-
-            description = row.get("description")
-            if not description:
-                continue
-
-            key = (str(doc_num), description)
-            if key not in existing_set and key not in seen:
-                seen.add(key)
-                quotes_to_process.append(
-                    {"document_number": str(doc_num), "description": description}
+            if active:
+                info = active[0]
+                components = (
+                    self.supabase.table("quote_embedding_projection_components")
+                    .select("weights")
+                    .eq("projection_name", info["name"])
+                    .order("component")
+                    .execute()
+                    .data
                 )
-                if len(quotes_to_process) >= limit:
-                    break
-
-        if len(rows) < page_size:
-            break
-        offset += page_size
-
-    return quotes_to_process
-
-
-def insert_embedding(
-    supabase: Client, document_number: str, description: str, embedding: List[float]
-) -> bool:
-    """Insert a new embedding into quote_embeddings table."""
-    try:
-        # Format embedding as PostgreSQL vector string
-        embedding_str = f"[{','.join(map(str, embedding))}]"
-
-        supabase.table("quote_embeddings").upsert(
-            {
-                "document_number": document_number,
-                "description": description,
-                "description_embedding": embedding_str,
-            },
-            on_conflict="document_number,description",
+                self.projection = Projection(
+                    info["name"],
+                    info["model"],
+                    [parse_vector(row["weights"]) for row in components],
+                    info["explained_variance"],
+                    info["sample_count"],
+                )
+        if self.projection is None:
+            raise ValueError("No active projection - run reduce_quote_embeddings.py fit --activate")
+        return self.projection
+
+    def write(self, vectors: Dict[str, List[float]]) -> None:
+        """Insert vectors by content_hash (existing hashes are kept); raises on failure."""
+        if not vectors:
+            return
+        hashes = list(vectors)
+        values = list(vectors.values())
+        if self.storage == "pca":
+            values = self.projection.project(values).tolist()
+        if self.pg_conn:
+            self._copy_merge(list(zip(hashes, values)))
+            return
+        self.supabase.table("quote_embedding_vectors").upsert(
+            [dict(zip(self.vector_columns, row)) for row in zip(hashes, values)],
+            on_conflict="content_hash",
+            ignore_duplicates=True,
         ).execute()
-        return True
-    except Exception as e:
-        print(f"  Error inserting embedding for {document_number}: {e}")
-        return False
 
+    def link(self) -> int:
+        """Point every quote line whose text has a vector at it; returns rows linked."""
+        if self.pg_conn:
+            cursor = self.pg_conn.cursor()
+            try:
+                cursor.execute("SELECT public.link_quote_embeddings()")
+                linked = cursor.fetchone()[0]
+                self.pg_conn.commit()
+            except Exception:
+                self.pg_conn.rollback()
+                raise
+            finally:
+                cursor.close()
+            return linked
+        return self.supabase.rpc("link_quote_embeddings", {}).execute().data or 0
+
+    def _copy_merge(self, vector_rows: List[tuple]) -> None:
+        vector_columns = ", ".join(self.vector_columns)
+        try:
+            cursor = self.pg_conn.cursor()
+            cursor.copy_expert(
+                f"COPY quote_embedding_vectors_stage ({vector_columns}) "
+                "FROM STDIN WITH (FORMAT binary)",
+                io.BytesIO(encode_rows(encoders_for_columns(("TEXT", self.column_type)), vector_rows)),
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO public.quote_embedding_vectors ({vector_columns})
+                SELECT {vector_columns} FROM quote_embedding_vectors_stage
+                ON CONFLICT (content_hash) DO NOTHING
+                """
+            )
+            self.pg_conn.commit()
+            cursor.close()
+        except Exception:
+            self.pg_conn.rollback()
+            raise
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class Progress:
+    """Counts (distinct texts), measured throughput and ETA of a run."""
+
+    # Throughput is measured over the last minute, so it follows rate limiting
+    RATE_WINDOW_SECONDS = 60.0
+
+    def __init__(self, total: int):
+        self.total = total
+        self.embedded = 0
+        self.failed = 0
+        self.batches = 0
+        self.api_seconds = 0.0
+        # Of the stored texts: sent to the API, or found in the local cache
+        self.api_texts = 0
+        self.cache_hits = 0
+        self.started = time.monotonic()
+        self._samples = [(self.started, 0)]
+
+    def record(self, embedded: int, failed: int) -> None:
+        self.batches += 1
+        self.embedded += embedded
+        self.failed += failed
+        now = time.monotonic()
+        self._samples.append((now, self.embedded))
+        while len(self._samples) > 2 and now - self._samples[1][0] > self.RATE_WINDOW_SECONDS:
+            self._samples.pop(0)
+
+    def rate(self) -> float:
+        """Texts stored per second over the recent window."""
+        (first_time, first_count), (last_time, last_count) = self._samples[0], self._samples[-1]
+        if last_time <= first_time:
+            return 0.0
+        return (last_count - first_count) / (last_time - first_time)
+
+    def eta(self) -> str:
+        remaining = max(0, self.total - self.embedded - self.failed)
+        rate = self.rate()
+        if not remaining:
+            return "0s"
+        return format_duration(remaining / rate) if rate > 0 else "unknown"
+
+    def report(self, batch_embedded: int, batch_size: int) -> None:
+        done = self.embedded + self.failed
+        pct = (done / self.total * 100) if self.total > 0 else 0
+        print(
+            f"Batch {self.batches}: {batch_embedded}/{batch_size} | "
+            f"Overall: {done:,}/{self.total:,} texts ({pct:.1f}%) | "
+            f"{self.rate():.1f} texts/s | ETA {self.eta()}"
+        )
 
-def generate_embeddings_batch(supabase: Client, quotes: List[Dict[str, Any]]) -> int:
-    """
-    Generate and store embeddings for a batch of quotes.
 
-    Returns number of successfully inserted embeddings.
+async def embed_batch(
+    provider: EmbeddingProvider,
+    texts: List[Dict[str, Any]],
+    cache: EmbeddingCache,
+    semaphore: asyncio.Semaphore,
+    write_queue: asyncio.Queue,
+    progress: Progress,
+) -> None:
+    """Embed one batch of distinct texts and hand it to the writer (holds a request slot until queued)."""
+    async with semaphore:
+        started = time.monotonic()
+        try:
+            embeddings = await provider.embed(
+                prepare_texts([text["description"] for text in texts])
+            )
+        except Exception as e:
+            print(f"  Error getting embeddings: {e}")
+            progress.record(0, len(texts))
+            progress.report(0, len(texts))
+            return
+        progress.api_seconds += time.monotonic() - started
+        progress.api_texts += len(texts)
+        vectors = {text["content_hash"]: embedding for text, embedding in zip(texts, embeddings)}
+        cache.put_many(vectors)
+        await write_queue.put(vectors)
+
+
+async def write_embeddings(
+    writer: EmbeddingWriter, write_queue: asyncio.Queue, progress: Progress
+) -> None:
+    """Writer task: stores finished batches while the next ones are being embedded."""
+    while True:
+        vectors = await write_queue.get()
+        try:
+            if vectors is None:
+                return
+            try:
+                await asyncio.to_thread(writer.write, vectors)
+                stored = len(vectors)
+            except Exception as e:
+                print(f"  Error storing embeddings: {e}")
+                stored = 0
+            progress.record(stored, len(vectors) - stored)
+            progress.report(stored, len(vectors))
+        finally:
+            write_queue.task_done()
+
+
+async def run_pipeline(
+    text_queue: TextQueue,
+    writer: EmbeddingWriter,
+    provider: EmbeddingProvider,
+    cache: EmbeddingCache,
+    progress: Progress,
+    batch_size: int,
+    concurrency: int,
+) -> None:
     """
-    if not quotes:
-        return 0
+    Embed every distinct quote text still missing a vector, `concurrency` requests at a time.
 
-    # Prepare texts for embedding
-    texts = [q["description"] or "" for q in quotes]
+    Pages come from the keyset work queue; vectors found in the local cache
+    are stored directly, the rest go to the provider in batches.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    write_queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
 
-    # Get embeddings from OpenRouter
+    writer_task = asyncio.create_task(write_embeddings(writer, write_queue, progress))
     try:
-        embeddings = get_embeddings(texts)
-    except Exception as e:
-        print(f"  Error getting embeddings: {e}")
-        return 0
-
-    # Insert each embedding
-    success_count = 0
-    for quote, embedding in zip(quotes, embeddings):
-        if insert_embedding(
-            supabase, quote["document_number"], quote["description"], embedding
-        ):
-            success_count += 1
+        while True:
+            # The cursor moves on by itself and reads on its own connection, so
+            # the next page can be read while this one's writes are in flight
+            texts = await asyncio.to_thread(
+                text_queue.next_page, batch_size * concurrency * BATCHES_AHEAD
+            )
+            if not texts:
+                print("No more texts to embed")
+                break
+
+            cached = cache.get_many(text["content_hash"] for text in texts)
+            to_embed = [text for text in texts if text["content_hash"] not in cached]
+            progress.cache_hits += len(cached)
+            print(
+                f"\nQueued {len(texts)} texts: {len(cached)} from local cache, "
+                f"{len(to_embed)} to embed..."
+            )
 
-    return success_count
+            if cached:
+                await write_queue.put(cached)
+            batches = [to_embed[i : i + batch_size] for i in range(0, len(to_embed), batch_size)]
+            await asyncio.gather(
+                *(
+                    embed_batch(provider, batch, cache, semaphore, write_queue, progress)
+                    for batch in batches
+                )
+            )
+    finally:
+        await write_queue.join()
+        await write_queue.put(None)
+        await writer_task
+        await provider.aclose()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate embeddings for quote descriptions")
+    parser.add_argument(
+        "--provider",
+        choices=PROVIDERS,
+        default=EMBEDDING_PROVIDER,
+        help="Embedding backend (stub and hashing are for local / test databases)",
+    )
+    parser.add_argument(
+        "--allow-fake-vectors",
+        action="store_true",
+        help="Let stub / hashing write their vectors (local / test databases only)",
+    )
+    parser.add_argument(
+        "--api-url", default=EMBEDDING_API_URL, help="Endpoint override for openrouter / stub"
+    )
+    parser.add_argument(
+        "--storage",
+        choices=STORAGE_MODES,
+        default=EMBEDDING_STORAGE,
+        help="Stored vector form: full vector(1536), halfvec(1536) or PCA vector(256)",
+    )
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Texts per API request")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="API requests in flight")
+    parser.add_argument(
+        "--requests-per-minute",
+        type=float,
+        default=REQUESTS_PER_MINUTE,
+        help="Request rate limit (0 = unlimited)",
+    )
+    parser.add_argument(
+        "--tokens-per-minute",
+        type=float,
+        default=TOKENS_PER_MINUTE,
+        help="Input token rate limit (0 = unlimited)",
+    )
+    parser.add_argument(
+        "--max-retries", type=int, default=MAX_RETRIES, help="Retries per batch on 429/5xx"
+    )
+    return parser.parse_args()
 
 
 def main():
     """Main function to generate embeddings for all quotes."""
+    args = parse_args()
+    batch_size = max(1, args.batch_size)
+    concurrency = max(1, args.concurrency)
+
     print("=" * 60)
     print("QUOTE EMBEDDINGS GENERATOR")
     print(f"Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("=" * 60)
 
     # Validate configuration
-    if not OPENROUTER_API_KEY:
+    if args.provider != "openrouter" and not args.allow_fake_vectors:
+        print(f"\nERROR: {args.provider} vectors are not semantic embeddings!")
+        print("They would be stored next to real ones and served by semantic search.")
+        print("Pass --allow-fake-vectors to write them to a local / test database")
+        sys.exit(1)
+    if args.provider == "openrouter" and not OPENROUTER_API_KEY:
         print("\nERROR: OPENROUTER_API_KEY not set!")
         print("Please add it to your .env.local file")
         sys.exit(1)
 
-    print(f"\nModel: {EMBEDDING_MODEL} (1536 dimensions)")
-    print(f"Batch size: {BATCH_SIZE}")
+    provider = create_provider(
+        args.provider,
+        model=EMBEDDING_MODEL,
+        api_key=OPENROUTER_API_KEY,
+        concurrency=concurrency,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        max_retries=args.max_retries,
+        url=args.api_url,
+    )
+    print(f"\nProvider: {provider.name}")
+    print(f"Model: {provider.model} ({provider.dimensions} dimensions)")
+    if args.provider != "openrouter":
+        print("WARNING: not semantic embeddings - use a local / test database only")
+    print(f"Batch size: {batch_size} | Concurrency: {concurrency}")
+    print(
+        f"Rate limits: {args.requests_per_minute or 'unlimited'} requests/min, "
+        f"{args.tokens_per_minute or 'unlimited'} tokens/min"
+    )
 
     # Connect to Supabase
     print("\nConnecting to Supabase...")
@@ -288,6 +607,7 @@ def main():
     # Check if quote_embeddings table exists
     try:
         test = supabase.table("quote_embeddings").select("id").limit(1).execute()
+        supabase.table("quote_embedding_vectors").select("content_hash").limit(1).execute()
         print("quote_embeddings table found")
     except Exception as e:
         print(f"\nERROR: quote_embeddings table not found!")
@@ -296,81 +616,65 @@ def main():
         print(f"\nDetails: {e}")
         sys.exit(1)
 
-    # Get total counts for progress tracking
-    existing_count = (
-        supabase.table("quote_embeddings")
-        .select("*", count="exact", head=True)
-        .execute()
-        .count
-        or 0
-    )
-    total_quotes = (
-        supabase.schema("phc")
-        .from_("temp_quotes_bi")
-        .select("*", count="exact", head=True)
-        .execute()
-        .count
-        or 0
-    )
-
-    print(
-        f"\nProgress: {existing_count:,} / {total_quotes:,} ({(existing_count / total_quotes * 100):.1f}%) already embedded"
-    )
-    remaining = total_quotes - existing_count
-    est_mins = (remaining // BATCH_SIZE * 3) // 60
-    print(f"Remaining: ~{remaining:,} quotes (~{est_mins} mins)")
-
-    # Process in batches
-    total_processed = 0
-    total_success = 0
-    batch_num = 0
-    start_count = existing_count
-
-    while True:
-        batch_num += 1
-        print(f"\n--- Batch {batch_num} ---")
-
-        # Get next batch of quotes needing embeddings
+    writer = EmbeddingWriter(supabase, args.storage)
+    try:
+        writer.connect()
+    except Exception as e:
+        print(f"Direct Postgres connection failed ({e}), using PostgREST")
+    print(f"Writes: {writer.method} into {writer.column} ({args.storage})")
+    if args.storage == "pca":
         try:
-            quotes = get_quotes_needing_embeddings(supabase, limit=BATCH_SIZE)
-        except Exception:
-            # RPC might not exist, use fallback
-            print("  Using fallback method to find quotes...")
-            quotes = get_quotes_needing_embeddings_fallback(supabase, limit=BATCH_SIZE)
-
-        if not quotes:
-            print("No more quotes to process")
-            break
-
-        print(f"Processing {len(quotes)} quotes...")
+            projection = writer.load_projection()
+        except Exception as e:
+            print(f"\nERROR: {e}")
+            writer.close()
+            sys.exit(1)
+        print(
+            f"Projection: {projection.name} ({projection.dimensions} dimensions, "
+            f"{projection.explained_variance:.1%} of variance)"
+        )
+        if projection.model != provider.cache_model:
+            print(f"WARNING: projection was fitted on {projection.model} vectors")
 
-        # Generate embeddings
-        success = generate_embeddings_batch(supabase, quotes)
+    cache = EmbeddingCache(CACHE_PATH, provider.cache_model)
+    print(f"Local cache: {CACHE_PATH} ({len(cache):,} vectors)")
 
-        total_processed += len(quotes)
-        total_success += success
-        current_total = start_count + total_success
-        pct = (current_total / total_quotes * 100) if total_quotes > 0 else 0
+    # Separate connection: pages are read while the writer's COPY + merge runs
+    text_queue = TextQueue(supabase, connect_postgres() if writer.pg_conn else None)
+    try:
+        remaining = text_queue.remaining()
+        print(f"\nRemaining: {remaining:,} distinct texts without a vector (ETA shown once batches complete)")
 
-        print(
-            f"Success: {success}/{len(quotes)} | Overall: {current_total:,}/{total_quotes:,} ({pct:.1f}%)"
+        progress = Progress(remaining)
+        asyncio.run(
+            run_pipeline(text_queue, writer, provider, cache, progress, batch_size, concurrency)
         )
-
-        # Rate limiting - be nice to OpenAI API
-        if len(quotes) == BATCH_SIZE:
-            print("Waiting 1s before next batch...")
-            time.sleep(1)
+        # Every quote line whose text now has a vector, in one statement
+        linked = writer.link()
+        print(f"Linked {linked:,} quote lines to their vectors")
+    finally:
+        text_queue.close()
+        writer.close()
+        cache.close()
 
     # Summary
+    elapsed = time.monotonic() - progress.started
+    total_processed = progress.embedded + progress.failed
     print("\n" + "=" * 60)
     print("SUMMARY")
     print("=" * 60)
-    print(f"Total processed: {total_processed}")
-    print(f"Successfully embedded: {total_success}")
-    print(f"Failed: {total_processed - total_success}")
+    print(f"Texts processed: {total_processed}")
+    print(f"Successfully embedded: {progress.embedded}")
+    print(f"Failed: {progress.failed}")
+    print(f"Sources: {progress.api_texts} from the API, {progress.cache_hits} from local cache")
+    print(
+        f"Elapsed: {format_duration(elapsed)} "
+        f"({progress.embedded / elapsed if elapsed > 0 else 0:.1f} texts/s, "
+        f"{progress.api_seconds:.1f}s in API requests)"
+    )
     print(f"Finished: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
-    if total_success == total_processed:
+    if progress.failed == 0:
         print("\n__ETL_DONE__ success=true")
     else:
         print("\n__ETL_DONE__ success=false")
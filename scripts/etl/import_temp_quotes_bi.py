@@ -201,6 +201,28 @@ class TempQuotesImporter:
 
         self.supabase_conn.commit()
 
+    def create_bi_indexes(self):
+        """Recreate the temp_quotes_bi indexes dropped with the table
+
+        idx_temp_quotes_bi_content_hash serves the keyset work queue of
+        generate_quote_embeddings.py; it needs public.quote_text_hash() from
+        the quote_embedding_vectors migration and is skipped without it.
+        """
+        cursor = self.supabase_conn.cursor()
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_temp_quotes_bi_document_id "
+            "ON phc.temp_quotes_bi (document_id)"
+        )
+        cursor.execute("SELECT to_regprocedure('public.quote_text_hash(text)') IS NOT NULL")
+        if cursor.fetchone()[0]:
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_temp_quotes_bi_content_hash "
+                "ON phc.temp_quotes_bi (public.quote_text_hash(description)) "
+                "WHERE description IS NOT NULL"
+            )
+        self.supabase_conn.commit()
+        logger.info("[OK] Created temp_quotes_bi indexes")
+
     def import_quotes_bo(self) -> list[str]:
         """Import filtered BO quotes and return list of bostamps"""
         logger.info(
@@ -552,6 +574,9 @@ class TempQuotesImporter:
             # Import ALL BI lines (unfiltered)
             self.import_bi_unfiltered(bostamps)
 
+            # Indexes used by the embeddings work queue (after the load, faster)
+            self.create_bi_indexes()
+
             # Get filtered count for comparison
             self.count_filtered_comparison(bostamps)
 
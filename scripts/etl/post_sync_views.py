@@ -6,8 +6,9 @@ Recreates custom database views and enforces foreign key constraints after ETL s
 Run automatically after full/incremental syncs to ensure views and referential integrity.
 
 Tasks performed:
-1. Recreate views:
-   - phc.folha_obra_with_orcamento (combines work orders with budgets)
+1. Refresh Folha de Obra / Orçamento matches:
+   - phc.folha_obra_orcamento_match (only documents touched by the sync; --rebuild for all)
+   - phc.folha_obra_with_orcamento view (re-issued only when its definition changes)
    
 2. Add FI foreign key constraints:
    - phc.fi.invoice_id -> phc.ft.invoice_id (CASCADE)
@@ -17,10 +18,14 @@ Tasks performed:
    - idx_fi_invoice_id, idx_fi_cost_center
    - idx_2years_fi_invoice_id, idx_2years_fi_cost_center
 
+4. Refresh monthly sales rollups:
+   - phc.ft_monthly_rollup / phc.fi_monthly_rollup (only months touched since the last run)
+
 Note: Historical views (bo_historical_monthly, ft_historical_monthly, and their normalized variants)
 have been removed as analytics now uses the get_department_rankings_ytd() RPC function.
 """
 
+import argparse
 import os
 import sys
 from pathlib import Path
@@ -34,6 +39,16 @@ if sys.platform == 'win32':
 from dotenv import load_dotenv
 import psycopg2
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl_core"))
+
+from folha_obra_match import (  # noqa: E402
+    ensure_match_table,
+    ensure_view,
+    rebuild_matches,
+    refresh_touched_matches,
+)
+from sales_rollups import ensure_sales_rollups, refresh_sales_rollups  # noqa: E402
+
 # Load environment variables from .env.local
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 env_paths = [
@@ -64,145 +79,38 @@ def get_supabase_connection():
         print(f"[ERROR] Failed to connect to Supabase: {e}")
         sys.exit(1)
 
-def recreate_folha_obra_with_orcamento_view(conn):
+def refresh_folha_obra_with_orcamento(conn, rebuild=False):
     """
-    Recreate phc.folha_obra_with_orcamento view
-    
-    This view combines:
-    - Work orders (folha de obra) from phc.bo
-    - Budgets (orcamentos) from phc.bo  
-    - Customer info from phc.cl
-    - Line items count from phc.bi
-    
-    Matching logic:
-    - Orçamento is matched to Folha de Obra by:
-      1. Same customer_id
-      2. Same total_value
-      3. If multiple matches, select the one with closest document_date
-    """
-    
-    sql = """
-    -- Drop existing view if it exists
-    DROP VIEW IF EXISTS phc.folha_obra_with_orcamento CASCADE;
-    
-    -- Recreate view
-    -- Note: BO table contains BOTH folha de obra AND orcamento records
-    -- We match them by customer_id, total_value, and closest document_date
-    CREATE VIEW phc.folha_obra_with_orcamento AS
-    WITH orcamento_with_lines AS (
-        SELECT 
-            orc.document_id,
-            orc.document_number,
-            orc.document_date,
-            orc.document_type,
-            orc.customer_id,
-            orc.total_value,
-            COUNT(DISTINCT orc_bi.line_id) AS orcamento_lines
-        FROM phc.bo orc
-        LEFT JOIN phc.bi orc_bi ON orc.document_id = orc_bi.document_id
-        WHERE orc.document_type = 'Orçamento'
-        GROUP BY 
-            orc.document_id,
-            orc.document_number,
-            orc.document_date,
-            orc.document_type,
-            orc.customer_id,
-            orc.total_value
-    ),
-    matched_orcamento AS (
-        SELECT DISTINCT ON (fo.document_id)
-            fo.document_id,
-            orc.document_id AS orcamento_id,
-            orc.document_number AS orcamento_number,
-            orc.document_date AS orcamento_date,
-            orc.total_value AS orcamento_value,
-            orc.orcamento_lines,
-            ABS(orc.document_date - fo.document_date) AS date_diff_days
-        FROM phc.bo fo
-        LEFT JOIN orcamento_with_lines orc ON 
-            orc.customer_id = fo.customer_id 
-            AND orc.total_value = fo.total_value
-            AND orc.document_id != fo.document_id
-        WHERE fo.document_type = 'Folha de Obra'
-        ORDER BY fo.document_id, date_diff_days ASC
-    )
-    SELECT 
-        -- Folha de Obra fields
-        fo.document_id AS folha_obra_id,
-        fo.document_number AS folha_obra_number,
-        fo.document_date AS folha_obra_date,
-        fo.last_delivery_date AS folha_obra_delivery_date,
-        
-        -- Customer info
-        fo.customer_id,
-        cl.customer_name,
-        
-        -- Folha de Obra values
-        fo.total_value AS folha_obra_value,
-        fo.observacoes,
-        fo.nome_trabalho,
-        COUNT(DISTINCT bi.line_id) AS folha_obra_lines,
-        
-        -- Orcamento fields (matched by customer_id, total_value, and closest date)
-        mo.orcamento_id,
-        mo.orcamento_number,
-        mo.orcamento_date,
-        mo.orcamento_value,
-        mo.orcamento_lines,
-        
-        -- Calculated fields
-        CASE 
-            WHEN mo.orcamento_date IS NOT NULL AND fo.document_date IS NOT NULL 
-            THEN (fo.document_date - mo.orcamento_date)::integer 
-            ELSE NULL 
-        END AS days_between_quote_and_work,
-        CASE 
-            WHEN mo.orcamento_date IS NOT NULL AND fo.last_delivery_date IS NOT NULL 
-            THEN (fo.last_delivery_date - mo.orcamento_date)::integer 
-            ELSE NULL 
-        END AS days_between_quote_and_delivery,
-        CASE 
-            WHEN mo.orcamento_value IS NOT NULL 
-            THEN (fo.total_value - mo.orcamento_value) 
-            ELSE NULL 
-        END AS value_difference
-    
-    FROM phc.bo fo
-    LEFT JOIN phc.cl cl ON fo.customer_id = cl.customer_id
-    LEFT JOIN phc.bi bi ON fo.document_id = bi.document_id
-    LEFT JOIN matched_orcamento mo ON fo.document_id = mo.document_id
-    WHERE fo.document_number IS NOT NULL
-      AND fo.document_type = 'Folha de Obra'
-    GROUP BY 
-        fo.document_id,
-        fo.document_number,
-        fo.document_date,
-        fo.last_delivery_date,
-        fo.customer_id,
-        cl.customer_name,
-        fo.total_value,
-        fo.observacoes,
-        fo.nome_trabalho,
-        mo.orcamento_id,
-        mo.orcamento_number,
-        mo.orcamento_date,
-        mo.orcamento_value,
-        mo.orcamento_lines;
-    
-    -- Grant permissions
-    GRANT SELECT ON phc.folha_obra_with_orcamento TO authenticated;
-    GRANT SELECT ON phc.folha_obra_with_orcamento TO anon;
+    Refresh phc.folha_obra_orcamento_match and ensure phc.folha_obra_with_orcamento
+
+    The view joins Folhas de Obra with their persisted Orçamento match
+    (same customer_id, same total_value, closest document_date). Only the
+    Folhas de Obra affected by documents the sync wrote or deleted are
+    rematched; everything is rematched when the match table is new or with
+    --rebuild. The view DDL is re-issued only when its definition changed.
     """
-    
     try:
         cursor = conn.cursor()
-        cursor.execute(sql)
+        created = ensure_match_table(cursor)
+        if rebuild or created:
+            matched = rebuild_matches(cursor)
+            print(f"[OK] Match table rebuilt: {matched:,} Folhas de Obra matched")
+        else:
+            touched, affected = refresh_touched_matches(cursor)
+            print(
+                f"[OK] Match table refreshed: {touched:,} touched documents, "
+                f"{affected:,} Folhas de Obra rematched"
+            )
+
+        if ensure_view(cursor):
+            print("[OK] View phc.folha_obra_with_orcamento re-issued (definition changed)")
+        else:
+            print("[OK] View phc.folha_obra_with_orcamento unchanged")
         conn.commit()
         cursor.close()
-        print("[OK] View phc.folha_obra_with_orcamento recreated successfully")
         return True
     except Exception as e:
-        print(f"[ERROR] Failed to recreate view: {e}")
+        print(f"[ERROR] Failed to refresh folha_obra_with_orcamento: {e}")
         conn.rollback()
         return False
 
@@ -269,31 +177,62 @@ def add_fi_foreign_keys_and_indexes(conn):
         conn.rollback()
         return False
 
+def refresh_monthly_rollups(conn):
+    """
+    Refresh phc.ft_monthly_rollup and phc.fi_monthly_rollup
+
+    Triggers on ft/fi/2years_ft/2years_fi queue the months each sync touched;
+    only those months are recomputed (a source is rebuilt when its tables
+    were replaced or truncated).
+    """
+    try:
+        cursor = conn.cursor()
+        ensure_sales_rollups(cursor)
+        refreshed = refresh_sales_rollups(cursor)
+        conn.commit()
+        cursor.close()
+        print(f"   [OK] Monthly rollups: {refreshed} months refreshed")
+        return True
+    except Exception as e:
+        print(f"   [WARN] Monthly rollups: {e}")
+        conn.rollback()
+        return False
+
 def main():
     """Main execution"""
-    print("[VIEW] Recreating post-sync database views and constraints...")
+    parser = argparse.ArgumentParser(description="Post-sync views and constraints")
+    parser.add_argument(
+        "--rebuild", action="store_true", help="Rematch every Folha de Obra"
+    )
+    args = parser.parse_args()
+
+    print("[VIEW] Refreshing post-sync database views and constraints...")
     
     # Connect to Supabase
     conn = get_supabase_connection()
     print("[OK] Connected to Supabase")
     
-    # Recreate views
-    view_success = recreate_folha_obra_with_orcamento_view(conn)
+    # Refresh matches and view
+    view_success = refresh_folha_obra_with_orcamento(conn, rebuild=args.rebuild)
     
     # Add FI foreign keys and indexes
     print("\n🔗 Adding FI foreign keys and indexes...")
     fk_success = add_fi_foreign_keys_and_indexes(conn)
     
+    # Monthly rollups (analytics RPCs read these)
+    print("\n[ROLLUP] Refreshing monthly sales rollups...")
+    rollup_success = refresh_monthly_rollups(conn)
+    
     # Close connection
     conn.close()
     
     # Exit with appropriate code
-    if view_success and fk_success:
+    if view_success and fk_success and rollup_success:
         print("\n[OK] All post-sync tasks completed successfully")
         print("__VIEW_RECREATION_DONE__ success=true")
         sys.exit(0)
     elif view_success:
-        print("\n[WARN] View created but FI constraints had warnings")
+        print("\n[WARN] View created but FI constraints or rollups had warnings")
         print("__VIEW_RECREATION_DONE__ success=true")
         sys.exit(0)
     else:
@@ -0,0 +1,247 @@
+"""
+Reduce Quote Embedding Storage
+==============================
+
+Fits the PCA projection used by EMBEDDING_STORAGE=pca and converts the
+vectors already in quote_embedding_vectors between storage forms (see
+scripts/etl_core/vector_reduction.py).
+
+Usage:
+    python scripts/etl/reduce_quote_embeddings.py status
+    python scripts/etl/reduce_quote_embeddings.py fit --activate
+    python scripts/etl/reduce_quote_embeddings.py fit --source cache --activate
+    python scripts/etl/reduce_quote_embeddings.py convert halfvec
+
+fit reads the full vectors (the rows stored full or as halfvec, or the
+generator's local cache with --source cache), fits a 256-component
+projection in NumPy and stores it. --activate makes it the one searches and
+the generator use; vectors stored with the previous projection are removed
+so the next generate_quote_embeddings.py run stores them again (from its
+local cache, without API calls, when the cache has them).
+
+convert rewrites every stored vector in place with
+convert_quote_embedding_storage(). Run evaluate_embedding_recall.py first to
+see what a form costs in recall.
+
+Requirements:
+    - PG_HOST, PG_DB, PG_USER, PG_PASSWORD (direct Postgres connection)
+    - numpy
+"""
+
+import argparse
+import os
+import random
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl_core"))
+
+import psycopg2
+import psycopg2.extras
+from dotenv import load_dotenv
+
+from embedding_cache import EmbeddingCache
+from vector_reduction import (
+    REDUCED_DIMENSIONS,
+    STORAGE_MODES,
+    fetch_active_projection,
+    fetch_full_vectors,
+    fit_projection,
+    format_vector,
+)
+
+load_dotenv()
+load_dotenv(".env.local")
+
+EMBEDDING_MODEL = "openai/text-embedding-3-small"
+CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    str(Path(__file__).resolve().parent / ".cache" / "quote_embeddings.sqlite3"),
+)
+
+
+def connect():
+    return psycopg2.connect(
+        host=os.getenv("PG_HOST"),
+        dbname=os.getenv("PG_DB"),
+        user=os.getenv("PG_USER"),
+        password=os.getenv("PG_PASSWORD"),
+        port=os.getenv("PG_PORT", "5432"),
+        sslmode=os.getenv("PG_SSLMODE", "require"),
+    )
+
+
+def print_status(conn) -> None:
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT
+          COUNT(*) FILTER (WHERE embedding IS NOT NULL),
+          COUNT(*) FILTER (WHERE embedding IS NULL AND embedding_half IS NOT NULL),
+          COUNT(*) FILTER (WHERE embedding IS NULL AND embedding_half IS NULL),
+          pg_size_pretty(pg_total_relation_size('public.quote_embedding_vectors'))
+        FROM public.quote_embedding_vectors
+        """
+    )
+    full, half, reduced, size = cursor.fetchone()
+    conn.commit()
+    cursor.close()
+    print(f"Vectors: {full:,} full, {half:,} halfvec, {reduced:,} pca")
+    print(f"quote_embedding_vectors: {size} (table + indexes)")
+
+    projection = fetch_active_projection(conn)
+    if projection is None:
+        print("Active projection: none")
+    else:
+        print(
+            f"Active projection: {projection.name} ({projection.model}, "
+            f"{projection.dimensions} dimensions, {projection.explained_variance:.1%} of variance, "
+            f"fitted on {projection.sample_count:,} vectors)"
+        )
+
+
+def load_vectors(args) -> list:
+    if args.source == "cache":
+        cache = EmbeddingCache(CACHE_PATH, args.model)
+        try:
+            vectors = [vector for _, vector in cache.items()]
+        finally:
+            cache.close()
+        print(f"Loaded {len(vectors):,} vectors from {CACHE_PATH} ({args.model})")
+        return vectors
+    conn = connect()
+    try:
+        _, vectors = fetch_full_vectors(conn)
+    finally:
+        conn.close()
+    print(f"Loaded {len(vectors):,} full / halfvec vectors from quote_embedding_vectors")
+    return vectors
+
+
+def fit(args) -> None:
+    vectors = load_vectors(args)
+    if args.sample and len(vectors) > args.sample:
+        vectors = random.Random(42).sample(vectors, args.sample)
+        print(f"Fitting on a sample of {len(vectors):,}")
+
+    name = args.name or f"pca{REDUCED_DIMENSIONS}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    projection = fit_projection(vectors, REDUCED_DIMENSIONS, name, args.model)
+    print(
+        f"Fitted {projection.name}: {projection.dimensions} of {projection.source_dimensions} "
+        f"dimensions keep {projection.explained_variance:.1%} of the variance"
+    )
+
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO public.quote_embedding_projections
+              (name, model, source_dimensions, dimensions, explained_variance, sample_count)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            """,
+            (
+                projection.name,
+                projection.model,
+                projection.source_dimensions,
+                projection.dimensions,
+                projection.explained_variance,
+                projection.sample_count,
+            ),
+        )
+        psycopg2.extras.execute_values(
+            cursor,
+            "INSERT INTO public.quote_embedding_projection_components "
+            "(projection_name, component, weights) VALUES %s",
+            [
+                (projection.name, index, format_vector(weights))
+                for index, weights in enumerate(projection.components)
+            ],
+            template="(%s, %s, %s::vector)",
+        )
+        if args.activate:
+            cursor.execute("UPDATE public.quote_embedding_projections SET is_active = FALSE WHERE is_active")
+            cursor.execute(
+                "UPDATE public.quote_embedding_projections SET is_active = TRUE WHERE name = %s",
+                (projection.name,),
+            )
+            # Projected with the previous projection: not comparable any more
+            cursor.execute(
+                """
+                DELETE FROM public.quote_embedding_vectors
+                WHERE embedding IS NULL AND embedding_half IS NULL
+                """
+            )
+            if cursor.rowcount:
+                print(
+                    f"Removed {cursor.rowcount:,} vectors of the previous projection; "
+                    "run generate_quote_embeddings.py to store them again"
+                )
+        conn.commit()
+        cursor.close()
+        print(f"Saved {projection.name}" + (" (active)" if args.activate else ""))
+        print()
+        print_status(conn)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def convert(args) -> None:
+    conn = connect()
+    try:
+        print_status(conn)
+        cursor = conn.cursor()
+        cursor.execute("SELECT public.convert_quote_embedding_storage(%s)", (args.storage,))
+        converted = cursor.fetchone()[0]
+        for notice in conn.notices:
+            print(notice.strip())
+        conn.commit()
+        cursor.close()
+        print(f"\nConverted {converted:,} vectors to {args.storage}")
+        print_status(conn)
+        print("(Postgres reuses the freed space; VACUUM FULL quote_embedding_vectors returns it)")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Fit the PCA projection and convert stored quote embeddings")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("status", help="Stored vectors per form and the active projection")
+
+    fit_parser = commands.add_parser("fit", help=f"Fit a {REDUCED_DIMENSIONS}-dimension projection")
+    fit_parser.add_argument("--source", choices=("db", "cache"), default="db")
+    fit_parser.add_argument("--model", default=EMBEDDING_MODEL, help="Model the vectors come from")
+    fit_parser.add_argument("--sample", type=int, default=0, help="Fit on at most this many vectors")
+    fit_parser.add_argument("--name", help="Projection name (default pca256-<timestamp>)")
+    fit_parser.add_argument("--activate", action="store_true", help="Use it for search and pca storage")
+
+    convert_parser = commands.add_parser("convert", help="Rewrite stored vectors in another form")
+    convert_parser.add_argument("storage", choices=STORAGE_MODES)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == "fit":
+        fit(args)
+    elif args.command == "convert":
+        convert(args)
+    else:
+        conn = connect()
+        try:
+            print_status(conn)
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
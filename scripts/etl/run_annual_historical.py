@@ -8,8 +8,14 @@ Runs once per year on December 31st to:
 Example: When running in 2025:
 - 2years_bo and 2years_ft tables will contain: 2023, 2024 (full year data)
 - These tables are used by get_department_rankings_ytd() RPC function for YoY comparisons
+
+With --rollover the tables are not rebuilt: the closing year is copied from
+phc.bo / phc.ft / phc.fi inside Postgres, the year that ages out is deleted,
+and only the days whose aggregates disagree with PHC are re-read from PHC
+(see scripts/etl_core/reconcile.py).
 """
 
+import argparse
 import os
 import sys
 from datetime import date, datetime
@@ -29,6 +35,18 @@ if sys.platform == "win32":
 # Add etl_core to path
 sys.path.insert(0, str(Path(__file__).parent.parent / "etl_core"))
 
+from range_extract import (  # noqa: E402
+    DEFAULT_EXTRACT_WORKERS,
+    iter_partitioned_batches,
+    month_ranges,
+    range_predicate,
+)
+from reconcile import (  # noqa: E402
+    HISTORICAL_TABLE_CONFIGS,
+    Reconciler,
+    historical_table_spec,
+)
+
 # Load environment variables
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 env_paths = [PROJECT_ROOT / ".env.local", PROJECT_ROOT / ".env"]
@@ -40,14 +58,18 @@ else:
     load_dotenv()
 
 
+def open_phc_connection():
+    """Open a PHC SQL Server connection (raises on failure)"""
+    conn_str = os.getenv("MSSQL_DIRECT_CONNECTION")
+    if not conn_str:
+        raise ValueError("MSSQL_DIRECT_CONNECTION not found in environment")
+    return pyodbc.connect(conn_str, timeout=30)
+
+
 def get_phc_connection():
     """Connect to PHC SQL Server"""
     try:
-        conn_str = os.getenv("MSSQL_DIRECT_CONNECTION")
-        if not conn_str:
-            raise ValueError("MSSQL_DIRECT_CONNECTION not found in environment")
-        conn = pyodbc.connect(conn_str, timeout=30)
-        return conn
+        return open_phc_connection()
     except Exception as e:
         print(f"[ERROR] PHC connection failed: {e}")
         sys.exit(1)
@@ -70,16 +92,18 @@ def get_supabase_connection():
         sys.exit(1)
 
 
-def sync_2years_bo(phc_conn, supabase_conn):
+def sync_2years_bo(phc_conn, supabase_conn, year1=None, year2=None):
     """
     Sync 2years_bo table with last 2 complete years of BO data
     Example: In 2025, syncs 2023 and 2024
+    year1/year2 override the window (--rollover passes its resolved years)
     """
     print("\n[SYNC] Syncing 2years_bo table...")
 
-    current_year = datetime.now().year
-    year1 = current_year - 2  # 2 years ago
-    year2 = current_year - 1  # Previous year
+    if year1 is None or year2 is None:
+        current_year = datetime.now().year
+        year1 = current_year - 2  # 2 years ago
+        year2 = current_year - 1  # Previous year
 
     print(f"   Years: {year1}, {year2}")
 
@@ -253,16 +277,18 @@ def sync_2years_bo(phc_conn, supabase_conn):
         return False
 
 
-def sync_2years_ft(phc_conn, supabase_conn):
+def sync_2years_ft(phc_conn, supabase_conn, year1=None, year2=None):
     """
     Sync 2years_ft table with last 2 complete years of FT data
     Example: In 2025, syncs 2023 and 2024 (all 12 months)
+    year1/year2 override the window (--rollover passes its resolved years)
     """
     print("\n[SYNC] Syncing 2years_ft table...")
 
-    current_year = datetime.now().year
-    year1 = current_year - 2  # 2 years ago
-    year2 = current_year - 1  # Previous year
+    if year1 is None or year2 is None:
+        current_year = datetime.now().year
+        year1 = current_year - 2  # 2 years ago
+        year2 = current_year - 1  # Previous year
 
     print(f"   Years: {year1}, {year2}")
 
@@ -385,21 +411,22 @@ def sync_2years_ft(phc_conn, supabase_conn):
         return False
 
 
-def sync_2years_fi(phc_conn, supabase_conn):
+def sync_2years_fi(phc_conn, supabase_conn, year1=None, year2=None):
     """
     Sync 2years_fi table with last 2 complete years of FI data (Invoice Line Items)
     Example: In 2025, syncs 2023 and 2024 (ALL months 1-12)
+    year1/year2 override the window (--rollover passes its resolved years)
     """
     print("\n[SYNC] Syncing 2years_fi table...")
 
-    current_year = datetime.now().year
-    year1 = current_year - 2  # 2 years ago
-    year2 = current_year - 1  # Previous year
+    if year1 is None or year2 is None:
+        current_year = datetime.now().year
+        year1 = current_year - 2  # 2 years ago
+        year2 = current_year - 1  # Previous year
 
     print(f"   Years: {year1}, {year2} (Full years - months 1-12)")
 
     try:
-        phc_cursor = phc_conn.cursor()
         supabase_cursor = supabase_conn.cursor()
 
         # DROP and recreate table completely
@@ -419,10 +446,11 @@ def sync_2years_fi(phc_conn, supabase_conn):
         """)
         supabase_conn.commit()
 
-        # FULL YEARS: All months from both years
+        # FULL YEARS: All months from both years, one query per month so the
+        # ranges can be fetched on parallel PHC connections (ETL_EXTRACT_WORKERS)
         # Filter out cancelled documents via FT join
         # Only lines with values (non-zero)
-        query = f"""
+        query_template = """
         SELECT
             fi.fistamp,        -- Column 0 → line_item_id (TEXT)
             fi.ftstamp,        -- Column 1 → invoice_id (TEXT)
@@ -434,26 +462,29 @@ def sync_2years_fi(phc_conn, supabase_conn):
             fi.bistamp         -- Column 7 → bistamp (TEXT) - links to BI quote lines
         FROM fi
         JOIN ft ON ft.ftstamp = fi.ftstamp
-        WHERE YEAR(ft.fdata) IN ({year1}, {year2})
+        WHERE {date_range}
           AND COALESCE(CONVERT(VARCHAR(10), ft.anulado), '') IN ('', '0', 'N')
           AND fi.etiliquido IS NOT NULL
           AND fi.etiliquido <> 0
-        ORDER BY ft.fdata DESC
         """
-
-        phc_cursor.execute(query)
+        queries = [
+            query_template.format(date_range=range_predicate("ft.fdata", start, end))
+            for start, end in month_ranges(date(year1, 1, 1), date(year2, 12, 31))
+        ]
 
         batch_size = 1000
         total_rows = 0
         batch_num = 0
 
-        print(f"   [FETCH] Fetching data from PHC...", flush=True)
-
-        while True:
-            rows = phc_cursor.fetchmany(batch_size)
-            if not rows:
-                break
+        print(
+            f"   [FETCH] Fetching data from PHC ({len(queries)} monthly ranges, "
+            f"{min(DEFAULT_EXTRACT_WORKERS, len(queries))} connections)...",
+            flush=True,
+        )
 
+        for rows in iter_partitioned_batches(
+            open_phc_connection, queries, batch_size, DEFAULT_EXTRACT_WORKERS
+        ):
             batch_num += 1
 
             # Clean and prepare data (8 columns from PHC)
@@ -510,12 +541,180 @@ def sync_2years_fi(phc_conn, supabase_conn):
         return False
 
 
+# ----------------------------------------------------------------------
+# Rollover (--rollover): set-based copy from the live tables + drift repair
+# ----------------------------------------------------------------------
+# Where each snapshot's rows live in Supabase; columns keep their names
+# unless an expression is given
+ROLLOVER_SOURCES = {
+    "2years_bo": {
+        "from": 'phc."bo" AS src',
+        "date": "src.document_date",
+        "filter": None,
+        "expressions": {},
+    },
+    "2years_ft": {
+        "from": 'phc."ft" AS src',
+        "date": "src.invoice_date",
+        # Live FT keeps cancelled invoices. A PHC bit False is stored as
+        # 'False' there but as NULL by the historical load
+        "filter": "COALESCE(src.anulado, '') IN ('', '0', 'N', 'False')",
+        "expressions": {"anulado": "NULLIF(src.anulado, 'False')"},
+    },
+    "2years_fi": {
+        "from": 'phc."fi" AS src JOIN phc."ft" AS parent ON parent.invoice_id = src.invoice_id',
+        "date": "parent.invoice_date",
+        "filter": "COALESCE(parent.anulado, '') IN ('', '0', 'N', 'False')",
+        "expressions": {"invoice_date": "parent.invoice_date"},
+    },
+}
+
+
+def resolve_through_year(supabase_conn, requested=None):
+    """
+    Last year kept by --rollover: the requested year, or by default the
+    oldest year phc.bo and phc.ft still hold (the live tables keep only the
+    current year once its first sync has run, so on December 31st that is
+    the closing year).
+
+    Returns None, after printing why, when that year is not over yet or the
+    live tables don't hold it - the copy would find nothing and the run
+    would quietly become a full PHC re-read.
+
+    A December 31st run misses invoices and quotes entered later that day:
+    the reconcile step only sees what PHC holds at run time, so re-run the
+    rollover on January 1st (before the first sync) to pick them up.
+    """
+    supabase_cursor = supabase_conn.cursor()
+    ranges = {}
+    # 2years_fi takes its dates from phc.ft, so BO and FT cover all three
+    for live_table, table_name in (("phc.bo", "2years_bo"), ("phc.ft", "2years_ft")):
+        source = ROLLOVER_SOURCES[table_name]
+        supabase_cursor.execute(
+            f"SELECT MIN({source['date']}), MAX({source['date']}) FROM {source['from']}"
+        )
+        ranges[live_table] = supabase_cursor.fetchone()
+    supabase_conn.commit()
+
+    empty = [name for name, (oldest, _) in ranges.items() if oldest is None]
+    if empty:
+        print(f"[ERROR] {', '.join(empty)} is empty - run without --rollover")
+        return None
+    year = requested or max(oldest.year for oldest, _ in ranges.values())
+
+    today = date.today()
+    if year > today.year or (year == today.year and (today.month, today.day) != (12, 31)):
+        if requested:
+            print(f"[ERROR] {year} is not over yet - pass a complete year with --through-year")
+        else:
+            print(
+                f"[ERROR] The live tables only hold {year}, which is not over yet: "
+                f"{year - 1} was purged from them on January 1st. "
+                f"Run without --rollover to re-read the window from PHC"
+            )
+        return None
+    for name, (oldest, newest) in ranges.items():
+        if oldest > date(year, 12, 31) or newest < date(year, 1, 1):
+            print(
+                f"[ERROR] {name} holds {oldest} to {newest}, nothing from {year} - "
+                f"run without --rollover to re-read the window from PHC"
+            )
+            return None
+    return year
+
+
+def rollover_2years_table(supabase_conn, reconciler, table_name, year1, year2):
+    """
+    Move a 2years_* table to the years year1..year2 without rebuilding it:
+    delete the rows outside the window, copy what phc.bo/ft/fi hold for the
+    window with INSERT ... SELECT, then reconcile the window against PHC and
+    rewrite only the drifted rows.
+
+    Returns None when the table doesn't exist yet (caller runs the full sync).
+    """
+    print(f"\n[ROLLOVER] Rolling over {table_name} to {year1}-{year2}...")
+
+    config = HISTORICAL_TABLE_CONFIGS[table_name]
+    source = ROLLOVER_SOURCES[table_name]
+    start, end = date(year1, 1, 1), date(year2 + 1, 1, 1)
+
+    try:
+        supabase_cursor = supabase_conn.cursor()
+        supabase_cursor.execute("SELECT to_regclass(%s)", (f'phc."{table_name}"',))
+        if supabase_cursor.fetchone()[0] is None:
+            print(f"   [WARN] phc.{table_name} does not exist - running the full sync")
+            return None
+
+        date_column = config["date_column"]
+        supabase_cursor.execute(
+            f'DELETE FROM phc."{table_name}" '
+            f'WHERE "{date_column}" IS NULL OR "{date_column}" < %s OR "{date_column}" >= %s',
+            (start, end),
+        )
+        aged_out = supabase_cursor.rowcount
+
+        columns = list(config["columns"])
+        column_list = ", ".join(f'"{col}"' for col in columns)
+        select_list = ", ".join(
+            source["expressions"].get(col, f'src."{col}"') for col in columns
+        )
+        conditions = [f"{source['date']} >= %s", f"{source['date']} < %s"]
+        if source["filter"]:
+            conditions.append(f"({source['filter']})")
+        supabase_cursor.execute(
+            f'INSERT INTO phc."{table_name}" ({column_list}) '
+            f"SELECT {select_list} FROM {source['from']} "
+            f"WHERE {' AND '.join(conditions)} "
+            f'ON CONFLICT ("{config["primary_key"]}") DO NOTHING',
+            (start, end),
+        )
+        copied = supabase_cursor.rowcount
+        supabase_conn.commit()
+        print(f"   [OK] {aged_out:,} rows aged out, {copied:,} rows copied from live tables")
+
+        # Days whose count/sums match PHC are left alone; the rest are re-read
+        report = reconciler.reconcile_table(
+            historical_table_spec(table_name, start, end), repair=True
+        )
+        repair = report.get("repair", {"written": 0, "deleted": 0})
+        print(
+            f"   [RECON] {report['missing']:,} missing, {report['extra']:,} extra, "
+            f"{report['different']:,} different -> {repair['written']:,} rows re-read "
+            f"from PHC, {repair['deleted']:,} deleted"
+        )
+        supabase_cursor.execute(f'SELECT COUNT(*) FROM phc."{table_name}"')
+        print(f"[OK] {table_name}: {supabase_cursor.fetchone()[0]:,} rows")
+        return True
+
+    except Exception as e:
+        print(f"[ERROR] Failed to roll over {table_name}: {e}")
+        supabase_conn.rollback()
+        return False
+
+
 # REMOVED: update_bo_historical_monthly and update_ft_historical_monthly
 # These tables are no longer used. Analytics now uses get_department_rankings_ytd() RPC function
 # which directly queries phc.2years_bo and phc.2years_ft
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Refresh the 2years_* snapshot tables")
+    parser.add_argument(
+        "--rollover",
+        action="store_true",
+        help="Copy the closing year from the live tables and re-read only drifted days from PHC",
+    )
+    parser.add_argument(
+        "--through-year",
+        type=int,
+        help="Last year kept by --rollover (default: the year phc.bo/ft hold, i.e. run it "
+        "on December 31st). Must be complete and still in the live tables",
+    )
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
     print("=" * 80)
     print("ANNUAL HISTORICAL SYNC - END OF YEAR DATA SNAPSHOT")
     print("=" * 80)
@@ -533,9 +732,35 @@ def main():
     results = {}
 
     # Sync 2-year snapshot tables
-    results["2years_bo"] = sync_2years_bo(phc_conn, supabase_conn)
-    results["2years_ft"] = sync_2years_ft(phc_conn, supabase_conn)
-    results["2years_fi"] = sync_2years_fi(phc_conn, supabase_conn)
+    full_syncs = {
+        "2years_bo": sync_2years_bo,
+        "2years_ft": sync_2years_ft,
+        "2years_fi": sync_2years_fi,
+    }
+    if args.rollover:
+        through_year = resolve_through_year(supabase_conn, args.through_year)
+        if through_year is None:
+            phc_conn.close()
+            supabase_conn.close()
+            print("__ETL_DONE__ success=false")
+            sys.exit(1)
+        print(f"   Mode: rollover to {through_year - 1}-{through_year}")
+        reconciler = Reconciler(phc_conn, supabase_conn)
+        for table_name, sync_table in full_syncs.items():
+            result = rollover_2years_table(
+                supabase_conn,
+                reconciler,
+                table_name,
+                through_year - 1,
+                through_year,
+            )
+            if result is None:
+                # Same window as the rollover, not the full sync's default
+                result = sync_table(phc_conn, supabase_conn, through_year - 1, through_year)
+            results[table_name] = result
+    else:
+        for table_name, sync_table in full_syncs.items():
+            results[table_name] = sync_table(phc_conn, supabase_conn)
 
     # Close connections
     phc_conn.close()
@@ -41,6 +41,12 @@ def main():
                     print(
                         f"   {table_name.upper()}: Skipped ({result.get('description', 'No description')})"
                     )
+                elif "unchanged" in result:
+                    print(
+                        f"   {table_name.upper()}: {result.get('rows', 0)} rows synced "
+                        f"({result['inserted']} inserted, {result['updated']} updated, "
+                        f"{result['unchanged']} unchanged)"
+                    )
                 else:
                     print(
                         f"   {table_name.upper()}: {result.get('rows', 0)} rows synced"
@@ -0,0 +1,127 @@
+"""
+Runner script for PHC <-> Supabase reconciliation
+
+Steps:
+- Imports Reconciler from scripts/etl_core/reconcile.py
+- Compares each table bucket by bucket (year -> month -> day -> key prefix)
+  and lists the rows that are missing, extra or different in Supabase
+- With --repair, rewrites exactly those rows from PHC
+- Writes the JSON drift report to stdout (and to --report if given)
+- Emits completion marker understood by API routes:
+    __ETL_DONE__ success=true | false
+Exit code: 0 on success (drift found or not), 1 on errors.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import traceback
+from datetime import date, datetime
+from pathlib import Path
+
+try:
+    THIS_FILE = Path(__file__).resolve()
+    PROJECT_ROOT = THIS_FILE.parents[2]  # scripts/etl/run_reconcile.py -> project root
+
+    CORE_DIR = PROJECT_ROOT / "scripts" / "etl_core"
+    if str(CORE_DIR) not in sys.path:
+        sys.path.insert(0, str(CORE_DIR))
+
+    from reconcile import (  # type: ignore
+        DEFAULT_LEAF_ROWS,
+        RECONCILE_TABLES,
+        Reconciler,
+        table_spec,
+    )
+    from selective_sync import SelectiveSync  # type: ignore
+
+except Exception:
+    traceback.print_exc()
+    print("__ETL_DONE__ success=false")
+    sys.exit(1)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare PHC with Supabase and report drift")
+    parser.add_argument(
+        "--tables",
+        default=",".join(RECONCILE_TABLES),
+        help=f"Comma-separated tables (default: {','.join(RECONCILE_TABLES)})",
+    )
+    parser.add_argument(
+        "--from",
+        dest="start",
+        type=date.fromisoformat,
+        help="First document date to compare (default: the table's sync window)",
+    )
+    parser.add_argument(
+        "--to",
+        dest="end",
+        type=date.fromisoformat,
+        help="Stop before this document date (default: tomorrow / end of the snapshot)",
+    )
+    parser.add_argument(
+        "--repair", action="store_true", help="Rewrite drifted rows from PHC"
+    )
+    parser.add_argument(
+        "--leaf-rows",
+        type=int,
+        default=DEFAULT_LEAF_ROWS,
+        help=f"Compare rows directly below this bucket size (default {DEFAULT_LEAF_ROWS})",
+    )
+    parser.add_argument("--report", type=Path, help="Also write the JSON report here")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    tables = [name.strip() for name in args.tables.split(",") if name.strip()]
+    unknown = [name for name in tables if name not in RECONCILE_TABLES]
+    if unknown:
+        print(f"[ERROR] Unknown tables: {', '.join(unknown)}")
+        print("__ETL_DONE__ success=false")
+        return 1
+
+    syncer = SelectiveSync()
+    try:
+        if not syncer.connect_phc() or not syncer.connect_supabase():
+            print("__ETL_DONE__ success=false")
+            return 1
+
+        reconciler = Reconciler(syncer.phc_conn, syncer.supabase_conn, args.leaf_rows)
+        results = {}
+        success = True
+        for table_name in tables:
+            try:
+                spec = table_spec(syncer, table_name, args.start, args.end)
+                results[table_name] = reconciler.reconcile_table(spec, repair=args.repair)
+            except Exception as exc:
+                syncer.supabase_conn.rollback()
+                traceback.print_exc()
+                results[table_name] = {"table": table_name, "error": str(exc)}
+                success = False
+
+        payload = {
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "repair": args.repair,
+            "tables": results,
+        }
+        report = json.dumps(payload, ensure_ascii=False, indent=2)
+        print(report)
+        if args.report:
+            args.report.write_text(report, encoding="utf-8")
+
+        print(f"__ETL_DONE__ success={'true' if success else 'false'}")
+        return 0 if success else 1
+
+    except Exception:
+        traceback.print_exc()
+        print("__ETL_DONE__ success=false")
+        return 1
+    finally:
+        syncer.close_connections()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
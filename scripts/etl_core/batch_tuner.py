@@ -0,0 +1,297 @@
+"""
+Adaptive batch sizing
+Tunes the PHC fetch size (rows per fetchmany) and the Supabase write size
+(rows per statement/COPY) of a table while it syncs. Each size is
+hill-climbed on measured rows/s: after a few batches it keeps moving in the
+direction that raised throughput, turns around when throughput drops and
+holds when it stays flat.
+
+Sizes stay inside ETL_BATCH_MIN_ROWS..ETL_BATCH_MAX_ROWS and below a memory
+ceiling: ETL_BATCH_MEMORY_MB divided by the measured row width times the
+batches a pipeline can hold at once. When the process RSS passes
+ETL_RSS_CEILING_MB both sizes are halved instead of tuned.
+
+The learned sizes and throughput are kept in phc.sync_batch_tuning, so the
+next run of a table starts from where the last one ended.
+"""
+
+import logging
+import os
+import sys
+import time
+from typing import Callable, Iterator
+
+try:
+    import psutil
+except ImportError:  # optional - /proc or resource is used instead
+    psutil = None
+
+from pipeline import DEFAULT_PIPELINE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_ROWS = 1000
+MIN_BATCH_ROWS = int(os.getenv("ETL_BATCH_MIN_ROWS", "200"))
+MAX_BATCH_ROWS = int(os.getenv("ETL_BATCH_MAX_ROWS", "20000"))
+# Memory allowed for one table's rows in flight (all pipeline queues together)
+BATCH_MEMORY_MB = float(os.getenv("ETL_BATCH_MEMORY_MB", "256"))
+# Process-wide RSS above which batch sizes are halved
+RSS_CEILING_MB = float(os.getenv("ETL_RSS_CEILING_MB", "1024"))
+# Set to 0 to keep the stored (or default) sizes fixed
+ADAPTIVE_BATCHES = os.getenv("ETL_ADAPTIVE_BATCHES", "1").lower() in ("1", "true", "yes")
+
+_WINDOW_BATCHES = 3  # batches measured per tuning step
+_STEP = 1.5
+_MIN_CHANGE = 0.05  # throughput change below this counts as flat
+_SAMPLE_ROWS = 50
+
+
+def process_rss_mb() -> float | None:
+    """Resident set size of this process in MB (peak RSS without psutil or /proc)."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, KiB elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def estimate_row_bytes(rows: list) -> int:
+    """Average in-memory size of a fetched row, from a sample of the batch."""
+    sample = rows[:: max(1, len(rows) // _SAMPLE_ROWS)][:_SAMPLE_ROWS]
+    if not sample:
+        return 0
+    total = sum(sys.getsizeof(row) + sum(sys.getsizeof(val) for val in row) for row in sample)
+    return total // len(sample)
+
+
+class _HillClimb:
+    """One batch size, tuned on the rows/s of windows of a few batches."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.rate: float | None = None
+        self._direction = 1
+        self._rows = 0
+        self._seconds = 0.0
+        self._batches = 0
+
+    def observe(self, rows: int, seconds: float) -> float | None:
+        """Record one batch; returns the window's rows/s when a window completes."""
+        self._rows += rows
+        self._seconds += seconds
+        self._batches += 1
+        if self._batches < _WINDOW_BATCHES:
+            return None
+        rate = self._rows / max(self._seconds, 1e-6)
+        self._rows, self._seconds, self._batches = 0, 0.0, 0
+        return rate
+
+    def step(self, rate: float, ceiling: int) -> None:
+        previous, self.rate = self.rate, rate
+        if previous is not None:
+            change = (rate - previous) / previous if previous else 0.0
+            if abs(change) < _MIN_CHANGE:
+                self.size = min(self.size, ceiling)
+                return
+            if change < 0:
+                self._direction = -self._direction
+        factor = _STEP if self._direction > 0 else 1 / _STEP
+        self.size = _clamp(int(self.size * factor), ceiling)
+
+    def shrink(self, ceiling: int) -> None:
+        self._direction = -1
+        self.size = _clamp(self.size // 2, ceiling)
+
+
+def _clamp(size: int, ceiling: int) -> int:
+    return max(MIN_BATCH_ROWS, min(size, ceiling))
+
+
+class BatchTuner:
+    """Fetch/load batch sizes for one table run.
+
+    fetch_batches() runs on the pipeline's extract thread and load_in_chunks()
+    on the load thread; each only touches its own size, so no locking.
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        fetch_rows: int = DEFAULT_BATCH_ROWS,
+        load_rows: int = DEFAULT_BATCH_ROWS,
+        depth: int = DEFAULT_PIPELINE_DEPTH,
+        adaptive: bool = ADAPTIVE_BATCHES,
+    ):
+        self.table_name = table_name
+        self.adaptive = adaptive
+        self.row_bytes = 0
+        self.peak_rss_mb: float | None = None
+        self._fetch = _HillClimb(_clamp(fetch_rows, MAX_BATCH_ROWS))
+        self._load = _HillClimb(_clamp(load_rows, MAX_BATCH_ROWS))
+        # Two queues of `depth` plus one batch inside each stage
+        self._batches_in_flight = 2 * max(1, depth) + 3
+
+    @property
+    def fetch_rows(self) -> int:
+        return self._fetch.size
+
+    @property
+    def load_rows(self) -> int:
+        return self._load.size
+
+    @property
+    def fetch_rate(self) -> float | None:
+        return self._fetch.rate
+
+    @property
+    def load_rate(self) -> float | None:
+        return self._load.rate
+
+    @property
+    def measured(self) -> bool:
+        """True once at least one tuning window completed (worth persisting)."""
+        return self._fetch.rate is not None or self._load.rate is not None
+
+    def _ceiling(self) -> int:
+        if not self.row_bytes:
+            return MAX_BATCH_ROWS
+        budget = BATCH_MEMORY_MB * 2**20 / (self.row_bytes * self._batches_in_flight)
+        return _clamp(int(budget), MAX_BATCH_ROWS)
+
+    def _observe(self, climb: _HillClimb, rows: int, seconds: float, stage: str) -> None:
+        rate = climb.observe(rows, seconds)
+        if rate is None or not self.adaptive:
+            if rate is not None:
+                climb.rate = rate
+            return
+        rss = process_rss_mb()
+        if rss is not None:
+            self.peak_rss_mb = max(self.peak_rss_mb or 0.0, rss)
+        if rss is not None and rss > RSS_CEILING_MB:
+            climb.shrink(self._ceiling())
+            logger.warning(
+                "[TUNE] %s: RSS %.0f MB over %.0f MB - %s batch down to %s rows",
+                self.table_name,
+                rss,
+                RSS_CEILING_MB,
+                stage,
+                climb.size,
+            )
+            return
+        climb.step(rate, self._ceiling())
+
+    def fetch_batches(self, cursor) -> Iterator[list]:
+        """fetchmany() batches at the current fetch size, timing each call."""
+        while True:
+            size = self._fetch.size
+            started = time.perf_counter()
+            rows = cursor.fetchmany(size)
+            elapsed = time.perf_counter() - started
+            if not rows:
+                return
+            if not self.row_bytes:
+                self.row_bytes = estimate_row_bytes(rows)
+            self._observe(self._fetch, len(rows), elapsed, "fetch")
+            yield rows
+
+    def load_in_chunks(self, rows: list, write: Callable[[list], object]) -> list:
+        """Call write() on chunks of the current load size; returns its results."""
+        results = []
+        position = 0
+        while position < len(rows):
+            chunk = rows[position : position + self._load.size]
+            started = time.perf_counter()
+            results.append(write(chunk))
+            self._observe(self._load, len(chunk), time.perf_counter() - started, "load")
+            position += len(chunk)
+        return results
+
+    def describe(self) -> str:
+        def rate(value: float | None) -> str:
+            return f"{value:,.0f} rows/s" if value is not None else "n/a"
+
+        return (
+            f"fetch {self.fetch_rows} rows ({rate(self.fetch_rate)}), "
+            f"load {self.load_rows} rows ({rate(self.load_rate)})"
+        )
+
+
+# ----------------------------------------------------------------------
+# Persistence (phc.sync_batch_tuning, next to phc.sync_watermarks)
+# ----------------------------------------------------------------------
+def ensure_tuning_table(cursor) -> None:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS phc.sync_batch_tuning (
+            table_name TEXT PRIMARY KEY,
+            fetch_rows INTEGER NOT NULL,
+            load_rows INTEGER NOT NULL,
+            fetch_rows_per_sec NUMERIC,
+            load_rows_per_sec NUMERIC,
+            row_bytes INTEGER,
+            peak_rss_mb NUMERIC,
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+        """
+    )
+
+
+def load_batch_tuner(
+    cursor,
+    table_name: str,
+    fetch_rows: int = DEFAULT_BATCH_ROWS,
+    load_rows: int = DEFAULT_BATCH_ROWS,
+) -> BatchTuner:
+    """BatchTuner starting from the stored sizes (or the given defaults)."""
+    cursor.execute(
+        "SELECT fetch_rows, load_rows, row_bytes FROM phc.sync_batch_tuning "
+        "WHERE table_name = %s",
+        (table_name,),
+    )
+    row = cursor.fetchone()
+    if row:
+        fetch_rows, load_rows = row[0], row[1]
+    tuner = BatchTuner(table_name, fetch_rows, load_rows)
+    if row and row[2]:
+        tuner.row_bytes = row[2]
+    return tuner
+
+
+def store_batch_tuner(cursor, tuner: BatchTuner) -> None:
+    cursor.execute(
+        """
+        INSERT INTO phc.sync_batch_tuning (
+            table_name, fetch_rows, load_rows, fetch_rows_per_sec,
+            load_rows_per_sec, row_bytes, peak_rss_mb, updated_at
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
+        ON CONFLICT (table_name) DO UPDATE
+        SET fetch_rows = EXCLUDED.fetch_rows,
+            load_rows = EXCLUDED.load_rows,
+            fetch_rows_per_sec = COALESCE(EXCLUDED.fetch_rows_per_sec,
+                                          phc.sync_batch_tuning.fetch_rows_per_sec),
+            load_rows_per_sec = COALESCE(EXCLUDED.load_rows_per_sec,
+                                         phc.sync_batch_tuning.load_rows_per_sec),
+            row_bytes = EXCLUDED.row_bytes,
+            peak_rss_mb = EXCLUDED.peak_rss_mb,
+            updated_at = NOW()
+        """,
+        (
+            tuner.table_name,
+            tuner.fetch_rows,
+            tuner.load_rows,
+            tuner.fetch_rate,
+            tuner.load_rate,
+            tuner.row_bytes or None,
+            tuner.peak_rss_mb,
+        ),
+    )
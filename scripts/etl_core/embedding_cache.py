@@ -0,0 +1,96 @@
+"""
+Content-addressed embedding cache
+Quote lines repeat verbatim across quotes (standard paragraphs, finishes),
+so embeddings are keyed by a hash of the normalised text instead of by
+(document_number, description):
+
+- normalize_text() collapses runs of whitespace and trims the ends; the
+  same rule is applied in SQL by the quote_embedding_vectors migration.
+- content_hash() is the SHA-256 of the normalised text (hex).
+- EmbeddingCache is a local SQLite file (model, content_hash) -> float32
+  vector, consulted before asking Supabase or the embeddings API.
+"""
+
+import hashlib
+import re
+import sqlite3
+from array import array
+from pathlib import Path
+
+# ASCII whitespace only, so Postgres' regexp_replace gives the same result
+_WHITESPACE = re.compile(r"[ \t\n\r\f\v]+")
+
+# SQLite's default limit on bound parameters is 999
+_LOOKUP_CHUNK = 500
+
+
+def normalize_text(text: str | None) -> str:
+    return _WHITESPACE.sub(" ", text or "").strip(" ")
+
+
+def content_hash(text: str | None) -> str:
+    """SHA-256 (hex) of the normalised text."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk (model, content_hash) -> vector store; one connection, one thread."""
+
+    def __init__(self, path: str | Path, model: str):
+        self.path = Path(path)
+        self.model = model
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, content_hash)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        row = self._conn.execute(
+            "SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model,)
+        ).fetchone()
+        return row[0]
+
+    def get_many(self, hashes) -> dict[str, list[float]]:
+        hashes = list(hashes)
+        found = {}
+        for start in range(0, len(hashes), _LOOKUP_CHUNK):
+            chunk = hashes[start : start + _LOOKUP_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT content_hash, vector FROM embeddings "
+                f"WHERE model = ? AND content_hash IN ({placeholders})",
+                [self.model, *chunk],
+            )
+            for key, blob in rows:
+                found[key] = array("f", blob).tolist()
+        return found
+
+    def items(self):
+        """Every (content_hash, vector) cached for this model."""
+        rows = self._conn.execute(
+            "SELECT content_hash, vector FROM embeddings WHERE model = ? ORDER BY content_hash",
+            (self.model,),
+        )
+        for key, blob in rows:
+            yield key, array("f", blob).tolist()
+
+    def put_many(self, vectors: dict) -> None:
+        if not vectors:
+            return
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, content_hash, vector) VALUES (?, ?, ?)",
+            [(self.model, key, array("f", vector).tobytes()) for key, vector in vectors.items()],
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,230 @@
+"""
+Embedding providers
+The quote embeddings generator talks to one of these instead of calling
+OpenRouter directly, so the pipeline (batching, caching, DB writes) can be
+run and measured without network access:
+
+- openrouter: the embeddings API (OpenAI-compatible), with the shared
+  token buckets, Retry-After handling and backoff of rate_limit.py.
+- stub: the same HTTP client pointed at embedding_stub_server.py, which
+  answers like the API with configurable latency, rate limits and errors.
+- hashing: a deterministic hashing vectoriser computed locally (words and
+  character trigrams hashed into the vector, L2-normalised). Related texts
+  get related vectors, so search and recall can be exercised offline.
+
+Vectors from stub and hashing are not semantic embeddings: each provider
+reports its own model name, which keys the local cache, and they are meant
+for a local / test database only.
+"""
+
+import asyncio
+import hashlib
+import math
+import re
+
+import httpx
+
+from rate_limit import RETRYABLE_STATUS, TokenBucket, backoff_delay, retry_after_seconds
+
+EMBEDDING_DIMENSIONS = 1536
+OPENROUTER_URL = "https://openrouter.ai/api/v1/embeddings"
+STUB_URL = "http://127.0.0.1:8765/v1/embeddings"
+
+PROVIDERS = ("openrouter", "stub", "hashing")
+
+_WORD = re.compile(r"\w+")
+_TRIGRAM_WEIGHT = 0.5
+
+
+def estimate_tokens(texts: list[str]) -> int:
+    """Rough token count (4 chars per token) for the tokens-per-minute bucket."""
+    return sum(len(text) // 4 + 1 for text in texts)
+
+
+def hashing_vector(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> list[float]:
+    """Deterministic unit vector of the text's words and character trigrams."""
+    weights: dict[int, float] = {}
+    for word in _WORD.findall(text.lower()):
+        features = [(word, 1.0)]
+        padded = f"#{word}#"
+        features.extend((padded[i : i + 3], _TRIGRAM_WEIGHT) for i in range(len(padded) - 2))
+        for feature, weight in features:
+            digest = int.from_bytes(
+                hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big"
+            )
+            index = digest % dimensions
+            sign = 1.0 if digest >> 63 else -1.0
+            weights[index] = weights.get(index, 0.0) + sign * weight
+    norm = math.sqrt(sum(value * value for value in weights.values()))
+    vector = [0.0] * dimensions
+    if norm == 0:
+        vector[0] = 1.0  # empty text: any fixed unit vector
+        return vector
+    for index, value in weights.items():
+        vector[index] = value / norm
+    return vector
+
+
+class EmbeddingProvider:
+    """Turns a batch of texts into vectors; one instance per run."""
+
+    name = ""
+    model = ""
+    # Model name the local cache keys vectors by
+    cache_model = ""
+    dimensions = EMBEDDING_DIMENSIONS
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        raise NotImplementedError
+
+    async def aclose(self) -> None:
+        pass
+
+
+class RateLimits:
+    """Request and token buckets shared by every in-flight batch."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, burst: int):
+        self.requests = TokenBucket(requests_per_minute / 60, capacity=burst)
+        self.tokens = TokenBucket(tokens_per_minute / 60, capacity=tokens_per_minute)
+
+    async def acquire(self, token_count: int) -> None:
+        await self.requests.acquire()
+        await self.tokens.acquire(token_count)
+
+    def pause(self, seconds: float) -> None:
+        self.requests.pause(seconds)
+        self.tokens.pause(seconds)
+
+
+class RemoteEmbeddingProvider(EmbeddingProvider):
+    """
+    OpenAI-compatible /embeddings endpoint over a shared httpx.AsyncClient.
+
+    Retries 429 / 5xx / network errors up to max_retries times, waiting for
+    Retry-After when given (and pausing all workers) or backing off
+    exponentially otherwise.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        model: str,
+        api_key: str | None,
+        limits: RateLimits,
+        concurrency: int,
+        max_retries: int,
+        headers: dict | None = None,
+        cache_model: str | None = None,
+    ):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.cache_model = cache_model or model
+        self.limits = limits
+        self.max_retries = max_retries
+        self._headers = {"Content-Type": "application/json", **(headers or {})}
+        if api_key:
+            self._headers["Authorization"] = f"Bearer {api_key}"
+        self._client = httpx.AsyncClient(
+            timeout=120.0, limits=httpx.Limits(max_connections=concurrency)
+        )
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        token_count = estimate_tokens(texts)
+        for attempt in range(self.max_retries + 1):
+            await self.limits.acquire(token_count)
+            try:
+                response = await self._client.post(
+                    self.url, headers=self._headers, json={"model": self.model, "input": texts}
+                )
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"  Network error ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status_code == 200:
+                data = response.json()
+                # Sort by index to ensure correct order
+                embeddings_data = sorted(data["data"], key=lambda x: x["index"])
+                return [item["embedding"] for item in embeddings_data]
+
+            if response.status_code not in RETRYABLE_STATUS or attempt == self.max_retries:
+                raise Exception(
+                    f"{self.name} API error: {response.status_code} - {response.text}"
+                )
+
+            retry_after = retry_after_seconds(response.headers)
+            if retry_after is not None:
+                delay = retry_after
+                if response.status_code == 429:
+                    self.limits.pause(delay)
+            else:
+                delay = backoff_delay(attempt)
+            print(f"  {self.name} {response.status_code}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+        raise Exception(f"{self.name} API error: retries exhausted")
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Local hashing vectoriser: no network, same output for the same text."""
+
+    name = "hashing"
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+        self.model = self.cache_model = f"hashing-{dimensions}"
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        return [hashing_vector(text, self.dimensions) for text in texts]
+
+
+def create_provider(
+    name: str,
+    *,
+    model: str,
+    api_key: str | None,
+    concurrency: int,
+    requests_per_minute: float,
+    tokens_per_minute: float,
+    max_retries: int,
+    url: str | None = None,
+) -> EmbeddingProvider:
+    """Build a provider by name (see PROVIDERS)."""
+    if name == "hashing":
+        return HashingEmbeddingProvider()
+    limits = RateLimits(requests_per_minute, tokens_per_minute, burst=concurrency)
+    if name == "openrouter":
+        if not api_key:
+            raise ValueError("Missing OPENROUTER_API_KEY environment variable")
+        return RemoteEmbeddingProvider(
+            "OpenRouter",
+            url or OPENROUTER_URL,
+            model,
+            api_key,
+            limits,
+            concurrency,
+            max_retries,
+            headers={"HTTP-Referer": "https://imacx.pt", "X-Title": "IMACX Quote Embeddings"},
+        )
+    if name == "stub":
+        return RemoteEmbeddingProvider(
+            "Stub",
+            url or STUB_URL,
+            model,
+            None,
+            limits,
+            concurrency,
+            max_retries,
+            # Keep stub vectors apart from real ones in the local cache
+            cache_model=f"stub:{model}",
+        )
+    raise ValueError(f"Unknown embedding provider {name!r} (expected one of {', '.join(PROVIDERS)})")
@@ -0,0 +1,302 @@
+"""
+Folha de Obra <-> Orçamento matches
+phc.folha_obra_with_orcamento used to run a DISTINCT ON self-join of every
+Folha de Obra against every Orçamento (same customer_id and total_value,
+closest document_date) on each query. The match is now computed by
+quote_matching.py (invoice links first, then an indexed value/date match),
+persisted with its confidence in phc.folha_obra_orcamento_match, and the
+view only joins it.
+
+The sync loaders record the document_ids they write or delete (BO, and BI
+through its document_id; FI records its invoice_id) in
+phc.sync_touched_documents. After the sync, refresh_touched_matches()
+recomputes only the Folhas de Obra those documents can affect: the touched
+ones, the ones sharing customer and value with a touched Orçamento, the ones
+whose lines a touched invoice references, and the ones matched to a touched
+or removed Orçamento.
+
+The view DDL is re-issued only when its text changes (hash kept in
+phc.sync_view_definitions) or the view is missing.
+"""
+
+import hashlib
+import logging
+
+import psycopg2.extras
+
+from quote_matching import FOLHA_DE_OBRA, MATCH_COLUMNS, ORCAMENTO, compute_matches
+
+logger = logging.getLogger(__name__)
+
+MATCH_TABLE = 'phc."folha_obra_orcamento_match"'
+TOUCHED_TABLE = 'phc."sync_touched_documents"'
+VIEW_NAME = "phc.folha_obra_with_orcamento"
+
+VIEW_SQL = f"""
+CREATE VIEW {VIEW_NAME} WITH (security_invoker = true) AS
+SELECT
+    -- Folha de Obra fields
+    fo.document_id AS folha_obra_id,
+    fo.document_number AS folha_obra_number,
+    fo.document_date AS folha_obra_date,
+    fo.last_delivery_date AS folha_obra_delivery_date,
+
+    -- Customer info
+    fo.customer_id,
+    cl.customer_name,
+
+    -- Folha de Obra values
+    fo.total_value AS folha_obra_value,
+    fo.observacoes,
+    fo.nome_trabalho,
+    COUNT(DISTINCT bi.line_id) AS folha_obra_lines,
+
+    -- Orcamento fields (persisted match, see scripts/etl_core/folha_obra_match.py)
+    mo.orcamento_id,
+    mo.orcamento_number,
+    mo.orcamento_date,
+    mo.orcamento_value,
+    mo.orcamento_lines,
+
+    -- Calculated fields
+    CASE
+        WHEN mo.orcamento_date IS NOT NULL AND fo.document_date IS NOT NULL
+        THEN (fo.document_date - mo.orcamento_date)::integer
+        ELSE NULL
+    END AS days_between_quote_and_work,
+    CASE
+        WHEN mo.orcamento_date IS NOT NULL AND fo.last_delivery_date IS NOT NULL
+        THEN (fo.last_delivery_date - mo.orcamento_date)::integer
+        ELSE NULL
+    END AS days_between_quote_and_delivery,
+    CASE
+        WHEN mo.orcamento_value IS NOT NULL
+        THEN (fo.total_value - mo.orcamento_value)
+        ELSE NULL
+    END AS value_difference,
+
+    -- How the Orçamento was matched ('link' = shared invoice, 'value') and how surely
+    mo.match_method AS orcamento_match_method,
+    mo.confidence AS orcamento_match_confidence
+
+FROM phc.bo fo
+LEFT JOIN phc.cl cl ON fo.customer_id = cl.customer_id
+LEFT JOIN phc.bi bi ON fo.document_id = bi.document_id
+LEFT JOIN {MATCH_TABLE} mo ON fo.document_id = mo.folha_obra_id
+WHERE fo.document_number IS NOT NULL
+  AND fo.document_type = '{FOLHA_DE_OBRA}'
+GROUP BY
+    fo.document_id,
+    fo.document_number,
+    fo.document_date,
+    fo.last_delivery_date,
+    fo.customer_id,
+    cl.customer_name,
+    fo.total_value,
+    fo.observacoes,
+    fo.nome_trabalho,
+    mo.orcamento_id,
+    mo.orcamento_number,
+    mo.orcamento_date,
+    mo.orcamento_value,
+    mo.orcamento_lines,
+    mo.match_method,
+    mo.confidence
+"""
+
+# Folhas de Obra a set of touched document_ids can affect
+_AFFECTED_SQL = f"""
+SELECT fo.document_id
+FROM phc.bo fo
+WHERE fo.document_type = '{FOLHA_DE_OBRA}'
+  AND (
+      fo.document_id = ANY(%(ids)s)
+      OR (fo.customer_id, fo.total_value) IN (
+          SELECT orc.customer_id, orc.total_value
+          FROM phc.bo orc
+          WHERE orc.document_id = ANY(%(ids)s) AND orc.document_type = '{ORCAMENTO}'
+      )
+  )
+UNION
+-- Invoice links (fi.bistamp -> bi.line_id) of touched invoices
+SELECT bi.document_id
+FROM phc.fi fi
+JOIN phc.bi bi ON bi.line_id = fi.bistamp
+WHERE fi.invoice_id = ANY(%(ids)s)
+UNION
+SELECT m.folha_obra_id
+FROM {MATCH_TABLE} m
+WHERE m.folha_obra_id = ANY(%(ids)s)
+   OR m.orcamento_id = ANY(%(ids)s)
+   -- Gone without a recorded delete (retention purge)
+   OR NOT EXISTS (SELECT 1 FROM phc.bo fo WHERE fo.document_id = m.folha_obra_id)
+   OR NOT EXISTS (SELECT 1 FROM phc.bo orc WHERE orc.document_id = m.orcamento_id)
+"""
+
+
+# ----------------------------------------------------------------------
+# Touched documents (written by the sync loaders)
+# ----------------------------------------------------------------------
+def ensure_touched_table(cursor) -> None:
+    """Create the touched-documents queue; safe from tables synced in parallel.
+
+    CREATE TABLE IF NOT EXISTS races on the table's pg_type entry when two
+    sessions run it at once, so creation is serialised with an advisory
+    lock held until the caller commits.
+    """
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (TOUCHED_TABLE,))
+    if cursor.fetchone()[0]:
+        return
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (TOUCHED_TABLE,))
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {TOUCHED_TABLE} (
+            document_id TEXT PRIMARY KEY,
+            touched_at TIMESTAMP DEFAULT NOW()
+        )
+        """
+    )
+
+
+def record_touched_documents(cursor, document_ids) -> None:
+    """Queue document_ids for the next match refresh (caller commits)."""
+    document_ids = sorted({doc for doc in document_ids if doc is not None})
+    if not document_ids:
+        return
+    psycopg2.extras.execute_values(
+        cursor,
+        f"INSERT INTO {TOUCHED_TABLE} (document_id) VALUES %s "
+        "ON CONFLICT (document_id) DO UPDATE SET touched_at = NOW()",
+        [(doc,) for doc in document_ids],
+        page_size=1000,
+    )
+
+
+def record_table_touched(cursor, table_name: str, column: str) -> None:
+    """Queue every document of a table (after a full reload)."""
+    cursor.execute(
+        f'INSERT INTO {TOUCHED_TABLE} (document_id) SELECT DISTINCT "{column}" '
+        f'FROM phc."{table_name}" WHERE "{column}" IS NOT NULL '
+        "ON CONFLICT (document_id) DO UPDATE SET touched_at = NOW()"
+    )
+
+
+# ----------------------------------------------------------------------
+# Match table
+# ----------------------------------------------------------------------
+def ensure_match_table(cursor) -> bool:
+    """Create the match table (and lookup index); True when it was just created."""
+    cursor.execute("SELECT to_regclass(%s) IS NULL", (MATCH_TABLE,))
+    created = cursor.fetchone()[0]
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {MATCH_TABLE} (
+            folha_obra_id TEXT PRIMARY KEY,
+            orcamento_id TEXT NOT NULL,
+            orcamento_number TEXT,
+            orcamento_date DATE,
+            orcamento_value NUMERIC,
+            orcamento_lines BIGINT,
+            date_diff_days INTEGER,
+            match_method TEXT,
+            confidence NUMERIC(4, 3),
+            matched_at TIMESTAMP DEFAULT NOW()
+        )
+        """
+    )
+    cursor.execute(f"ALTER TABLE {MATCH_TABLE} ADD COLUMN IF NOT EXISTS match_method TEXT")
+    cursor.execute(
+        f"ALTER TABLE {MATCH_TABLE} ADD COLUMN IF NOT EXISTS confidence NUMERIC(4, 3)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_folha_obra_orcamento_match_orcamento "
+        f"ON {MATCH_TABLE} (orcamento_id)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_bo_customer_total ON phc.bo (customer_id, total_value)"
+    )
+    cursor.execute(f"GRANT SELECT ON {MATCH_TABLE} TO authenticated")
+    cursor.execute(f"GRANT SELECT ON {MATCH_TABLE} TO anon")
+    ensure_touched_table(cursor)
+    return created
+
+
+def _write_matches(cursor, matches: list[tuple]) -> None:
+    if not matches:
+        return
+    column_list = ", ".join(MATCH_COLUMNS)
+    psycopg2.extras.execute_values(
+        cursor, f"INSERT INTO {MATCH_TABLE} ({column_list}) VALUES %s", matches, page_size=1000
+    )
+
+
+def rebuild_matches(cursor) -> int:
+    """Recompute every match; returns the number of matched Folhas de Obra."""
+    matches = compute_matches(cursor)
+    cursor.execute(f"TRUNCATE {MATCH_TABLE}")
+    _write_matches(cursor, matches)
+    cursor.execute(f"TRUNCATE {TOUCHED_TABLE}")
+    return len(matches)
+
+
+def refresh_touched_matches(cursor) -> tuple[int, int]:
+    """Recompute the matches the queued documents can affect and clear the queue.
+
+    Returns (touched documents, Folhas de Obra recomputed). Runs in the
+    caller's transaction, so a failure leaves the queue for the next run.
+    """
+    cursor.execute(f"DELETE FROM {TOUCHED_TABLE} RETURNING document_id")
+    touched = [row[0] for row in cursor.fetchall()]
+    cursor.execute(_AFFECTED_SQL, {"ids": touched})
+    affected = [row[0] for row in cursor.fetchall()]
+    if affected:
+        cursor.execute(
+            f"DELETE FROM {MATCH_TABLE} WHERE folha_obra_id = ANY(%(ids)s)", {"ids": affected}
+        )
+        _write_matches(cursor, compute_matches(cursor, affected))
+    return len(touched), len(affected)
+
+
+# ----------------------------------------------------------------------
+# View
+# ----------------------------------------------------------------------
+def view_definition_hash() -> str:
+    return hashlib.sha256(VIEW_SQL.encode("utf-8")).hexdigest()
+
+
+def ensure_view(cursor) -> bool:
+    """(Re)create the view when its DDL changed or it is missing; True if re-issued."""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS phc.sync_view_definitions (
+            view_name TEXT PRIMARY KEY,
+            definition_hash TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+        """
+    )
+    definition_hash = view_definition_hash()
+    cursor.execute(
+        "SELECT definition_hash, to_regclass(%s) IS NOT NULL "
+        "FROM phc.sync_view_definitions WHERE view_name = %s",
+        (VIEW_NAME, VIEW_NAME),
+    )
+    row = cursor.fetchone()
+    if row and row[0] == definition_hash and row[1]:
+        return False
+
+    cursor.execute(f"DROP VIEW IF EXISTS {VIEW_NAME} CASCADE")
+    cursor.execute(VIEW_SQL)
+    cursor.execute(f"GRANT SELECT ON {VIEW_NAME} TO authenticated")
+    cursor.execute(f"GRANT SELECT ON {VIEW_NAME} TO anon")
+    cursor.execute(
+        """
+        INSERT INTO phc.sync_view_definitions (view_name, definition_hash, updated_at)
+        VALUES (%s, %s, NOW())
+        ON CONFLICT (view_name) DO UPDATE
+        SET definition_hash = EXCLUDED.definition_hash, updated_at = NOW()
+        """,
+        (VIEW_NAME, definition_hash),
+    )
+    logger.info("[VIEW] %s re-issued (definition %s)", VIEW_NAME, definition_hash[:12])
+    return True
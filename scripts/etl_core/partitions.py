@@ -0,0 +1,170 @@
+"""
+Range-partitioned PHC tables
+With ETL_PARTITION_INTERVAL=year (or month), BO/FT/FO are created as tables
+partitioned by their document date, and BI/FI by their parent's date (each
+line keeps a copy of it). Retention then detaches and drops whole
+partitions instead of deleting rows, and partitions for the coming periods
+are created ahead of time. Rows outside every range land in the default
+partition.
+
+Postgres requires the partition column in the primary key, so partitioned
+tables use (key, date) as primary key and upserts conflict on both.
+"""
+
+import logging
+import os
+import re
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+# "" (off), "year" or "month"
+PARTITION_INTERVAL = os.getenv("ETL_PARTITION_INTERVAL", "").strip().lower()
+if PARTITION_INTERVAL not in ("year", "month"):
+    PARTITION_INTERVAL = ""
+# Periods created beyond the current one
+PARTITIONS_AHEAD = int(os.getenv("ETL_PARTITIONS_AHEAD", "2"))
+
+DEFAULT_PARTITION_SUFFIX = "_pdefault"
+
+_BOUNDS = re.compile(r"FROM \('([0-9-]+)'\) TO \('([0-9-]+)'\)")
+
+
+def period_start(day: date, interval: str) -> date:
+    return date(day.year, 1, 1) if interval == "year" else date(day.year, day.month, 1)
+
+
+def next_period(start: date, interval: str) -> date:
+    if interval == "year" or start.month == 12:
+        return date(start.year + 1, 1, 1)
+    return date(start.year, start.month + 1, 1)
+
+
+def partition_name(table_name: str, start: date, interval: str) -> str:
+    suffix = f"{start.year}" if interval == "year" else f"{start.year}_{start.month:02d}"
+    return f"{table_name}_p{suffix}"
+
+
+def _qualified(table_name: str) -> str:
+    return f'phc."{table_name}"'
+
+
+def is_partitioned(cursor, table_name: str) -> bool:
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))",
+        (_qualified(table_name),),
+    )
+    return cursor.fetchone()[0]
+
+
+def list_partitions(cursor, table_name: str) -> list[tuple[str, date | None, date | None]]:
+    """(name, from, to) per partition; the default partition has no bounds."""
+    cursor.execute(
+        """
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+        """,
+        (_qualified(table_name),),
+    )
+    partitions = []
+    for name, bound in cursor.fetchall():
+        match = _BOUNDS.search(bound or "")
+        if match:
+            partitions.append(
+                (name, date.fromisoformat(match.group(1)), date.fromisoformat(match.group(2)))
+            )
+        else:
+            partitions.append((name, None, None))
+    return partitions
+
+
+def create_partitioned_table(
+    cursor,
+    table_name: str,
+    column_defs: list[str],
+    partition_column: str,
+    primary_key: str | None = None,
+) -> None:
+    """CREATE TABLE ... PARTITION BY RANGE plus its default partition."""
+    pk_clause = (
+        f', PRIMARY KEY ("{primary_key}", "{partition_column}")' if primary_key else ""
+    )
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {_qualified(table_name)} "
+        f"({', '.join(column_defs)}{pk_clause}) "
+        f'PARTITION BY RANGE ("{partition_column}")'
+    )
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS {_qualified(table_name + DEFAULT_PARTITION_SUFFIX)} '
+        f"PARTITION OF {_qualified(table_name)} DEFAULT"
+    )
+
+
+def ensure_partitions(
+    cursor,
+    table_name: str,
+    partition_column: str,
+    first_day: date,
+    last_day: date,
+    interval: str = PARTITION_INTERVAL,
+    ahead: int = PARTITIONS_AHEAD,
+) -> list[str]:
+    """Create the missing partitions from first_day to `ahead` periods after last_day.
+
+    Rows of a new range already sitting in the default partition are moved
+    into the new partition before it is attached (Postgres refuses to create
+    a partition whose rows live in the default one). Periods overlapping an
+    existing partition are skipped, so changing the interval is harmless.
+    """
+    existing = list_partitions(cursor, table_name)
+    ranges = [(start, end) for _, start, end in existing if start is not None]
+    default = next((name for name, start, _ in existing if start is None), None)
+
+    end = period_start(last_day, interval)
+    for _ in range(ahead):
+        end = next_period(end, interval)
+    end = next_period(end, interval)
+
+    created = []
+    start = period_start(first_day, interval)
+    while start < end:
+        following = next_period(start, interval)
+        if not any(low < following and start < high for low, high in ranges):
+            name = partition_name(table_name, start, interval)
+            partition = _qualified(name)
+            cursor.execute(
+                f"CREATE TABLE {partition} (LIKE {_qualified(table_name)} INCLUDING DEFAULTS)"
+            )
+            if default:
+                cursor.execute(
+                    f"WITH moved AS (DELETE FROM {_qualified(default)} "
+                    f'WHERE "{partition_column}" >= %s AND "{partition_column}" < %s '
+                    f"RETURNING *) INSERT INTO {partition} SELECT * FROM moved",
+                    (start, following),
+                )
+            cursor.execute(
+                f"ALTER TABLE {_qualified(table_name)} ATTACH PARTITION {partition} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{following.isoformat()}')"
+            )
+            created.append(name)
+        start = following
+
+    if created:
+        logger.info("[PART] %s: created %s", table_name, ", ".join(created))
+    return created
+
+
+def drop_partitions_before(cursor, table_name: str, cutoff: date) -> list[str]:
+    """Detach and drop partitions that end on or before cutoff."""
+    dropped = []
+    for name, _, end in list_partitions(cursor, table_name):
+        if end is None or end > cutoff:
+            continue
+        cursor.execute(f"ALTER TABLE {_qualified(table_name)} DETACH PARTITION {_qualified(name)}")
+        cursor.execute(f"DROP TABLE {_qualified(name)}")
+        dropped.append(name)
+    if dropped:
+        logger.info("[PART] %s: dropped %s (before %s)", table_name, ", ".join(dropped), cutoff)
+    return dropped
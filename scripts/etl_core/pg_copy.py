@@ -0,0 +1,155 @@
+"""
+Binary COPY (PGCOPY) encoder
+Encodes rows for COPY ... FROM STDIN WITH (FORMAT binary) using the column
+types declared in TABLE_CONFIGS (INTEGER, NUMERIC, DATE, BOOLEAN, TEXT) and
+pgvector's VECTOR / HALFVEC (float4 / float2 components, packed through NumPy
+when installed).
+
+Binary COPY requires every value to match the target column type exactly,
+so the staging table must be created from the same declared types.
+"""
+
+import struct
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import numpy as np
+except ImportError:  # optional - vectors are packed with struct instead
+    np = None
+
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+PGCOPY_TRAILER = struct.pack("!h", -1)
+
+_NULL = struct.pack("!i", -1)
+_TRUE = struct.pack("!ib", 1, 1)
+_FALSE = struct.pack("!ib", 1, 0)
+_INT4 = struct.Struct("!ii")  # length prefix (4) + int4 value
+_LENGTH = struct.Struct("!i")
+_NUMERIC_HEADER = struct.Struct("!ihhHH")  # length + ndigits, weight, sign, dscale
+_FIELD_COUNT = struct.Struct("!h")
+_VECTOR_HEADER = struct.Struct("!ihh")  # length + dim, unused
+
+_PG_EPOCH_ORDINAL = date(2000, 1, 1).toordinal()
+
+_NUMERIC_POS = 0x0000
+_NUMERIC_NEG = 0x4000
+_NUMERIC_NAN = 0xC000
+
+
+def _encode_integer(value) -> bytes:
+    return _INT4.pack(4, int(value))
+
+
+def _encode_boolean(value) -> bytes:
+    return _TRUE if value else _FALSE
+
+
+def _encode_date(value) -> bytes:
+    if isinstance(value, datetime):
+        value = value.date()
+    return _INT4.pack(4, value.toordinal() - _PG_EPOCH_ORDINAL)
+
+
+def _encode_text(value) -> bytes:
+    data = str(value).encode("utf-8")
+    return _LENGTH.pack(len(data)) + data
+
+
+def _encode_vector(value) -> bytes:
+    """Encode a float sequence (or 1-d array) as pgvector's binary vector_recv format."""
+    if np is not None:
+        data = np.asarray(value, dtype=">f4").tobytes()
+        dim = len(data) // 4
+    else:
+        dim = len(value)
+        data = struct.pack(f"!{dim}f", *value)
+    return _VECTOR_HEADER.pack(4 + len(data), dim, 0) + data
+
+
+def _encode_halfvec(value) -> bytes:
+    """Encode a float sequence as pgvector's binary halfvec_recv format (IEEE half precision)."""
+    if np is not None:
+        data = np.asarray(value, dtype=">f2").tobytes()
+        dim = len(data) // 2
+    else:
+        dim = len(value)
+        data = struct.pack(f"!{dim}e", *value)
+    return _VECTOR_HEADER.pack(4 + len(data), dim, 0) + data
+
+
+def _encode_numeric(value) -> bytes:
+    """Encode an exact decimal as Postgres' base-10000 NUMERIC wire format."""
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    if value.is_nan():
+        return _NUMERIC_HEADER.pack(8, 0, 0, _NUMERIC_NAN, 0)
+    if value.is_infinite():
+        raise ValueError(f"Cannot encode {value} as NUMERIC")
+
+    sign, digits, exponent = value.as_tuple()
+    digits = list(digits)
+    if exponent > 0:
+        digits.extend([0] * exponent)
+        exponent = 0
+    dscale = -exponent
+
+    # Pad so the decimal point falls on a 4-digit group boundary
+    int_len = len(digits) - dscale
+    pad_front = (-int_len) % 4
+    pad_back = (-dscale) % 4
+    digits = [0] * pad_front + digits + [0] * pad_back
+    int_len += pad_front
+
+    groups = [
+        digits[i] * 1000 + digits[i + 1] * 100 + digits[i + 2] * 10 + digits[i + 3]
+        for i in range(0, len(digits), 4)
+    ]
+    weight = int_len // 4 - 1
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    while groups and groups[-1] == 0:
+        groups.pop()
+    if not groups:
+        weight = 0
+
+    sign_flag = _NUMERIC_NEG if sign and groups else _NUMERIC_POS
+    return _NUMERIC_HEADER.pack(
+        8 + 2 * len(groups), len(groups), weight, sign_flag, dscale
+    ) + struct.pack(f"!{len(groups)}H", *groups)
+
+
+def encoder_for_type(col_type: str):
+    """Resolve a TABLE_CONFIGS column type (e.g. "INTEGER NOT NULL") to an encoder."""
+    col_type = col_type.upper()
+    if col_type.startswith("HALFVEC"):
+        return _encode_halfvec
+    if col_type.startswith("VECTOR"):
+        return _encode_vector
+    if "INTEGER" in col_type:
+        return _encode_integer
+    if "NUMERIC" in col_type:
+        return _encode_numeric
+    if "BOOLEAN" in col_type:
+        return _encode_boolean
+    if "DATE" in col_type:
+        return _encode_date
+    return _encode_text
+
+
+def encoders_for_columns(column_types) -> tuple:
+    return tuple(encoder_for_type(col_type) for col_type in column_types)
+
+
+def encode_rows(encoders: tuple, rows) -> bytes:
+    """Encode rows as a complete PGCOPY stream (header, tuples, trailer)."""
+    field_count = _FIELD_COUNT.pack(len(encoders))
+    parts = [PGCOPY_HEADER]
+    append = parts.append
+    for row in rows:
+        append(field_count)
+        for encode, value in zip(encoders, row):
+            append(_NULL if value is None else encode(value))
+    append(PGCOPY_TRAILER)
+    return b"".join(parts)
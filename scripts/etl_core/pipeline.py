@@ -0,0 +1,138 @@
+"""
+Extract / transform / load pipeline
+Runs the three stages of a table sync concurrently: PHC fetches on one
+thread, row cleaning on another and Supabase writes on the calling thread,
+connected by bounded queues. While Postgres commits a batch the next ones
+are already being fetched and cleaned; when the loader falls behind the
+queues fill up and the upstream stages block, so memory stays flat.
+"""
+
+import os
+import queue
+import threading
+import time
+from typing import Callable, Iterable
+
+# Batches buffered between two stages before the upstream stage blocks
+DEFAULT_PIPELINE_DEPTH = int(os.getenv("ETL_PIPELINE_DEPTH", "4"))
+
+_END = object()
+_POLL_SECONDS = 0.5
+
+
+def put_unless_stopped(out: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put that gives up (returns False) once stop is set."""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get_unless_stopped(source: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return source.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            continue
+    return _END
+
+
+def run_pipeline(
+    batches: Iterable,
+    transform: Callable[[list], list],
+    load: Callable[[list], None],
+    depth: int = DEFAULT_PIPELINE_DEPTH,
+) -> dict:
+    """Run transform and load over batches with the stages overlapped.
+
+    transform runs on a single worker thread (batches keep their order) and
+    load on the calling thread, so each can keep per-table state without
+    locking. The first error in any stage stops the pipeline and is
+    re-raised here. Returns wall time and per-stage busy seconds.
+    """
+    extracted: queue.Queue = queue.Queue(maxsize=max(1, depth))
+    transformed: queue.Queue = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+    busy = {"extract": 0.0, "transform": 0.0, "load": 0.0}
+    batch_count = 0
+
+    def extract_stage() -> None:
+        iterator = iter(batches)
+        try:
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    batch = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    busy["extract"] += time.perf_counter() - started
+                if not put_unless_stopped(extracted, batch, stop):
+                    return
+        except Exception as exc:
+            put_unless_stopped(extracted, exc, stop)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            put_unless_stopped(extracted, _END, stop)
+
+    def transform_stage() -> None:
+        while True:
+            batch = _get_unless_stopped(extracted, stop)
+            if batch is _END or isinstance(batch, Exception):
+                put_unless_stopped(transformed, batch, stop)
+                return
+            started = time.perf_counter()
+            try:
+                result = transform(batch)
+            except Exception as exc:
+                put_unless_stopped(transformed, exc, stop)
+                return
+            finally:
+                busy["transform"] += time.perf_counter() - started
+            if not put_unless_stopped(transformed, result, stop):
+                return
+
+    threads = [
+        threading.Thread(target=extract_stage, name="etl-extract", daemon=True),
+        threading.Thread(target=transform_stage, name="etl-transform", daemon=True),
+    ]
+    wall_started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            batch = transformed.get()
+            if batch is _END:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+            started = time.perf_counter()
+            load(batch)
+            busy["load"] += time.perf_counter() - started
+            batch_count += 1
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    return {
+        "wall_seconds": time.perf_counter() - wall_started,
+        "batches": batch_count,
+        **busy,
+    }
+
+
+def describe_utilisation(stats: dict) -> str:
+    """One-line stage utilisation summary, e.g. for the end-of-table log."""
+    wall = stats["wall_seconds"] or 1e-9
+    stages = " | ".join(
+        f"{stage} {min(stats[stage] / wall, 1.0):.0%}"
+        for stage in ("extract", "transform", "load")
+    )
+    return f"{stages} ({stats['batches']} batches, {stats['wall_seconds']:.1f}s)"
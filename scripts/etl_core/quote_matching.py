@@ -0,0 +1,271 @@
+"""
+Orçamento -> Folha de Obra matching
+Picks the Orçamento (quote) behind each Folha de Obra (work order) in
+Python instead of a self-join:
+
+1. Invoice links: when an FT invoice has FI lines pointing (fi.bistamp ->
+   bi.line_id) at lines of both the Folha de Obra and an Orçamento, that
+   Orçamento wins (the one sharing the most invoice lines, then the closest).
+2. Value match: Orçamentos are indexed in a dict keyed by
+   (customer_id, total_value), each entry sorted by document_date, and the
+   nearest date is found with bisect. Ties go to the lowest document_id,
+   undated Orçamentos are only used when no dated one exists.
+
+Every match carries a confidence in [0, 1]: invoice links score 1.0 (0.95
+when the values differ), value matches start at 0.9 and drop with the date
+gap and with the number of equally close candidates.
+"""
+
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+FOLHA_DE_OBRA = "Folha de Obra"
+ORCAMENTO = "Orçamento"
+
+METHOD_LINK = "link"
+METHOD_VALUE = "value"
+
+LINK_CONFIDENCE = 1.0
+LINK_VALUE_MISMATCH_CONFIDENCE = 0.95
+VALUE_CONFIDENCE = 0.9
+# Days after which a value match has lost half its confidence
+CONFIDENCE_HALF_LIFE_DAYS = 60
+
+# (document_id, document_number, document_date, customer_id, total_value, lines)
+_ORC_ID, _ORC_NUMBER, _ORC_DATE, _ORC_CUSTOMER, _ORC_VALUE, _ORC_LINES = range(6)
+
+
+# ----------------------------------------------------------------------
+# In-memory index
+# ----------------------------------------------------------------------
+class OrcamentoIndex:
+    """(customer_id, total_value) -> Orçamentos sorted by (date, document_id)."""
+
+    def __init__(self, orcamentos):
+        self.by_id = {}
+        buckets: dict[tuple, list[tuple]] = {}
+        for orc in orcamentos:
+            self.by_id[orc[_ORC_ID]] = orc
+            if orc[_ORC_CUSTOMER] is None or orc[_ORC_VALUE] is None:
+                continue  # NULLs never compare equal in the SQL match either
+            buckets.setdefault((orc[_ORC_CUSTOMER], orc[_ORC_VALUE]), []).append(orc)
+
+        self._dated: dict[tuple, tuple[list[int], list[tuple]]] = {}
+        self._undated: dict[tuple, list[tuple]] = {}
+        for key, entries in buckets.items():
+            dated = sorted(
+                (orc for orc in entries if orc[_ORC_DATE] is not None),
+                key=lambda orc: (orc[_ORC_DATE], orc[_ORC_ID]),
+            )
+            if dated:
+                self._dated[key] = ([orc[_ORC_DATE].toordinal() for orc in dated], dated)
+            undated = sorted(
+                (orc for orc in entries if orc[_ORC_DATE] is None), key=lambda orc: orc[_ORC_ID]
+            )
+            if undated:
+                self._undated[key] = undated
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def nearest(
+        self, customer_id, total_value, document_date: date | None
+    ) -> tuple[tuple | None, int]:
+        """Closest Orçamento for a key and date, and how many tie with it."""
+        if customer_id is None or total_value is None:
+            return None, 0
+        key = (customer_id, total_value)
+        dated = self._dated.get(key)
+        if dated:
+            ordinals, entries = dated
+            if document_date is None:
+                # No distance to compare: lowest id, like NULL-ordered SQL
+                best = min(entries, key=lambda orc: orc[_ORC_ID])
+                return best, len(entries)
+            target = document_date.toordinal()
+            position = bisect_left(ordinals, target)
+            distances = []
+            if position < len(ordinals):
+                distances.append(ordinals[position] - target)
+            if position > 0:
+                distances.append(target - ordinals[position - 1])
+            gap = min(distances)
+            tied = []
+            for ordinal in {target - gap, target + gap}:
+                low = bisect_left(ordinals, ordinal)
+                tied.extend(entries[low : bisect_right(ordinals, ordinal)])
+            return min(tied, key=lambda orc: orc[_ORC_ID]), len(tied)
+        undated = self._undated.get(key)
+        if undated:
+            return undated[0], len(undated)
+        return None, 0
+
+
+def value_confidence(days_apart: int | None, tied: int) -> float:
+    """0.9 halved every CONFIDENCE_HALF_LIFE_DAYS (once without dates), split among ties."""
+    decay = 0.5 if days_apart is None else 0.5 ** (days_apart / CONFIDENCE_HALF_LIFE_DAYS)
+    return round(VALUE_CONFIDENCE * decay / max(1, tied), 3)
+
+
+def _days_apart(first: date | None, second: date | None) -> int | None:
+    if first is None or second is None:
+        return None
+    return abs((first - second).days)
+
+
+def match_folha_de_obra(folha: tuple, index: OrcamentoIndex, links: dict) -> tuple | None:
+    """Match one Folha de Obra (document_id, customer_id, total_value, document_date).
+
+    links maps folha_obra_id -> {orcamento_id: shared invoice lines}.
+    Returns a match table row or None.
+    """
+    folha_id, customer_id, total_value, folha_date = folha
+
+    linked = [
+        (shared, index.by_id[orc_id])
+        for orc_id, shared in links.get(folha_id, {}).items()
+        if orc_id in index.by_id
+    ]
+    if linked:
+        _, orc = min(
+            linked,
+            key=lambda item: (
+                -item[0],
+                _days_apart(item[1][_ORC_DATE], folha_date) is None,
+                _days_apart(item[1][_ORC_DATE], folha_date) or 0,
+                item[1][_ORC_ID],
+            ),
+        )
+        same_value = total_value is not None and orc[_ORC_VALUE] == total_value
+        confidence = LINK_CONFIDENCE if same_value else LINK_VALUE_MISMATCH_CONFIDENCE
+        method = METHOD_LINK
+    else:
+        orc, tied = index.nearest(customer_id, total_value, folha_date)
+        if orc is None:
+            return None
+        confidence = value_confidence(_days_apart(orc[_ORC_DATE], folha_date), tied)
+        method = METHOD_VALUE
+
+    return (
+        folha_id,
+        orc[_ORC_ID],
+        orc[_ORC_NUMBER],
+        orc[_ORC_DATE],
+        orc[_ORC_VALUE],
+        orc[_ORC_LINES],
+        _days_apart(orc[_ORC_DATE], folha_date),
+        method,
+        confidence,
+    )
+
+
+# ----------------------------------------------------------------------
+# Loading from Supabase
+# ----------------------------------------------------------------------
+MATCH_COLUMNS = (
+    "folha_obra_id",
+    "orcamento_id",
+    "orcamento_number",
+    "orcamento_date",
+    "orcamento_value",
+    "orcamento_lines",
+    "date_diff_days",
+    "match_method",
+    "confidence",
+)
+
+
+def load_folhas_de_obra(cursor, document_ids: list[str] | None = None) -> list[tuple]:
+    """(document_id, customer_id, total_value, document_date) of the Folhas de Obra."""
+    sql = (
+        "SELECT document_id, customer_id, total_value, document_date FROM phc.bo "
+        "WHERE document_type = %s"
+    )
+    params: list = [FOLHA_DE_OBRA]
+    if document_ids is not None:
+        sql += " AND document_id = ANY(%s)"
+        params.append(document_ids)
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+
+def load_orcamento_index(
+    cursor, folhas: list[tuple] | None = None, linked_ids: list[str] | None = None
+) -> OrcamentoIndex:
+    """Index of the Orçamentos; with folhas, only their customers' (plus linked_ids)."""
+    sql = """
+        SELECT
+            orc.document_id,
+            orc.document_number,
+            orc.document_date,
+            orc.customer_id,
+            orc.total_value,
+            COALESCE(lines.line_count, 0)
+        FROM phc.bo orc
+        LEFT JOIN (
+            SELECT document_id, COUNT(DISTINCT line_id) AS line_count
+            FROM phc.bi
+            GROUP BY document_id
+        ) lines ON lines.document_id = orc.document_id
+        WHERE orc.document_type = %s
+    """
+    params: list = [ORCAMENTO]
+    if folhas is not None:
+        customers = sorted({folha[1] for folha in folhas if folha[1] is not None})
+        sql += " AND (orc.customer_id = ANY(%s) OR orc.document_id = ANY(%s))"
+        params.extend([customers, linked_ids or []])
+    cursor.execute(sql, params)
+    return OrcamentoIndex(cursor.fetchall())
+
+
+def load_invoice_links(cursor, document_ids: list[str] | None = None) -> dict:
+    """folha_obra_id -> {orcamento_id: invoice lines shared through fi.bistamp}."""
+    sql = """
+        SELECT fo_bi.document_id, orc_bi.document_id, COUNT(*)
+        FROM phc.fi fo_fi
+        JOIN phc.bi fo_bi ON fo_bi.line_id = fo_fi.bistamp
+        JOIN phc.bo fo ON fo.document_id = fo_bi.document_id AND fo.document_type = %s
+        JOIN phc.fi orc_fi ON orc_fi.invoice_id = fo_fi.invoice_id
+        JOIN phc.bi orc_bi ON orc_bi.line_id = orc_fi.bistamp
+        JOIN phc.bo orc ON orc.document_id = orc_bi.document_id AND orc.document_type = %s
+        WHERE fo_fi.bistamp IS NOT NULL
+    """
+    params: list = [FOLHA_DE_OBRA, ORCAMENTO]
+    if document_ids is not None:
+        sql += " AND fo_bi.document_id = ANY(%s)"
+        params.append(document_ids)
+    sql += " GROUP BY fo_bi.document_id, orc_bi.document_id"
+    cursor.execute(sql, params)
+    links: dict[str, dict[str, int]] = {}
+    for folha_id, orc_id, shared in cursor.fetchall():
+        links.setdefault(folha_id, {})[orc_id] = shared
+    return links
+
+
+def compute_matches(cursor, document_ids: list[str] | None = None) -> list[tuple]:
+    """Match rows for the given Folhas de Obra (all of them when None)."""
+    folhas = load_folhas_de_obra(cursor, document_ids)
+    if not folhas:
+        return []
+    links = load_invoice_links(cursor, document_ids)
+    if document_ids is None:
+        index = load_orcamento_index(cursor)
+    else:
+        linked_ids = sorted({orc_id for linked in links.values() for orc_id in linked})
+        index = load_orcamento_index(cursor, folhas, linked_ids)
+    matches = []
+    for folha in folhas:
+        match = match_folha_de_obra(folha, index, links)
+        if match is not None:
+            matches.append(match)
+    logger.info(
+        "[MATCH] %s Folhas de Obra, %s Orçamentos indexed, %s matched (%s by invoice link)",
+        len(folhas),
+        len(index),
+        len(matches),
+        sum(1 for match in matches if match[7] == METHOD_LINK),
+    )
+    return matches
@@ -0,0 +1,712 @@
+"""
+PHC <-> Supabase reconciliation
+Compares a synced table in PHC and in Supabase bucket by bucket
+(year -> month -> day -> key prefix) and only descends into buckets whose
+aggregates differ. Once a bucket is small enough its rows are compared
+directly, so the drift report names the exact keys that are missing, extra
+or different, and a repair rewrites just those rows.
+
+PHC and Postgres share no hash function, so bucket aggregates are built
+from values both sides compute identically: the row count, sums of the
+numeric/integer columns, the sum of date offsets and the summed trimmed
+length of the character columns. A text edit that keeps the length is only
+seen if its bucket is compared row by row for another reason.
+"""
+
+import logging
+import time as clock
+from datetime import date, timedelta
+
+import psycopg2.extras
+
+from folha_obra_match import ensure_touched_table, record_touched_documents
+from partitions import is_partitioned
+from selective_sync import (
+    DELETE_DETECTION_MAX_RATIO,
+    ROW_HASH_COLUMN,
+    TABLE_CONFIGS,
+    SelectiveSync,
+    _current_year_start_date,
+    _to_text,
+    apply_converter_plan,
+    compile_converter_plan,
+    parse_marca_date,
+    row_fingerprint,
+)
+
+logger = logging.getLogger(__name__)
+
+# Buckets with at most this many rows (either side) are compared row by row
+DEFAULT_LEAF_ROWS = 5000
+# Longest key prefix used to split a day; PHC stamps are 25 characters
+MAX_PREFIX_LENGTH = 25
+# Keys listed per drifted bucket in the report (counts are always complete)
+REPORT_SAMPLE_KEYS = 20
+
+_DATE_LEVELS = ("year", "month", "day")
+_EPOCH = "2000-01-01"
+# PHC types whose cleaned text is the source value trimmed (LEN() comparable)
+_CHARACTER_TYPES = ("char", "varchar", "nchar", "nvarchar")
+
+
+def _legacy_text(value) -> str | None:
+    """run_annual_historical's text cleaning: falsy values (0, False) become NULL."""
+    return _to_text(value) if value else None
+
+
+# Historical snapshots written by run_annual_historical.py (two complete years)
+HISTORICAL_TABLE_CONFIGS = {
+    "2years_bo": {
+        "columns": {
+            "document_id": "TEXT",
+            "document_number": "TEXT",
+            "document_type": "TEXT",
+            "customer_id": "INTEGER",
+            "document_date": "DATE",
+            "observacoes": "TEXT",
+            "nome_trabalho": "TEXT",
+            "origin": "TEXT",
+            "total_value": "NUMERIC",
+            "last_delivery_date": "DATE",
+            "created_by": "TEXT",
+        },
+        "source_columns": {
+            "document_id": "[bostamp]",
+            "document_number": "[obrano]",
+            "document_type": "[nmdos]",
+            "customer_id": "[no]",
+            "document_date": "[dataobra]",
+            "observacoes": "[obranome]",
+            "nome_trabalho": "[obs]",
+            "origin": "[origem]",
+            "total_value": "[ebo_2tvall]",
+            "last_delivery_date": "[marca]",
+            "created_by": "[ousrinis]",
+        },
+        "source_from": "[bo]",
+        "source_filter": None,
+        "source_date": "[dataobra]",
+        "column_parsers": {"last_delivery_date": parse_marca_date},
+        "primary_key": "document_id",
+        "date_column": "document_date",
+        "text_columns": [
+            "document_id",
+            "document_type",
+            "observacoes",
+            "nome_trabalho",
+            "origin",
+            "created_by",
+        ],
+    },
+    "2years_ft": {
+        "columns": {
+            "invoice_id": "TEXT",
+            "invoice_number": "INTEGER",
+            "customer_id": "INTEGER",
+            "invoice_date": "DATE",
+            "document_type": "TEXT",
+            "net_value": "NUMERIC",
+            "anulado": "TEXT",
+            "salesperson_name": "TEXT",
+            "customer_name": "TEXT",
+            "created_by": "TEXT",
+        },
+        "source_columns": {
+            "invoice_id": "[ftstamp]",
+            "invoice_number": "[fno]",
+            "customer_id": "[no]",
+            "invoice_date": "[fdata]",
+            "document_type": "[nmdoc]",
+            "net_value": "[ettiliq]",
+            "anulado": "[anulado]",
+            "salesperson_name": "[vendnm]",
+            "customer_name": "[nome]",
+            "created_by": "[ousrinis]",
+        },
+        "source_from": "[ft]",
+        "source_filter": "COALESCE(CONVERT(VARCHAR(10), [anulado]), '') IN ('', '0', 'N')",
+        "source_date": "[fdata]",
+        "column_parsers": {},
+        "primary_key": "invoice_id",
+        "date_column": "invoice_date",
+        "text_columns": [
+            "invoice_id",
+            "document_type",
+            "salesperson_name",
+            "customer_name",
+            "created_by",
+        ],
+    },
+    "2years_fi": {
+        "columns": {
+            "line_item_id": "TEXT",
+            "invoice_id": "TEXT",
+            "document_number": "INTEGER",
+            "invoice_date": "DATE",
+            "cost_center": "TEXT",
+            "salesperson_name": "TEXT",
+            "net_liquid_value": "NUMERIC",
+            "bistamp": "TEXT",
+        },
+        "source_columns": {
+            "line_item_id": "fi.[fistamp]",
+            "invoice_id": "fi.[ftstamp]",
+            "document_number": "fi.[fno]",
+            "invoice_date": "ft.[fdata]",
+            "cost_center": "fi.[ficcusto]",
+            "salesperson_name": "fi.[fivendnm]",
+            "net_liquid_value": "fi.[etiliquido]",
+            "bistamp": "fi.[bistamp]",
+        },
+        "source_from": "[fi] AS fi JOIN [ft] AS ft ON ft.[ftstamp] = fi.[ftstamp]",
+        "source_filter": (
+            "COALESCE(CONVERT(VARCHAR(10), ft.[anulado]), '') IN ('', '0', 'N') "
+            "AND fi.[etiliquido] IS NOT NULL AND fi.[etiliquido] <> 0"
+        ),
+        "source_date": "ft.[fdata]",
+        "column_parsers": {},
+        "primary_key": "line_item_id",
+        "date_column": "invoice_date",
+        "text_columns": [
+            "line_item_id",
+            "invoice_id",
+            "cost_center",
+            "salesperson_name",
+            "bistamp",
+        ],
+    },
+}
+
+RECONCILE_TABLES = list(TABLE_CONFIGS) + list(HISTORICAL_TABLE_CONFIGS)
+
+
+# ----------------------------------------------------------------------
+# Table specs - one shape for live and historical tables
+# ----------------------------------------------------------------------
+def _phc_character_columns(phc_conn, table_name: str) -> set[str]:
+    phc_cursor = phc_conn.cursor()
+    phc_cursor.execute(
+        "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS "
+        f"WHERE TABLE_NAME = '{table_name}' "
+        f"AND DATA_TYPE IN ({', '.join(repr(kind) for kind in _CHARACTER_TYPES)})"
+    )
+    return {row[0].lower() for row in phc_cursor.fetchall()}
+
+
+def live_table_spec(
+    syncer: SelectiveSync, table_name: str, start: date | None = None, end: date | None = None
+) -> dict:
+    """Spec for a TABLE_CONFIGS table, scoped like the incremental sync."""
+    config = TABLE_CONFIGS[table_name]
+    column_names = list(config["columns"])
+    mappings = config.get("column_mappings", {})
+    character_columns = _phc_character_columns(syncer.phc_conn, table_name)
+
+    def target(col: str) -> str:
+        return mappings.get(col, col)
+
+    spec = {
+        "table": table_name,
+        "columns": {target(col): col_type for col, col_type in config["columns"].items()},
+        "column_parsers": {
+            target(col): parser for col, parser in config.get("column_parsers", {}).items()
+        },
+        "column_defaults": {
+            target(col): value for col, value in config.get("column_defaults", {}).items()
+        },
+        "primary_key": config["primary_key"],
+        "text_columns": [
+            target(col)
+            for col, col_type in config["columns"].items()
+            if "TEXT" in col_type.upper() and col.lower() in character_columns
+        ],
+        "phc_columns": {target(col): f"w.[{col}]" for col in column_names},
+        "phc_filter": None,
+        "row_hash": True,
+        "touched_column": config.get("touched_column"),
+    }
+
+    if config.get("supports_incremental"):
+        start = start or _current_year_start_date()
+        window_query, _, _ = syncer._build_incremental_query(
+            table_name, column_names, config, start.isoformat()
+        )
+        date_column = (
+            "parent_date" if config.get("parent_source_table") else config["source_date_column"]
+        )
+        local_from, local_date = SelectiveSync._local_window_source(table_name, config)
+        partition_column = SelectiveSync._configured_partition_column(config)
+        if (
+            partition_column
+            and config.get("parent_source_table")
+            and is_partitioned(syncer.supabase_conn.cursor(), table_name)
+        ):
+            # Partitioned BI/FI lines also store the parent's date
+            spec["hashed_columns"] = len(column_names)
+            spec["columns"][partition_column] = "DATE"
+            spec["phc_columns"][partition_column] = "w.[parent_date]"
+        spec.update(
+            phc_from=f"({window_query}) AS w",
+            phc_date=f"w.[{date_column}]",
+            local_from=local_from,
+            local_date=local_date,
+            start=start,
+            end=end or date.today() + timedelta(days=1),
+        )
+        return spec
+
+    filter_condition = config.get("filter")
+    if callable(filter_condition):
+        filter_condition = filter_condition()
+    source_select = ", ".join(f"[{col}]" for col in column_names)
+    spec.update(
+        phc_from=f"(SELECT {source_select} FROM [{table_name}]) AS w",
+        phc_filter=filter_condition,
+        phc_date=None,
+        local_from=f'phc."{table_name}" AS child',
+        local_date=None,
+        start=None,
+        end=None,
+    )
+    return spec
+
+
+def historical_table_spec(
+    table_name: str, start: date | None = None, end: date | None = None
+) -> dict:
+    """Spec for a 2years_* table; the default window is the two complete years."""
+    config = HISTORICAL_TABLE_CONFIGS[table_name]
+    current_year = date.today().year
+    parsers = {
+        col: _legacy_text for col, col_type in config["columns"].items() if col_type == "TEXT"
+    }
+    parsers.update(config["column_parsers"])
+    return {
+        "table": table_name,
+        "columns": config["columns"],
+        "column_parsers": parsers,
+        "column_defaults": {},
+        "primary_key": config["primary_key"],
+        "text_columns": config["text_columns"],
+        "phc_columns": config["source_columns"],
+        "phc_from": config["source_from"],
+        "phc_filter": config["source_filter"],
+        "phc_date": config["source_date"],
+        "local_from": f'phc."{table_name}" AS child',
+        "local_date": f'child."{config["date_column"]}"',
+        "start": start or date(current_year - 2, 1, 1),
+        "end": end or date(current_year, 1, 1),
+        "row_hash": False,
+    }
+
+
+def table_spec(
+    syncer: SelectiveSync, table_name: str, start: date | None = None, end: date | None = None
+) -> dict:
+    if table_name in HISTORICAL_TABLE_CONFIGS:
+        return historical_table_spec(table_name, start, end)
+    return live_table_spec(syncer, table_name, start, end)
+
+
+# ----------------------------------------------------------------------
+# Buckets
+# ----------------------------------------------------------------------
+def _aggregate_columns(spec: dict) -> list[tuple[str, str]]:
+    """(column, kind) pairs whose sums both databases compute identically.
+
+    Columns with a parser or default are left out: their stored value is not
+    a plain cast of the PHC value. text_columns are the exception for
+    parsers - their stored value is the trimmed PHC text (or NULL if empty).
+    """
+    text_columns = set(spec["text_columns"])
+    derived = (set(spec["column_parsers"]) - text_columns) | set(spec["column_defaults"])
+    aggregates = []
+    for col, col_type in spec["columns"].items():
+        col_type = col_type.upper()
+        if col in derived:
+            continue
+        if "INTEGER" in col_type:
+            aggregates.append((col, "integer"))
+        elif "NUMERIC" in col_type:
+            aggregates.append((col, "numeric"))
+        elif "DATE" in col_type:
+            aggregates.append((col, "date"))
+        elif col in text_columns:
+            aggregates.append((col, "text"))
+    return aggregates
+
+
+def _phc_aggregate_sql(expr: str, kind: str) -> str:
+    if kind == "integer":
+        # _to_integer truncates toward zero; ROUND(x, 0, 1) does the same
+        return f"SUM(CAST(ROUND({expr}, 0, 1) AS DECIMAL(38, 0)))"
+    if kind == "numeric":
+        return f"SUM(CAST({expr} AS DECIMAL(38, 4)))"
+    if kind == "text":
+        # LEN ignores trailing spaces; _to_text strips both ends
+        return f"SUM(CAST(LEN(LTRIM({expr})) AS BIGINT))"
+    return f"SUM(CAST(DATEDIFF(day, '{_EPOCH}', {expr}) AS BIGINT))"
+
+
+def _local_aggregate_sql(expr: str, kind: str) -> str:
+    if kind == "numeric":
+        return f"SUM(ROUND({expr}, 4))"
+    if kind == "date":
+        return f"SUM({expr} - DATE '{_EPOCH}')"
+    if kind == "text":
+        return f"SUM(char_length({expr}))"
+    return f"SUM({expr})"
+
+
+def _next_level(spec: dict, level: tuple[str, int] | None) -> tuple[str, int] | None:
+    if level is None:
+        return ("year", 0) if spec["phc_date"] else ("prefix", 1)
+    kind, length = level
+    if kind in _DATE_LEVELS[:-1]:
+        return (_DATE_LEVELS[_DATE_LEVELS.index(kind) + 1], 0)
+    if kind == "day":
+        return ("prefix", 1)
+    return ("prefix", length + 1) if length < MAX_PREFIX_LENGTH else None
+
+
+def _path_range(spec: dict, path: tuple) -> tuple[date | None, date | None]:
+    """Half-open date range a bucket path covers, clamped to the spec window."""
+    parts = dict(path)
+    start, end = spec["start"], spec["end"]
+    if "day" in parts:
+        low = date(parts["year"], parts["month"], parts["day"])
+        high = low + timedelta(days=1)
+    elif "month" in parts:
+        low = date(parts["year"], parts["month"], 1)
+        high = date(low.year + low.month // 12, low.month % 12 + 1, 1)
+    elif "year" in parts:
+        low = date(parts["year"], 1, 1)
+        high = date(parts["year"] + 1, 1, 1)
+    else:
+        return start, end
+    return max(low, start), min(high, end)
+
+
+def _path_prefix(path: tuple) -> str | None:
+    prefixes = [value for kind, value in path if kind == "prefix"]
+    return prefixes[-1] if prefixes else None
+
+
+def _child_column(col: str) -> str:
+    return f'child."{col}"'
+
+
+def bucket_label(path: tuple) -> str:
+    """e.g. "2025-03-04/ADM25" or "*/12" for tables without a date."""
+    parts = dict(path)
+    day = "-".join(
+        f"{parts[kind]:02d}" if kind != "year" else str(parts[kind])
+        for kind in _DATE_LEVELS
+        if kind in parts
+    )
+    prefix = _path_prefix(path)
+    if prefix is None:
+        return day or "*"
+    return f"{day or '*'}/{prefix}"
+
+
+class Reconciler:
+    """Drill-down comparison (and optional repair) over open PHC/Supabase connections."""
+
+    def __init__(self, phc_conn, supabase_conn, leaf_rows: int = DEFAULT_LEAF_ROWS):
+        self.phc_conn = phc_conn
+        self.supabase_conn = supabase_conn
+        self.leaf_rows = leaf_rows
+
+    # ------------------------------------------------------------------
+    # Predicates
+    # ------------------------------------------------------------------
+    def _phc_where(self, spec: dict, path: tuple) -> str:
+        conditions = [f"({spec['phc_filter']})"] if spec["phc_filter"] else []
+        if spec["phc_date"]:
+            low, high = _path_range(spec, path)
+            conditions.append(
+                f"{spec['phc_date']} >= '{low.isoformat()}' "
+                f"AND {spec['phc_date']} < '{high.isoformat()}'"
+            )
+        prefix = _path_prefix(path)
+        if prefix is not None:
+            key = spec["phc_columns"][spec["primary_key"]]
+            escaped = prefix.replace("'", "''")
+            conditions.append(
+                f"LEFT(LTRIM(CAST({key} AS NVARCHAR(50))), {len(prefix)}) = N'{escaped}'"
+            )
+        return " AND ".join(conditions) or "1 = 1"
+
+    def _local_where(self, spec: dict, path: tuple) -> tuple[str, list]:
+        conditions, params = [], []
+        if spec["local_date"]:
+            low, high = _path_range(spec, path)
+            conditions.append(f"{spec['local_date']} >= %s AND {spec['local_date']} < %s")
+            params.extend([low, high])
+        prefix = _path_prefix(path)
+        if prefix is not None:
+            conditions.append(f"left({_child_column(spec['primary_key'])}::text, %s) = %s")
+            params.extend([len(prefix), prefix])
+        return " AND ".join(conditions) or "TRUE", params
+
+    # ------------------------------------------------------------------
+    # Aggregates
+    # ------------------------------------------------------------------
+    def _phc_buckets(self, spec: dict, path: tuple, level: tuple[str, int]) -> dict:
+        kind, length = level
+        if kind == "prefix":
+            key = spec["phc_columns"][spec["primary_key"]]
+            group_expr = f"LEFT(LTRIM(CAST({key} AS NVARCHAR(50))), {length})"
+        else:
+            group_expr = f"{kind.upper()}({spec['phc_date']})"
+        sums = "".join(
+            f", {_phc_aggregate_sql(spec['phc_columns'][col], agg)}"
+            for col, agg in _aggregate_columns(spec)
+        )
+        phc_cursor = self.phc_conn.cursor()
+        phc_cursor.execute(
+            f"SELECT {group_expr}, COUNT(*){sums} FROM {spec['phc_from']} "
+            f"WHERE {self._phc_where(spec, path)} GROUP BY {group_expr}"
+        )
+        return self._bucket_map(phc_cursor.fetchall(), kind)
+
+    def _local_buckets(self, spec: dict, path: tuple, level: tuple[str, int]) -> dict:
+        kind, length = level
+        if kind == "prefix":
+            group_expr = f"left({_child_column(spec['primary_key'])}::text, {length})"
+        else:
+            group_expr = f"EXTRACT({kind.upper()} FROM {spec['local_date']})::int"
+        sums = "".join(
+            f", {_local_aggregate_sql(_child_column(col), agg)}"
+            for col, agg in _aggregate_columns(spec)
+        )
+        where_sql, params = self._local_where(spec, path)
+        cursor = self.supabase_conn.cursor()
+        cursor.execute(
+            f"SELECT {group_expr}, COUNT(*){sums} FROM {spec['local_from']} "
+            f"WHERE {where_sql} GROUP BY {group_expr}",
+            params,
+        )
+        return self._bucket_map(cursor.fetchall(), kind)
+
+    @staticmethod
+    def _bucket_map(rows, kind: str) -> dict:
+        """bucket key -> (count, sums...) with NULL sums read as 0."""
+        buckets = {}
+        for key, *aggregates in rows:
+            if kind == "prefix":
+                key = (key or "").rstrip()
+            buckets[key] = tuple(0 if value is None else value for value in aggregates)
+        return buckets
+
+    # ------------------------------------------------------------------
+    # Leaves
+    # ------------------------------------------------------------------
+    def _phc_rows(self, spec: dict, path: tuple) -> dict:
+        """Clean PHC rows of a bucket keyed by primary key (last duplicate wins)."""
+        columns = list(spec["columns"])
+        select = ", ".join(spec["phc_columns"][col] for col in columns)
+        phc_cursor = self.phc_conn.cursor()
+        phc_cursor.execute(
+            f"SELECT {select} FROM {spec['phc_from']} WHERE {self._phc_where(spec, path)}"
+        )
+        plan = compile_converter_plan(spec)
+        pk_index = columns.index(spec["primary_key"])
+        rows = {}
+        while True:
+            batch = phc_cursor.fetchmany(5000)
+            if not batch:
+                break
+            for row in apply_converter_plan(plan, batch):
+                rows[row[pk_index]] = row
+        return rows
+
+    def _local_rows(self, spec: dict, path: tuple) -> dict:
+        columns = list(spec["columns"])
+        select = ", ".join(_child_column(col) for col in columns)
+        where_sql, params = self._local_where(spec, path)
+        cursor = self.supabase_conn.cursor()
+        cursor.execute(f"SELECT {select} FROM {spec['local_from']} WHERE {where_sql}", params)
+        pk_index = columns.index(spec["primary_key"])
+        return {row[pk_index]: tuple(row) for row in cursor.fetchall()}
+
+    def _compare_leaf(self, spec: dict, path: tuple) -> tuple[dict, dict]:
+        phc_rows = self._phc_rows(spec, path)
+        local_rows = self._local_rows(spec, path)
+        diff = {
+            "bucket": bucket_label(path),
+            "phc_rows": len(phc_rows),
+            "local_rows": len(local_rows),
+            "missing": sorted(str(key) for key in phc_rows.keys() - local_rows.keys()),
+            "extra": sorted(str(key) for key in local_rows.keys() - phc_rows.keys()),
+            "different": sorted(
+                str(key)
+                for key in phc_rows.keys() & local_rows.keys()
+                if phc_rows[key] != local_rows[key]
+            ),
+        }
+        return diff, phc_rows
+
+    def _write_rows(self, spec: dict, rows: list[tuple]) -> None:
+        """Insert clean PHC rows (their keys were deleted first; caller commits)."""
+        columns = list(spec["columns"])
+        if spec["row_hash"]:
+            # row_hash covers the config columns only, like the sync writes it
+            hashed = spec.get("hashed_columns", len(columns))
+            rows = [
+                row[:hashed] + (row_fingerprint(row[:hashed]),) + row[hashed:] for row in rows
+            ]
+            columns = columns[:hashed] + [ROW_HASH_COLUMN] + columns[hashed:]
+        column_list = ", ".join(f'"{col}"' for col in columns)
+        psycopg2.extras.execute_values(
+            self.supabase_conn.cursor(),
+            f'INSERT INTO phc."{spec["table"]}" ({column_list}) VALUES %s',
+            rows,
+            page_size=1000,
+        )
+
+    # ------------------------------------------------------------------
+    # Driver
+    # ------------------------------------------------------------------
+    def reconcile_table(self, spec: dict, repair: bool = False) -> dict:
+        """Compare one table and return its drift report (repairing if asked)."""
+        started = clock.perf_counter()
+        table_name = spec["table"]
+        report = {
+            "table": table_name,
+            "window": (
+                {"start": spec["start"].isoformat(), "end": spec["end"].isoformat()}
+                if spec["phc_date"]
+                else None
+            ),
+            "phc_rows": 0,
+            "local_rows": 0,
+            "buckets_compared": 0,
+            "missing": 0,
+            "extra": 0,
+            "different": 0,
+            "drifted_buckets": [],
+        }
+        leaves = []
+        pending = [((), _next_level(spec, None))]
+        while pending:
+            path, level = pending.pop()
+            phc_buckets = self._phc_buckets(spec, path, level)
+            local_buckets = self._local_buckets(spec, path, level)
+            if not path:
+                report["phc_rows"] = sum(agg[0] for agg in phc_buckets.values())
+                report["local_rows"] = sum(agg[0] for agg in local_buckets.values())
+            for key in phc_buckets.keys() | local_buckets.keys():
+                report["buckets_compared"] += 1
+                phc_aggregate = phc_buckets.get(key)
+                local_aggregate = local_buckets.get(key)
+                if phc_aggregate == local_aggregate:
+                    continue
+                child = path + ((level[0], key),)
+                phc_count = phc_aggregate[0] if phc_aggregate else 0
+                local_count = local_aggregate[0] if local_aggregate else 0
+                deeper = _next_level(spec, level)
+                if (
+                    deeper is None
+                    or max(phc_count, local_count) <= self.leaf_rows
+                    or min(phc_count, local_count) == 0
+                ):
+                    leaves.append(child)
+                else:
+                    pending.append((child, deeper))
+
+        diffs = []
+        for path in sorted(leaves, key=bucket_label):
+            diff, phc_rows = self._compare_leaf(spec, path)
+            if diff["missing"] or diff["extra"] or diff["different"]:
+                diffs.append((diff, phc_rows))
+
+        for diff, _ in diffs:
+            for kind in ("missing", "extra", "different"):
+                report[kind] += len(diff[kind])
+            report["drifted_buckets"].append(
+                {
+                    "bucket": diff["bucket"],
+                    "phc_rows": diff["phc_rows"],
+                    "local_rows": diff["local_rows"],
+                    **{
+                        kind: len(diff[kind]) for kind in ("missing", "extra", "different")
+                    },
+                    "sample_keys": {
+                        kind: diff[kind][:REPORT_SAMPLE_KEYS]
+                        for kind in ("missing", "extra", "different")
+                        if diff[kind]
+                    },
+                }
+            )
+
+        if repair and diffs:
+            report["repair"] = self._repair(spec, report, diffs)
+
+        report["seconds"] = round(clock.perf_counter() - started, 1)
+        logger.info(
+            "[RECON] %s: %s missing, %s extra, %s different (%s buckets compared, %.1fs)",
+            table_name.upper(),
+            report["missing"],
+            report["extra"],
+            report["different"],
+            report["buckets_compared"],
+            report["seconds"],
+        )
+        return report
+
+    def _repair(self, spec: dict, report: dict, diffs: list) -> dict:
+        """Delete the drifted keys table-wide, then insert PHC's rows for them.
+
+        A key can sit in another bucket locally (e.g. its date changed), so
+        deletes are not limited to the leaf, and a key PHC returns is never
+        deleted as another leaf's extra row.
+        """
+        # Same guard as delete detection: a bad PHC read must not empty the table
+        delete_extra = report["extra"] <= max(
+            50, DELETE_DETECTION_MAX_RATIO * report["local_rows"]
+        )
+        if not delete_extra:
+            logger.warning(
+                "[WARN] %s: %s rows missing in PHC - not deleting them",
+                spec["table"].upper(),
+                report["extra"],
+            )
+        rows = {}
+        extra = set()
+        for diff, phc_rows in diffs:
+            by_text_key = {str(key): row for key, row in phc_rows.items()}
+            for key in diff["missing"] + diff["different"]:
+                rows[key] = by_text_key[key]
+            if delete_extra:
+                extra.update(diff["extra"])
+        extra -= rows.keys()
+
+        # BO/BI/FI feed the Folha de Obra matches: queue the documents of the
+        # removed and rewritten rows for refresh_touched_matches, as the sync does
+        touched_column = spec.get("touched_column")
+        returning = f' RETURNING "{touched_column}"' if touched_column else ""
+        cursor = self.supabase_conn.cursor()
+        try:
+            cursor.execute(
+                f'DELETE FROM phc."{spec["table"]}" WHERE "{spec["primary_key"]}"::text = ANY(%s)'
+                + returning,
+                (list(rows.keys() | extra),),
+            )
+            if touched_column:
+                touched_index = list(spec["columns"]).index(touched_column)
+                touched = [row[0] for row in cursor.fetchall()]
+                touched += [row[touched_index] for row in rows.values()]
+                ensure_touched_table(cursor)
+                record_touched_documents(cursor, touched)
+            if rows:
+                self._write_rows(spec, list(rows.values()))
+            self.supabase_conn.commit()
+        except Exception:
+            self.supabase_conn.rollback()
+            raise
+        logger.info(
+            "[FIX] %s: %s rows rewritten, %s deleted", spec["table"].upper(), len(rows), len(extra)
+        )
+        return {"written": len(rows), "deleted": len(extra), "extra_kept": not delete_extra}
@@ -0,0 +1,300 @@
+"""
+Monthly sales rollups
+phc.ft_monthly_rollup and phc.fi_monthly_rollup hold per-month sums of the
+invoice tables so analytics RPCs read a few thousand rows instead of
+phc.ft / phc.fi / "2years_ft" / "2years_fi":
+
+- ft: (source, year, month, customer_id, document_type, anulado) -> net value, documents
+- fi: (source, year, month, cost_center, salesperson_name, document_type, anulado)
+  -> net value, lines
+
+source is "live" (phc.ft/fi) or "2years" (the historical snapshot), so a
+year present in both while rolling over is never counted twice. anulado is
+kept as stored: the RPCs reading the rollups (get_department_rankings_ytd,
+get_cost_center_multi_year_ytd) each apply their own cancellation test.
+
+Statement-level triggers on the four tables record the months their
+inserted, updated and deleted rows fall in (transition tables, one insert
+per statement) in phc.sales_rollup_dirty_months. refresh_sales_rollups()
+then recomputes only those months, so deletes, cascades from FT to FI,
+cancellations (anulado) and re-dated invoices are all reflected exactly.
+A TRUNCATE, a full reload swap (queue_table_rebuild: the shadow gets the
+triggers only after its rows are loaded) or a table that lost its triggers
+(the DROP/CREATE of run_annual_historical.py) rebuilds the whole source.
+"""
+
+import logging
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+DIRTY_TABLE = "phc.sales_rollup_dirty_months"
+FT_ROLLUP = "phc.ft_monthly_rollup"
+FI_ROLLUP = "phc.fi_monthly_rollup"
+
+# source -> (invoice table, invoice line table)
+ROLLUP_SOURCES = {
+    "live": ("ft", "fi"),
+    "2years": ("2years_ft", "2years_fi"),
+}
+
+# Whole-source rebuild marker in the dirty table
+_ALL_MONTHS = 0
+
+_TRIGGER_EVENTS = (
+    ("ins", "INSERT", "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT"),
+    ("upd", "UPDATE", "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT"),
+    ("del", "DELETE", "REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT"),
+    ("trunc", "TRUNCATE", "FOR EACH STATEMENT"),
+)
+
+
+def _month_sql(relation: str, date_expr: str) -> str:
+    return (
+        f"INSERT INTO {DIRTY_TABLE} (source, year, month) "
+        f"SELECT DISTINCT TG_ARGV[0], EXTRACT(YEAR FROM {date_expr})::int, "
+        f"EXTRACT(MONTH FROM {date_expr})::int FROM {relation} "
+        f"WHERE {date_expr} IS NOT NULL ON CONFLICT DO NOTHING;"
+    )
+
+
+def _trigger_function_sql(name: str, old_relation: str, new_relation: str, date_expr: str) -> str:
+    return f"""
+    CREATE OR REPLACE FUNCTION phc.{name}() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            INSERT INTO {DIRTY_TABLE} (source, year, month)
+            VALUES (TG_ARGV[0], {_ALL_MONTHS}, {_ALL_MONTHS}) ON CONFLICT DO NOTHING;
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            {_month_sql(old_relation, date_expr)}
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            {_month_sql(new_relation, date_expr)}
+        END IF;
+        RETURN NULL;
+    END;
+    $$
+    """
+
+
+# Tables carrying invoice_date themselves, and live FI which takes it from FT
+_TRIGGER_FUNCTIONS = {
+    "mark_sales_rollup_months": _trigger_function_sql(
+        "mark_sales_rollup_months", "old_rows r", "new_rows r", "r.invoice_date"
+    ),
+    "mark_sales_rollup_months_by_invoice": _trigger_function_sql(
+        "mark_sales_rollup_months_by_invoice",
+        "old_rows r JOIN phc.ft ft ON ft.invoice_id = r.invoice_id",
+        "new_rows r JOIN phc.ft ft ON ft.invoice_id = r.invoice_id",
+        "ft.invoice_date",
+    ),
+}
+
+# table -> (source, trigger function)
+_TRIGGERED_TABLES = {
+    "ft": ("live", "mark_sales_rollup_months"),
+    "fi": ("live", "mark_sales_rollup_months_by_invoice"),
+    "2years_ft": ("2years", "mark_sales_rollup_months"),
+    "2years_fi": ("2years", "mark_sales_rollup_months"),
+}
+
+
+def ensure_sales_rollups(cursor) -> list[str]:
+    """Create rollup tables, trigger functions and missing triggers.
+
+    Returns the sources queued for a full rebuild (tables that had no
+    triggers, i.e. new or replaced since the last run).
+    """
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {FT_ROLLUP} (
+            source TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            customer_id INTEGER,
+            document_type TEXT,
+            anulado TEXT,
+            net_value NUMERIC NOT NULL,
+            documents BIGINT NOT NULL
+        )
+        """
+    )
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {FI_ROLLUP} (
+            source TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            cost_center TEXT,
+            salesperson_name TEXT,
+            document_type TEXT,
+            anulado TEXT,
+            net_value NUMERIC NOT NULL,
+            lines BIGINT NOT NULL
+        )
+        """
+    )
+    cursor.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_ft_monthly_rollup_period ON {FT_ROLLUP} (source, year, month)"
+    )
+    cursor.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_fi_monthly_rollup_period ON {FI_ROLLUP} (source, year, month)"
+    )
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {DIRTY_TABLE} (
+            source TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            PRIMARY KEY (source, year, month)
+        )
+        """
+    )
+    for function_sql in _TRIGGER_FUNCTIONS.values():
+        cursor.execute(function_sql)
+
+    rebuild = []
+    for table_name, (source, function_name) in _TRIGGERED_TABLES.items():
+        cursor.execute("SELECT to_regclass(%s)", (f'phc."{table_name}"',))
+        relation = cursor.fetchone()[0]
+        if relation is None:
+            continue
+        cursor.execute(
+            "SELECT COUNT(*) FROM pg_trigger WHERE tgrelid = %s::regclass "
+            "AND tgname LIKE 'trg_sales_rollup_%%'",
+            (f'phc."{table_name}"',),
+        )
+        if cursor.fetchone()[0] == len(_TRIGGER_EVENTS):
+            continue
+        for suffix, event, clause in _TRIGGER_EVENTS:
+            trigger = f"trg_sales_rollup_{suffix}"
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger} ON phc."{table_name}"')
+            cursor.execute(
+                f'CREATE TRIGGER {trigger} AFTER {event} ON phc."{table_name}" '
+                f"{clause} EXECUTE FUNCTION phc.{function_name}('{source}')"
+            )
+        if source not in rebuild:
+            rebuild.append(source)
+    for source in rebuild:
+        cursor.execute(
+            f"INSERT INTO {DIRTY_TABLE} (source, year, month) VALUES (%s, %s, %s) "
+            "ON CONFLICT DO NOTHING",
+            (source, _ALL_MONTHS, _ALL_MONTHS),
+        )
+        logger.info("[ROLLUP] %s: triggers attached, full rebuild queued", source)
+    return rebuild
+
+
+def queue_table_rebuild(cursor, table_name: str) -> None:
+    """Queue a whole-source rebuild after table_name was replaced (caller commits)."""
+    entry = _TRIGGERED_TABLES.get(table_name)
+    if entry is None:
+        return
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (DIRTY_TABLE,))
+    if not cursor.fetchone()[0]:
+        return  # rollups not set up yet; ensure_sales_rollups() queues the first build
+    cursor.execute(
+        f"INSERT INTO {DIRTY_TABLE} (source, year, month) VALUES (%s, %s, %s) "
+        "ON CONFLICT DO NOTHING",
+        (entry[0], _ALL_MONTHS, _ALL_MONTHS),
+    )
+
+
+def _recompute(cursor, source: str, year: int, month: int) -> None:
+    """Replace one month (or the whole source when year is 0) of both rollups."""
+    ft_table, fi_table = ROLLUP_SOURCES[source]
+    params: dict = {"source": source}
+    if year == _ALL_MONTHS:
+        scope, period = "source = %(source)s", ""
+    else:
+        scope = "source = %(source)s AND year = %(year)s AND month = %(month)s"
+        period = "AND ft.invoice_date >= %(start)s AND ft.invoice_date < %(end)s"
+        params.update(
+            year=year,
+            month=month,
+            start=date(year, month, 1),
+            end=date(year + month // 12, month % 12 + 1, 1),
+        )
+    for relation in (FT_ROLLUP, FI_ROLLUP):
+        cursor.execute(f"DELETE FROM {relation} WHERE {scope}", params)
+    if not _table_exists(cursor, ft_table):
+        return
+
+    cursor.execute(
+        f"""
+        INSERT INTO {FT_ROLLUP}
+            (source, year, month, customer_id, document_type, anulado, net_value, documents)
+        SELECT
+            %(source)s,
+            EXTRACT(YEAR FROM ft.invoice_date)::int,
+            EXTRACT(MONTH FROM ft.invoice_date)::int,
+            ft.customer_id,
+            ft.document_type,
+            ft.anulado,
+            COALESCE(SUM(ft.net_value), 0),
+            COUNT(*)
+        FROM phc."{ft_table}" ft
+        WHERE ft.invoice_date IS NOT NULL {period}
+        GROUP BY 2, 3, 4, 5, 6
+        """,
+        params,
+    )
+    if not _table_exists(cursor, fi_table):
+        return
+    cursor.execute(
+        f"""
+        INSERT INTO {FI_ROLLUP}
+            (source, year, month, cost_center, salesperson_name, document_type, anulado,
+             net_value, lines)
+        SELECT
+            %(source)s,
+            EXTRACT(YEAR FROM ft.invoice_date)::int,
+            EXTRACT(MONTH FROM ft.invoice_date)::int,
+            fi.cost_center,
+            fi.salesperson_name,
+            ft.document_type,
+            ft.anulado,
+            COALESCE(SUM(fi.net_liquid_value), 0),
+            COUNT(*)
+        FROM phc."{fi_table}" fi
+        JOIN phc."{ft_table}" ft ON ft.invoice_id = fi.invoice_id
+        WHERE ft.invoice_date IS NOT NULL {period}
+        GROUP BY 2, 3, 4, 5, 6, 7
+        """,
+        params,
+    )
+
+
+def _table_exists(cursor, table_name: str) -> bool:
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f'phc."{table_name}"',))
+    return cursor.fetchone()[0]
+
+
+def refresh_sales_rollups(cursor) -> int:
+    """Recompute the queued months (caller commits); returns how many were refreshed.
+
+    Runs in the caller's transaction, so a failure leaves the queue intact.
+    """
+    cursor.execute(f"DELETE FROM {DIRTY_TABLE} RETURNING source, year, month")
+    queued = cursor.fetchall()
+    rebuild = {source for source, year, _ in queued if year == _ALL_MONTHS}
+    months = sorted(
+        (source, year, month)
+        for source, year, month in queued
+        if source in ROLLUP_SOURCES and source not in rebuild
+    )
+    for source in sorted(rebuild & set(ROLLUP_SOURCES)):
+        _recompute(cursor, source, _ALL_MONTHS, _ALL_MONTHS)
+        logger.info("[ROLLUP] %s: rebuilt", source)
+    for source, year, month in months:
+        _recompute(cursor, source, year, month)
+    if months:
+        logger.info(
+            "[ROLLUP] %s months refreshed (%s)",
+            len(months),
+            ", ".join(f"{source} {year}-{month:02d}" for source, year, month in months[:12]),
+        )
+    return len(months) + len(rebuild)
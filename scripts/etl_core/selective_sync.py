@@ -3,9 +3,12 @@ Selective PHC to Supabase Sync
 Import only specific columns and apply filters
 """
 
+import hashlib
+import io
 import logging
 import os
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
 from pathlib import Path
 
 import psycopg2
@@ -13,6 +16,36 @@ import psycopg2.extras
 import pyodbc
 from dotenv import load_dotenv
 
+from batch_tuner import BatchTuner, ensure_tuning_table, load_batch_tuner, store_batch_tuner
+from folha_obra_match import (
+    ensure_touched_table,
+    record_table_touched,
+    record_touched_documents,
+)
+from partitions import (
+    PARTITION_INTERVAL,
+    create_partitioned_table,
+    drop_partitions_before,
+    ensure_partitions,
+    is_partitioned,
+)
+from pg_copy import encode_rows, encoders_for_columns
+from pipeline import describe_utilisation, run_pipeline
+from range_extract import (
+    DEFAULT_EXTRACT_WORKERS,
+    iter_partitioned_batches,
+    month_ranges,
+    range_predicate,
+)
+from sales_rollups import queue_table_rebuild
+from table_scheduler import run_table_dag
+from table_swap import (
+    create_shadow_table,
+    finalize_shadow_table,
+    shadow_name,
+    swap_in_shadow,
+)
+
 # Updated path: go up 2 levels from scripts/etl_core/ to project root
 BASE_DIR = Path(__file__).resolve().parents[2]
 ENV_CANDIDATES = [
@@ -32,6 +65,45 @@ else:
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+# Tables synced concurrently by the multi-table runners (each on its own connections)
+DEFAULT_MAX_WORKERS = int(os.getenv("ETL_MAX_WORKERS", "4"))
+
+# Hidden per-row content hash; upserts skip rows whose hash is unchanged
+ROW_HASH_COLUMN = "row_hash"
+
+# load_mode="copy": staging column numbering rows in COPY order, so the merge
+# keeps the last row of a duplicated key like the upsert path does
+STAGE_SEQ_COLUMN = "_stage_seq"
+
+# incremental_mode="changes": PHC last-modified columns and the re-read overlap.
+# Opt-in: tables with supports_change_mode switch to it when ETL_CHANGE_MODE is set.
+PHC_CHANGE_COLUMNS = ("usrdata", "usrhora")
+USE_CHANGE_MODE = os.getenv("ETL_CHANGE_MODE", "0").lower() in ("1", "true", "yes")
+DEFAULT_CHANGE_OVERLAP_SECONDS = int(os.getenv("ETL_CHANGE_OVERLAP_SECONDS", "60"))
+
+# Read incremental tables from SQL Server Change Tracking where it is enabled
+# (falls back to the watermark path per table when it is not)
+USE_CHANGE_TRACKING = os.getenv("ETL_CHANGE_TRACKING", "0").lower() in ("1", "true", "yes")
+
+# Remove rows deleted (or no longer matching the filters) in PHC after each
+# incremental run. Deletes are skipped when more than MAX_RATIO of the window
+# would go - that points at a bad PHC read, not at real deletions.
+DETECT_DELETES = os.getenv("ETL_DETECT_DELETES", "1").lower() in ("1", "true", "yes")
+DELETE_DETECTION_MAX_RATIO = float(os.getenv("ETL_DELETE_MAX_RATIO", "0.2"))
+
+# incremental_mode="date": re-extract only the days whose PHC checksum or
+# Supabase row-hash aggregate moved since the last sync (phc.sync_day_checksums)
+USE_DAY_CHECKSUMS = os.getenv("ETL_DAY_CHECKSUMS", "1").lower() in ("1", "true", "yes")
+
+
+def incremental_mode(config: dict) -> str:
+    """The table's incremental_mode, or "changes" when opted in through ETL_CHANGE_MODE."""
+    if config.get("incremental_mode"):
+        return config["incremental_mode"]
+    if USE_CHANGE_MODE and config.get("supports_change_mode"):
+        return "changes"
+    return "date"
+
 
 def _current_year_start_date() -> date:
     today = datetime.utcnow().date()
@@ -123,7 +195,182 @@ def get_one_year_ago_filter_fo():
     return f"pdata >= '{current_year_start}'"
 
 
+def coerce_to_date(value) -> date | None:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text_value = str(value)
+    for fmt in ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f"):
+        try:
+            return datetime.strptime(text_value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_marca_date(value) -> date | None:
+    """Parse marca field which stores dates as 'DD.MM.YYYY' string format"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text_value = str(value).strip()
+    # Return None for empty strings
+    if not text_value:
+        return None
+    # Try DD.MM.YYYY format (PHC marca field format)
+    try:
+        return datetime.strptime(text_value, "%d.%m.%Y").date()
+    except ValueError:
+        pass
+    # Fall back to standard formats
+    for fmt in (
+        "%Y-%m-%d",
+        "%Y-%m-%d %H:%M:%S",
+        "%Y-%m-%d %H:%M:%S.%f",
+        "%d/%m/%Y",
+        "%d-%m-%Y",
+    ):
+        try:
+            return datetime.strptime(text_value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def phc_change_timestamp(change_date, change_time) -> datetime | None:
+    """Combine PHC usrdata (date) + usrhora ("HH:MM:SS" text) into a timestamp."""
+    change_day = coerce_to_date(change_date)
+    if change_day is None:
+        return None
+    try:
+        change_clock = time.fromisoformat(str(change_time or "").strip()[:8])
+    except ValueError:
+        change_clock = time.min
+    return datetime.combine(change_day, change_clock)
+
+
+# ----------------------------------------------------------------------
+# Row converters - one callable per column, compiled once per table
+# ----------------------------------------------------------------------
+def _to_integer(value) -> int | None:
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(float(value))
+    except (ValueError, TypeError):
+        return None
+
+
+def _to_decimal(value) -> Decimal | None:
+    """Exact NUMERIC conversion (pyodbc already returns Decimal for money/numeric)."""
+    if value is None or isinstance(value, Decimal):
+        return value
+    try:
+        return Decimal(str(value).strip())
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+
+
+def _to_boolean(value) -> bool | None:
+    return None if value is None else bool(value)
+
+
+def _to_text(value) -> str | None:
+    if value is None:
+        return None
+    text_value = value.strip() if isinstance(value, str) else str(value).strip()
+    return text_value or None
+
+
+def _converter_for_type(col_type: str):
+    col_type = col_type.upper()
+    if "INTEGER" in col_type:
+        return _to_integer
+    if "NUMERIC" in col_type:
+        return _to_decimal
+    if "BOOLEAN" in col_type:
+        return _to_boolean
+    if "DATE" in col_type:
+        return coerce_to_date
+    return _to_text
+
+
+def _with_default(convert, default):
+    def convert_with_default(value):
+        converted = convert(value)
+        return default if converted is None else converted
+
+    return convert_with_default
+
+
+def compile_converter_plan(config: dict) -> tuple:
+    """Build the per-column converters for a TABLE_CONFIGS entry.
+
+    column_parsers override the type converter and column_defaults replace
+    NULL/empty results, so no per-cell type or table checks remain.
+    """
+    parsers = config.get("column_parsers", {})
+    defaults = config.get("column_defaults", {})
+    plan = []
+    for col, col_type in config["columns"].items():
+        convert = parsers.get(col) or _converter_for_type(col_type)
+        if col in defaults:
+            convert = _with_default(convert, defaults[col])
+        plan.append(convert)
+    return tuple(plan)
+
+
+def apply_converter_plan(plan: tuple, rows) -> list[tuple]:
+    """Clean source rows; trailing helper columns (e.g. parent_date) are ignored."""
+    return [tuple([convert(val) for convert, val in zip(plan, row)]) for row in rows]
+
+
+def row_fingerprint(row: tuple) -> str:
+    """Content hash of a clean row (stored in ROW_HASH_COLUMN)."""
+    payload = "\x1f".join("\x00" if val is None else str(val) for val in row)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def with_row_hashes(rows: list[tuple]) -> list[tuple]:
+    return [row + (row_fingerprint(row),) for row in rows]
+
+
+def _copy_text_value(value) -> str:
+    """Format a clean value for COPY ... FROM STDIN (text format)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
 # Table configurations - define exactly what you want to sync
+# load_mode: "upsert" (default) = row-by-row INSERT ... ON CONFLICT,
+#            "copy" = COPY each batch into an unlogged staging table, then merge
+# copy_format: "binary" (default, PGCOPY encoded from the declared column types) or "text"
+# column_parsers / column_defaults: bound into the converter plan (see compile_converter_plan)
+# incremental_mode: "date" (default) = re-read overlap_days of documents by document date,
+#                   "changes" = rows changed since the last synced PHC usrdata/usrhora
+# supports_change_mode: the PHC table has usrdata/usrhora; it syncs in "changes"
+#                       mode when ETL_CHANGE_MODE=1 (unless incremental_mode is set)
+# partition_column: range partition key when ETL_PARTITION_INTERVAL is set; for
+#                   BI/FI it is an extra column holding the parent's document date
+# touched_column: document key recorded in phc.sync_touched_documents for every
+#                 row written or deleted (refreshes phc.folha_obra_orcamento_match)
 TABLE_CONFIGS = {
     "cl": {
         "columns": {
@@ -144,6 +391,7 @@ TABLE_CONFIGS = {
             "inactivo": "is_inactive",  # Clearer: inactivo → is_inactive
             "vendnm": "salesperson",  # Clearer: vendnm → salesperson
         },
+        "column_defaults": {"vendnm": "IMACX"},  # Salesperson defaults to IMACX if NULL/empty
         "filter": None,  # Import ALL customers (active and inactive)
         "description": "All Customers",
         "primary_key": "customer_id",
@@ -177,12 +425,17 @@ TABLE_CONFIGS = {
             "marca": "last_delivery_date",  # PHC: marca → last_delivery_date (delivery date, stored as "DD.MM.YYYY" in VARCHAR)
             "ousrinis": "created_by",  # PHC: ousrinis → created_by (user who created the document)
         },
+        "column_parsers": {"marca": parse_marca_date},  # VARCHAR "DD.MM.YYYY" → DATE
         "filter": get_one_year_ago_filter_bo,  # Last 1 year & no zero-value supplier orders
         "description": "Work Orders/Budgets (Last 1 Year)",
         "primary_key": "document_id",
         "source_date_column": "dataobra",
         "retention_column": "document_date",
+        "partition_column": "document_date",
+        "touched_column": "document_id",
         "supports_incremental": True,
+        "load_mode": "copy",  # COPY into staging + set-based merge (see _copy_merge_rows)
+        "supports_change_mode": True,
     },
     "bi": {
         "columns": {
@@ -205,6 +458,7 @@ TABLE_CONFIGS = {
             "ref": "item_reference",  # Clearer: ref → item_reference
             "ccusto": "cost_center",  # Clearer: ccusto → cost_center
         },
+        "column_defaults": {"ccusto": "ID-Impressão Digital"},  # Cost center default
         "filter": get_one_year_ago_filter_bi,  # Last 1 year from today (dynamic)
         "description": "Document Lines (Last 1 Year)",
         "primary_key": "line_id",
@@ -212,7 +466,11 @@ TABLE_CONFIGS = {
         "parent_source_table": "bo",
         "parent_source_key_column": "bostamp",
         "parent_source_date_column": "dataobra",
+        "partition_column": "document_date",  # BO document date, copied onto each line
+        "touched_column": "document_id",
         "supports_incremental": True,
+        "load_mode": "copy",
+        "supports_change_mode": True,
     },
     "ft": {
         "columns": {
@@ -244,7 +502,10 @@ TABLE_CONFIGS = {
         "primary_key": "invoice_id",
         "source_date_column": "fdata",
         "retention_column": "invoice_date",
+        "partition_column": "invoice_date",
         "supports_incremental": True,
+        "load_mode": "copy",
+        "supports_change_mode": True,
     },
     "fo": {
         "columns": {
@@ -272,7 +533,9 @@ TABLE_CONFIGS = {
         "primary_key": "document_id",
         "source_date_column": "pdata",
         "retention_column": "document_date",
+        "partition_column": "document_date",
         "supports_incremental": True,
+        "supports_change_mode": True,
     },
     "fi": {
         "columns": {
@@ -300,7 +563,11 @@ TABLE_CONFIGS = {
         "parent_source_table": "ft",
         "parent_source_key_column": "ftstamp",
         "parent_source_date_column": "fdata",
+        "partition_column": "invoice_date",  # FT invoice date, copied onto each line
+        "touched_column": "invoice_id",  # Invoice links feed the quote matching
         "supports_incremental": True,
+        "load_mode": "copy",
+        "supports_change_mode": True,
     },
     "fl": {
         "columns": {
@@ -328,16 +595,23 @@ class SelectiveSync:
     def __init__(self):
         self.phc_conn = None
         self.supabase_conn = None
+        self._converter_plans: dict[str, tuple] = {}
+        # Partition column per table as this instance writes it (None = plain table)
+        self._partition_columns: dict[str, str | None] = {}
+
+    @staticmethod
+    def _open_phc_connection():
+        conn_str = os.getenv("MSSQL_DIRECT_CONNECTION")
+        if not conn_str or not isinstance(conn_str, str):
+            raise ValueError(
+                "Missing MSSQL_DIRECT_CONNECTION. Set it in the environment or .env file."
+            )
+        return pyodbc.connect(conn_str, timeout=30)
 
     def connect_phc(self):
         """Connect to PHC database"""
         try:
-            conn_str = os.getenv("MSSQL_DIRECT_CONNECTION")
-            if not conn_str or not isinstance(conn_str, str):
-                raise ValueError(
-                    "Missing MSSQL_DIRECT_CONNECTION. Set it in the environment or .env file."
-                )
-            self.phc_conn = pyodbc.connect(conn_str, timeout=30)
+            self.phc_conn = self._open_phc_connection()
             logger.info("[OK] Connected to PHC database")
             return True
         except Exception as e:
@@ -382,6 +656,29 @@ class SelectiveSync:
             )
             """
         )
+        # Last PHC usrdata/usrhora synced (incremental_mode="changes")
+        cursor.execute(
+            "ALTER TABLE phc.sync_watermarks ADD COLUMN IF NOT EXISTS watermark_ts TIMESTAMP"
+        )
+        # Last SQL Server change tracking version applied (ETL_CHANGE_TRACKING)
+        cursor.execute(
+            "ALTER TABLE phc.sync_watermarks ADD COLUMN IF NOT EXISTS change_version BIGINT"
+        )
+        # Per-day aggregates as of the last sync (ETL_DAY_CHECKSUMS)
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS phc.sync_day_checksums (
+                table_name TEXT NOT NULL,
+                day DATE NOT NULL,
+                phc_rows INTEGER NOT NULL,
+                phc_checksum BIGINT,
+                local_rows INTEGER NOT NULL,
+                local_hash TEXT,
+                synced_at TIMESTAMP DEFAULT NOW(),
+                PRIMARY KEY (table_name, day)
+            )
+            """
+        )
         self.supabase_conn.commit()
 
     def _get_watermark(self, table_name: str, default_value: date) -> date:
@@ -399,18 +696,32 @@ class SelectiveSync:
             return value
         return default_value
 
-    def _update_watermark(self, table_name: str, value: date) -> None:
+    def _get_change_watermark(self, table_name: str) -> datetime | None:
+        assert self.supabase_conn is not None, "Supabase connection not established"
+        cursor = self.supabase_conn.cursor()
+        cursor.execute(
+            "SELECT watermark_ts FROM phc.sync_watermarks WHERE table_name = %s",
+            (table_name,),
+        )
+        row = cursor.fetchone()
+        return row[0] if row and row[0] else None
+
+    def _update_watermark(
+        self, table_name: str, value: date, change_value: datetime | None = None
+    ) -> None:
+        """Store the date watermark; change_value (when given) sets watermark_ts too."""
         assert self.supabase_conn is not None, "Supabase connection not established"
         cursor = self.supabase_conn.cursor()
         cursor.execute(
             """
-            INSERT INTO phc.sync_watermarks (table_name, watermark, last_sync_time)
-            VALUES (%s, %s, NOW())
+            INSERT INTO phc.sync_watermarks (table_name, watermark, watermark_ts, last_sync_time)
+            VALUES (%s, %s, %s, NOW())
             ON CONFLICT (table_name) DO UPDATE
             SET watermark = EXCLUDED.watermark,
+                watermark_ts = COALESCE(EXCLUDED.watermark_ts, phc.sync_watermarks.watermark_ts),
                 last_sync_time = NOW()
             """,
-            (table_name, value),
+            (table_name, value, change_value),
         )
         self.supabase_conn.commit()
 
@@ -432,11 +743,28 @@ class SelectiveSync:
     def _retention_anchor(self, months: int) -> date:
         return _current_year_start_date()
 
+    @staticmethod
+    def _configured_partition_column(config: dict) -> str | None:
+        """The table's partition column when ETL_PARTITION_INTERVAL is set."""
+        return config.get("partition_column") if PARTITION_INTERVAL else None
+
+    @staticmethod
+    def _target_column_names(config: dict, partition_column: str | None) -> list[str]:
+        """Supabase columns written per row: the config columns, row_hash and,
+        for partitioned child tables, the parent's date."""
+        column_mappings = config.get("column_mappings", {})
+        names = [column_mappings.get(col, col) for col in config["columns"]]
+        names.append(ROW_HASH_COLUMN)
+        if partition_column and config.get("parent_source_table"):
+            names.append(partition_column)
+        return names
+
     def _ensure_target_table(self, table_name: str, config: dict) -> None:
         assert self.supabase_conn is not None, "Supabase connection not established"
         columns = config["columns"]
         column_mappings = config.get("column_mappings", {})
         primary_key = config.get("primary_key")
+        partition_column = self._configured_partition_column(config)
 
         column_defs = []
         for col, col_type in columns.items():
@@ -455,7 +783,34 @@ class SelectiveSync:
 
         cursor = self.supabase_conn.cursor()
         try:
-            cursor.execute(create_sql)
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f'phc."{table_name}"',))
+            exists = cursor.fetchone()[0]
+            if partition_column and not exists:
+                partition_defs = column_defs + [f'"{ROW_HASH_COLUMN}" TEXT']
+                if config.get("parent_source_table"):
+                    partition_defs.append(f'"{partition_column}" DATE NOT NULL')
+                create_partitioned_table(
+                    cursor, table_name, partition_defs, partition_column, primary_key
+                )
+            else:
+                cursor.execute(create_sql)
+                cursor.execute(
+                    f'ALTER TABLE phc."{table_name}" ADD COLUMN IF NOT EXISTS "{ROW_HASH_COLUMN}" TEXT'
+                )
+
+            if partition_column and not is_partitioned(cursor, table_name):
+                logger.info(
+                    "[INFO] phc.%s is not partitioned yet - the next full reload converts it",
+                    table_name,
+                )
+                partition_column = None
+            if partition_column:
+                ensure_partitions(
+                    cursor, table_name, partition_column, _current_year_start_date(), date.today()
+                )
+            if config.get("touched_column"):
+                ensure_touched_table(cursor)
+            self._partition_columns[table_name] = partition_column
             self.supabase_conn.commit()
             logger.info(f"   [OK] Table phc.{table_name} ready with PK constraint")
         except Exception as e:
@@ -463,6 +818,254 @@ class SelectiveSync:
             logger.error(f"   [ERROR] Failed to create table phc.{table_name}: {e}")
             raise
 
+    # ------------------------------------------------------------------
+    # Loader helpers
+    # ------------------------------------------------------------------
+    def _build_conflict_clause(
+        self, table_name: str, final_column_names: list[str], primary_key: str | None
+    ) -> str:
+        if not primary_key:
+            return ""
+        conflict_columns = [primary_key]
+        partition_column = self._partition_columns.get(table_name)
+        if partition_column:
+            # Partitioned tables are unique on (key, partition column)
+            conflict_columns.append(partition_column)
+        conflict_target = ", ".join(f'"{col}"' for col in conflict_columns)
+        update_columns = [col for col in final_column_names if col not in conflict_columns]
+        if update_columns:
+            update_clause = ", ".join(
+                [f'"{col}" = EXCLUDED."{col}"' for col in update_columns]
+            )
+            if ROW_HASH_COLUMN in final_column_names:
+                # Leave identical rows alone (no dead tuple, no WAL)
+                update_clause += (
+                    f' WHERE phc."{table_name}"."{ROW_HASH_COLUMN}" '
+                    f'IS DISTINCT FROM EXCLUDED."{ROW_HASH_COLUMN}"'
+                )
+            return f" ON CONFLICT ({conflict_target}) DO UPDATE SET {update_clause}"
+        # No updatable columns - just ignore conflicts
+        return f" ON CONFLICT ({conflict_target}) DO NOTHING"
+
+    @staticmethod
+    def _returning_clause(config: dict) -> str:
+        """RETURNING (inserted flag[, touched_column]) for the merge statements."""
+        touched_column = config.get("touched_column")
+        return " RETURNING (xmax = 0)" + (f', "{touched_column}"' if touched_column else "")
+
+    @staticmethod
+    def _record_touched(cursor, config: dict, written: list[tuple]) -> None:
+        """Queue the documents a merge actually changed (unchanged rows aren't returned)."""
+        if config.get("touched_column"):
+            record_touched_documents(cursor, [row[1] for row in written])
+
+    def _delete_moved_rows(
+        self, cursor, table_name: str, primary_key: str | None, source_sql: str, params=()
+    ) -> None:
+        """Partitioned tables: remove rows whose date moved them to another partition.
+
+        The (key, date) primary key would otherwise keep the old copy next to
+        the re-dated one. source_sql is a relation aliased "moved" carrying
+        the incoming key and date columns.
+        """
+        partition_column = self._partition_columns.get(table_name)
+        if not partition_column or not primary_key:
+            return
+        cursor.execute(
+            f'DELETE FROM phc."{table_name}" AS live USING {source_sql} '
+            f'WHERE live."{primary_key}" = moved."{primary_key}" '
+            f'AND live."{partition_column}" <> moved."{partition_column}"',
+            params,
+        )
+
+    def _delete_moved_rows_in_batch(
+        self,
+        cursor,
+        table_name: str,
+        primary_key: str | None,
+        final_column_names: list[str],
+        rows: list[tuple],
+    ) -> None:
+        partition_column = self._partition_columns.get(table_name)
+        if not partition_column or not primary_key or not rows:
+            return
+        pk_index = final_column_names.index(primary_key)
+        date_index = final_column_names.index(partition_column)
+        self._delete_moved_rows(
+            cursor,
+            table_name,
+            primary_key,
+            f'unnest(%s::text[], %s::date[]) AS moved("{primary_key}", "{partition_column}")',
+            ([row[pk_index] for row in rows], [row[date_index] for row in rows]),
+        )
+
+    def _build_upsert_sql(
+        self, table_name: str, final_column_names: list[str], primary_key: str | None
+    ) -> str:
+        placeholders = ",".join(["%s"] * len(final_column_names))
+        column_list_pg = ",".join([f'"{col}"' for col in final_column_names])
+        return (
+            f'INSERT INTO phc."{table_name}" ({column_list_pg}) VALUES ({placeholders})'
+            + self._build_conflict_clause(table_name, final_column_names, primary_key)
+        )
+
+    def _prepare_staging_table(self, table_name: str) -> None:
+        """(Re)create the session's staging table used by load_mode="copy".
+
+        Recreated per run so it always mirrors the current target columns. A
+        TEMP table is private to this connection, so two syncs of the same
+        table can't truncate or merge each other's batches.
+        """
+        assert self.supabase_conn is not None, "Supabase connection not established"
+        cursor = self.supabase_conn.cursor()
+        cursor.execute(f'DROP TABLE IF EXISTS pg_temp."_stage_{table_name}"')
+        cursor.execute(
+            f'CREATE TEMP TABLE "_stage_{table_name}" '
+            f'(LIKE phc."{table_name}" INCLUDING DEFAULTS, '
+            f'"{STAGE_SEQ_COLUMN}" BIGINT GENERATED ALWAYS AS IDENTITY) '
+            "ON COMMIT DELETE ROWS"
+        )
+        self.supabase_conn.commit()
+
+    def _copy_rows(
+        self,
+        cursor,
+        relation: str,
+        config: dict,
+        final_column_names: list[str],
+        rows: list[tuple],
+    ) -> None:
+        """COPY a batch into relation (binary or text, per copy_format)."""
+        column_list_pg = ",".join([f'"{col}"' for col in final_column_names])
+        if config.get("copy_format", "binary") == "binary":
+            # Trailing columns beyond the config: row_hash (TEXT) and, on
+            # partitioned child tables, the parent's date (DATE)
+            column_types = list(config["columns"].values())
+            column_types += [
+                "TEXT" if col == ROW_HASH_COLUMN else "DATE"
+                for col in final_column_names[len(column_types) :]
+            ]
+            encoders = encoders_for_columns(column_types)
+            buffer = io.BytesIO(encode_rows(encoders, rows))
+            copy_sql = f"COPY {relation} ({column_list_pg}) FROM STDIN WITH (FORMAT binary)"
+        else:
+            buffer = io.StringIO()
+            for row in rows:
+                buffer.write("\t".join(_copy_text_value(val) for val in row))
+                buffer.write("\n")
+            buffer.seek(0)
+            copy_sql = f"COPY {relation} ({column_list_pg}) FROM STDIN"
+        cursor.copy_expert(copy_sql, buffer)
+
+    def _copy_merge_rows(
+        self,
+        cursor,
+        table_name: str,
+        config: dict,
+        final_column_names: list[str],
+        rows: list[tuple],
+    ) -> list[tuple]:
+        """COPY a batch into the _stage_<table> temp table and merge it with one statement.
+
+        Returns one (inserted[, touched key]) row per row written by the merge.
+        """
+        stage = f'pg_temp."_stage_{table_name}"'
+        column_list_pg = ",".join([f'"{col}"' for col in final_column_names])
+        primary_key = config.get("primary_key")
+
+        cursor.execute(f"TRUNCATE {stage}")
+        self._copy_rows(cursor, stage, config, final_column_names, rows)
+        self._delete_moved_rows(cursor, table_name, primary_key, f"{stage} AS moved")
+
+        # DISTINCT ON keeps ON CONFLICT from touching the same row twice when
+        # the source batch carries duplicate keys; the last copied row wins,
+        # as in the upsert path.
+        if primary_key:
+            select_sql = (
+                f'SELECT DISTINCT ON ("{primary_key}") {column_list_pg} FROM {stage} '
+                f'ORDER BY "{primary_key}", "{STAGE_SEQ_COLUMN}" DESC'
+            )
+        else:
+            select_sql = f"SELECT {column_list_pg} FROM {stage}"
+        cursor.execute(
+            f'INSERT INTO phc."{table_name}" ({column_list_pg}) '
+            + select_sql
+            + self._build_conflict_clause(table_name, final_column_names, primary_key)
+            + self._returning_clause(config)
+        )
+        return cursor.fetchall()
+
+    def _load_rows(
+        self,
+        table_name: str,
+        config: dict,
+        final_column_names: list[str],
+        rows: list[tuple],
+    ) -> tuple[int, int]:
+        """Write a batch of clean rows using the table's load_mode (caller commits).
+
+        Returns (inserted, updated); the rest of the batch was unchanged.
+        """
+        assert self.supabase_conn is not None, "Supabase connection not established"
+        cursor = self.supabase_conn.cursor()
+        primary_key = config.get("primary_key")
+        if config.get("load_mode", "upsert") == "copy":
+            written = self._copy_merge_rows(
+                cursor, table_name, config, final_column_names, rows
+            )
+        else:
+            if primary_key:
+                # One multi-row statement cannot update the same key twice; last row wins
+                pk_index = final_column_names.index(primary_key)
+                rows = list({row[pk_index]: row for row in rows}.values())
+                self._delete_moved_rows_in_batch(
+                    cursor, table_name, primary_key, final_column_names, rows
+                )
+            column_list_pg = ",".join([f'"{col}"' for col in final_column_names])
+            written = psycopg2.extras.execute_values(
+                cursor,
+                f'INSERT INTO phc."{table_name}" ({column_list_pg}) VALUES %s'
+                + self._build_conflict_clause(table_name, final_column_names, primary_key)
+                + self._returning_clause(config),
+                rows,
+                page_size=len(rows),
+                fetch=True,
+            )
+        self._record_touched(cursor, config, written)
+        inserted = sum(1 for row in written if row[0])
+        return inserted, len(written) - inserted
+
+    # ------------------------------------------------------------------
+    # Batch sizing
+    # ------------------------------------------------------------------
+    def _batch_tuner(
+        self, table_name: str, fetch_rows: int = 1000, load_rows: int = 1000
+    ) -> BatchTuner:
+        """Tuner starting from the sizes learned by the table's last run."""
+        cursor = self.supabase_conn.cursor()
+        try:
+            ensure_tuning_table(cursor)
+            tuner = load_batch_tuner(cursor, table_name, fetch_rows, load_rows)
+            self.supabase_conn.commit()
+            return tuner
+        except Exception as exc:
+            self.supabase_conn.rollback()
+            logger.warning("[WARN] %s: batch tuning unavailable: %s", table_name, exc)
+            return BatchTuner(table_name, fetch_rows, load_rows)
+
+    def _store_batch_tuner(self, tuner: BatchTuner) -> None:
+        logger.info("[TUNE] %s: %s", tuner.table_name.upper(), tuner.describe())
+        if not tuner.measured:
+            return
+        try:
+            store_batch_tuner(self.supabase_conn.cursor(), tuner)
+            self.supabase_conn.commit()
+        except Exception as exc:
+            self.supabase_conn.rollback()
+            logger.warning(
+                "[WARN] %s: could not store batch sizes: %s", tuner.table_name, exc
+            )
+
     def _build_incremental_query(
         self,
         table_name: str,
@@ -512,121 +1115,119 @@ class SelectiveSync:
 
         return f"SELECT {base_select} FROM [{table_name}]", None, None
 
-    def _parse_marca_date(self, value) -> date | None:
-        """Parse marca field which stores dates as 'DD.MM.YYYY' string format"""
-        if value is None:
-            return None
-        if isinstance(value, date):
-            return value
-        if isinstance(value, datetime):
-            return value.date()
-        text_value = str(value).strip()
-        # Return None for empty strings
-        if not text_value or text_value == "":
-            return None
-        # Try DD.MM.YYYY format (PHC marca field format)
-        try:
-            return datetime.strptime(text_value, "%d.%m.%Y").date()
-        except ValueError:
-            pass
-        # Fall back to standard formats
-        for fmt in (
-            "%Y-%m-%d",
-            "%Y-%m-%d %H:%M:%S",
-            "%Y-%m-%d %H:%M:%S.%f",
-            "%d/%m/%Y",
-            "%d-%m-%Y",
-        ):
-            try:
-                return datetime.strptime(text_value, fmt).date()
-            except ValueError:
-                continue
-        return None
+    def _build_change_query(
+        self,
+        table_name: str,
+        column_names: list[str],
+        config: dict,
+        start_date_str: str,
+        change_since: datetime | None,
+        recheck_days: list[date] | None = None,
+    ) -> tuple[str, int | None, int | None, list[tuple[int, int]]]:
+        """Select rows changed in PHC since change_since (usrdata + usrhora).
+
+        Same shape as _build_incremental_query plus trailing usrdata/usrhora
+        pairs; the returned index pairs locate them for watermark tracking.
+        start_date_str still bounds the document date (retention window). With
+        no change_since (first run) only the date bound applies. recheck_days
+        (flagged by the day checksums) are read whole, stamped or not.
+        """
+        recheck = f" OR {self._day_filter(config, recheck_days)}" if recheck_days else ""
+        date_column, time_column = PHC_CHANGE_COLUMNS
+        parent_table = config.get("parent_source_table")
+
+        def changed_since(alias: str) -> str:
+            day = change_since.strftime("%Y-%m-%d")
+            clock = change_since.strftime("%H:%M:%S")
+            return (
+                f"({alias}[{date_column}] > '{day}' OR "
+                f"({alias}[{date_column}] = '{day}' AND {alias}[{time_column}] >= '{clock}'))"
+            )
 
-    def _coerce_to_date(self, value) -> date | None:
-        if value is None:
-            return None
-        if isinstance(value, date):
-            return value
-        if isinstance(value, datetime):
-            return value.date()
-        text_value = str(value)
-        for fmt in ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f"):
-            try:
-                return datetime.strptime(text_value, fmt).date()
-            except ValueError:
-                continue
-        return None
+        if parent_table:
+            parent_key = config["parent_source_key_column"]
+            parent_date_column = config["parent_source_date_column"]
+            child_select = ", ".join([f"child.[{col}]" for col in column_names])
+            conditions = [f"parent.[{parent_date_column}] >= '{start_date_str}'"]
+            if table_name == "bi":
+                conditions.append("child.[qtt] IS NOT NULL AND child.[qtt] <> 0")
+            elif table_name == "fi":
+                conditions.append(
+                    "COALESCE(CONVERT(VARCHAR(10), parent.[anulado]), '') IN ('', '0', 'N')"
+                )
+                conditions.append(
+                    "child.[etiliquido] IS NOT NULL AND child.[etiliquido] <> 0"
+                )
+            if change_since:
+                # A header edit (e.g. new document date) must re-sync its lines too
+                conditions.append(
+                    f"({changed_since('child.')} OR {changed_since('parent.')}{recheck})"
+                )
+            base = len(column_names) + 1
+            query = (
+                f"SELECT {child_select}, parent.[{parent_date_column}] AS parent_date, "
+                f"child.[{date_column}], child.[{time_column}], "
+                f"parent.[{date_column}], parent.[{time_column}] "
+                f"FROM [{table_name}] AS child "
+                f"JOIN [{parent_table}] AS parent ON parent.[{parent_key}] = child.[{parent_key}] "
+                f"WHERE {' AND '.join(conditions)}"
+            )
+            return query, None, len(column_names), [(base, base + 1), (base + 2, base + 3)]
+
+        source_date_column = config["source_date_column"]
+        base_select = ", ".join([f"[{col}]" for col in column_names])
+        conditions = [f"[{source_date_column}] >= '{start_date_str}'"]
+        if change_since:
+            conditions.append(f"({changed_since('')}{recheck})")
+        base = len(column_names)
+        query = (
+            f"SELECT {base_select}, [{date_column}], [{time_column}] "
+            f"FROM [{table_name}] WHERE {' AND '.join(conditions)}"
+        )
+        return query, column_names.index(source_date_column), None, [(base, base + 1)]
+
+    @staticmethod
+    def _max_change_timestamp(rows, change_indexes: list[tuple[int, int]]) -> datetime | None:
+        latest: datetime | None = None
+        for row in rows:
+            for date_idx, time_idx in change_indexes:
+                stamp = phc_change_timestamp(row[date_idx], row[time_idx])
+                if stamp and (latest is None or stamp > latest):
+                    latest = stamp
+        return latest
+
+    def _converter_plan(self, table_name: str, config: dict) -> tuple:
+        plan = self._converter_plans.get(table_name)
+        if plan is None:
+            plan = compile_converter_plan(config)
+            self._converter_plans[table_name] = plan
+        return plan
 
     def _prepare_clean_rows(
         self,
         table_name: str,
-        columns: dict,
-        column_names: list[str],
+        config: dict,
         rows,
-        column_mappings: dict,
         date_index: int | None,
         extra_date_index: int | None,
     ) -> tuple[list[tuple], date | None]:
-        clean_rows: list[tuple] = []
-        batch_max_date: date | None = None
-
-        for row in rows:
-            clean_row = []
-            for i, col_name in enumerate(column_names):
-                col_type = columns[col_name].upper()
-                val = row[i]
-
-                if val is None:
-                    if table_name == "cl" and col_name == "vendnm":
-                        clean_row.append("IMACX")
-                    elif table_name == "bi" and col_name == "ccusto":
-                        clean_row.append("ID-Impressão Digital")
-                    else:
-                        clean_row.append(None)
-                    continue
+        clean_rows = with_row_hashes(
+            apply_converter_plan(self._converter_plan(table_name, config), rows)
+        )
+        if self._partition_columns.get(table_name) and config.get("parent_source_table"):
+            # Partitioned child: the parent's date (trailing parent_date) is stored too
+            clean_rows = [
+                clean_row + (coerce_to_date(row[extra_date_index]),)
+                for clean_row, row in zip(clean_rows, rows)
+            ]
 
-                if "INTEGER" in col_type:
-                    try:
-                        clean_row.append(int(float(val)))
-                    except (ValueError, TypeError):
-                        clean_row.append(None)
-                elif "NUMERIC" in col_type:
-                    try:
-                        clean_row.append(float(val))
-                    except (ValueError, TypeError):
-                        clean_row.append(None)
-                elif "BOOLEAN" in col_type:
-                    clean_row.append(bool(val))
-                elif "DATE" in col_type:
-                    # Special handling for marca field (stored as VARCHAR "DD.MM.YYYY")
-                    if table_name == "bo" and col_name == "marca":
-                        parsed_date = self._parse_marca_date(val)
-                        clean_row.append(parsed_date)
-                    else:
-                        # Regular date handling
-                        parsed_date = self._coerce_to_date(val)
-                        clean_row.append(parsed_date)
-                else:
-                    str_val = str(val).strip()
-                    if table_name == "cl" and col_name == "vendnm" and not str_val:
-                        clean_row.append("IMACX")
-                    elif table_name == "bi" and col_name == "ccusto" and not str_val:
-                        clean_row.append("ID-Impressão Digital")
-                    else:
-                        clean_row.append(str_val if str_val else None)
-
-            row_date_value = None
-            if date_index is not None:
-                row_date_value = row[date_index]
-            elif extra_date_index is not None:
-                row_date_value = row[extra_date_index]
-
-            row_date = self._coerce_to_date(row_date_value)
-            if row_date and (batch_max_date is None or row_date > batch_max_date):
-                batch_max_date = row_date
-
-            clean_rows.append(tuple(clean_row))
+        batch_max_date: date | None = None
+        row_date_index = date_index if date_index is not None else extra_date_index
+        if row_date_index is not None:
+            for row in rows:
+                row_date = coerce_to_date(row[row_date_index])
+                if row_date and (batch_max_date is None or row_date > batch_max_date):
+                    batch_max_date = row_date
 
         return clean_rows, batch_max_date
 
@@ -640,7 +1241,16 @@ class SelectiveSync:
         cursor = self.supabase_conn.cursor()
 
         retention_column = config.get("retention_column")
-        if retention_column:
+        partition_column = self._partition_columns.get(table_name)
+        if partition_column:
+            # Whole periods go with DETACH/DROP; only rows in the default (or a
+            # partially expired) partition are deleted
+            drop_partitions_before(cursor, table_name, retention_start)
+            cursor.execute(
+                f'DELETE FROM phc."{table_name}" WHERE "{partition_column}" < %s',
+                (retention_start,),
+            )
+        elif retention_column:
             cursor.execute(
                 f'DELETE FROM phc."{table_name}" WHERE "{retention_column}" < %s',
                 (retention_start,),
@@ -666,14 +1276,523 @@ class SelectiveSync:
                 (retention_start,),
             )
 
+        parent_table = config.get("parent_source_table")
+        if parent_table and parent_table in TABLE_CONFIGS:
+            # Lines whose header is gone (deleted in PHC, or purged above on a
+            # partitioned table) fall out of every date-joined window, so no
+            # day count or checksum would ever see them
+            parent_key = config["parent_source_key_column"]
+            child_fk = config.get("column_mappings", {}).get(parent_key, parent_key)
+            cursor.execute(
+                f'DELETE FROM phc."{table_name}" AS child '
+                f'WHERE NOT EXISTS (SELECT 1 FROM phc."{parent_table}" AS parent '
+                f'WHERE parent."{TABLE_CONFIGS[parent_table]["primary_key"]}" = child."{child_fk}")'
+            )
+            if cursor.rowcount:
+                logger.info(
+                    "[DEL] %s: removed %s rows whose %s header is gone",
+                    table_name.upper(),
+                    cursor.rowcount,
+                    parent_table.upper(),
+                )
+
+        self.supabase_conn.commit()
+
+    # ------------------------------------------------------------------
+    # SQL Server Change Tracking
+    # ------------------------------------------------------------------
+    def _get_change_version(self, table_name: str) -> int | None:
+        assert self.supabase_conn is not None, "Supabase connection not established"
+        cursor = self.supabase_conn.cursor()
+        cursor.execute(
+            "SELECT change_version FROM phc.sync_watermarks WHERE table_name = %s",
+            (table_name,),
+        )
+        row = cursor.fetchone()
+        return row[0] if row and row[0] is not None else None
+
+    def _update_change_version(self, table_name: str, version: int) -> None:
+        assert self.supabase_conn is not None, "Supabase connection not established"
+        cursor = self.supabase_conn.cursor()
+        cursor.execute(
+            """
+            UPDATE phc.sync_watermarks
+            SET change_version = %s, last_sync_time = NOW()
+            WHERE table_name = %s
+            """,
+            (version, table_name),
+        )
+        self.supabase_conn.commit()
+
+    def _change_tracking_state(self, table_name: str, config: dict) -> dict | None:
+        """Change tracking versions for a table, or None when it is not tracked.
+
+        last_version is None when nothing was synced yet or the stored version
+        is older than the retained history (a baseline run is needed).
+        """
+        parent_table = config.get("parent_source_table")
+        phc_cursor = self.phc_conn.cursor()
+        phc_cursor.execute(
+            "SELECT LOWER(OBJECT_NAME(object_id)), CHANGE_TRACKING_MIN_VALID_VERSION(object_id) "
+            "FROM sys.change_tracking_tables WHERE object_id IN (OBJECT_ID(?), OBJECT_ID(?))",
+            (table_name, parent_table or table_name),
+        )
+        min_versions = {name: min_version for name, min_version in phc_cursor.fetchall()}
+        if table_name not in min_versions:
+            return None
+
+        phc_cursor.execute("SELECT CHANGE_TRACKING_CURRENT_VERSION()")
+        current_version = phc_cursor.fetchone()[0]
+
+        last_version = self._get_change_version(table_name)
+        if last_version is not None and any(
+            min_version is None or last_version < min_version
+            for min_version in min_versions.values()
+        ):
+            logger.warning(
+                "[WARN] %s: change version %s expired, re-baselining",
+                table_name.upper(),
+                last_version,
+            )
+            last_version = None
+
+        return {
+            "current_version": current_version,
+            "last_version": last_version,
+            "parent_tracked": bool(parent_table) and parent_table in min_versions,
+        }
+
+    @staticmethod
+    def _source_primary_key(config: dict) -> str:
+        primary_key = config["primary_key"]
+        for source_col, target_col in config.get("column_mappings", {}).items():
+            if target_col == primary_key:
+                return source_col
+        return primary_key
+
+    def _build_change_tracking_query(
+        self,
+        table_name: str,
+        column_names: list[str],
+        config: dict,
+        retention_start_str: str,
+        ct_state: dict,
+    ) -> tuple[str, int | None, int | None]:
+        """Changed keys since last_version, LEFT JOINed to their current row.
+
+        The current row comes from the normal incremental query (retention
+        window and table filters), so a key with no live row is a delete -
+        whether it was deleted in PHC or no longer qualifies. Edits to the
+        parent (BO/FT) also emit their child keys. Row layout: key, live row.
+        """
+        source_pk = self._source_primary_key(config)
+        last_version = int(ct_state["last_version"])
+
+        changed_keys = (
+            f"SELECT ct.[{source_pk}] FROM CHANGETABLE(CHANGES [{table_name}], {last_version}) AS ct"
+        )
+        if ct_state["parent_tracked"]:
+            parent_table = config["parent_source_table"]
+            parent_key = config["parent_source_key_column"]
+            changed_keys += (
+                f" UNION SELECT child.[{source_pk}] "
+                f"FROM CHANGETABLE(CHANGES [{parent_table}], {last_version}) AS pct "
+                f"JOIN [{table_name}] AS child ON child.[{parent_key}] = pct.[{parent_key}]"
+            )
+
+        live_query, date_idx, extra_date_idx = self._build_incremental_query(
+            table_name, column_names, config, retention_start_str
+        )
+        query = (
+            f"SELECT changed.[{source_pk}], live.* FROM ({changed_keys}) AS changed "
+            f"LEFT JOIN ({live_query}) AS live ON live.[{source_pk}] = changed.[{source_pk}]"
+        )
+        return query, date_idx, extra_date_idx
+
+    def _delete_keys(
+        self, cursor, table_name: str, primary_key: str, keys: list[str], config: dict | None = None
+    ) -> None:
+        touched_column = (config or {}).get("touched_column")
+        returning = f' RETURNING "{touched_column}"' if touched_column else ""
+        cursor.execute(
+            f'DELETE FROM phc."{table_name}" WHERE "{primary_key}" = ANY(%s){returning}',
+            (keys,),
+        )
+        if touched_column:
+            record_touched_documents(cursor, [row[0] for row in cursor.fetchall()])
+
+    def _run_change_tracking_for_table(
+        self,
+        table_name: str,
+        config: dict,
+        retention_months: int,
+        ct_state: dict,
+    ) -> dict:
+        """Apply the change stream (upserts + deletes) since the stored version."""
+        try:
+            columns = config["columns"]
+            column_names = list(columns.keys())
+            primary_key = config["primary_key"]
+            source_pk_idx = column_names.index(self._source_primary_key(config))
+
+            retention_start = self._retention_anchor(retention_months)
+            watermark = self._get_watermark(table_name, retention_start)
+
+            query, date_idx, extra_date_idx = self._build_change_tracking_query(
+                table_name,
+                column_names,
+                config,
+                retention_start.strftime("%Y-%m-%d"),
+                ct_state,
+            )
+            phc_cursor = self.phc_conn.cursor()
+            phc_cursor.execute(query)
+
+            final_column_names = self._target_column_names(
+                config, self._partition_columns.get(table_name)
+            )
+            if config.get("load_mode", "upsert") == "copy":
+                self._prepare_staging_table(table_name)
+
+            tuner = self._batch_tuner(table_name)
+            upserted = 0
+            inserted = 0
+            updated = 0
+            deleted = 0
+            max_date_seen: date | None = None
+
+            def transform(rows) -> tuple[list[tuple], list[str]]:
+                nonlocal max_date_seen
+                live_rows = [row[1:] for row in rows if row[1 + source_pk_idx] is not None]
+                delete_keys = [
+                    str(row[0]).strip() for row in rows if row[1 + source_pk_idx] is None
+                ]
+                clean_rows, batch_max_date = self._prepare_clean_rows(
+                    table_name, config, live_rows, date_idx, extra_date_idx
+                )
+                if batch_max_date and (max_date_seen is None or batch_max_date > max_date_seen):
+                    max_date_seen = batch_max_date
+                return clean_rows, delete_keys
+
+            def load(changes: tuple[list[tuple], list[str]]) -> None:
+                nonlocal upserted, inserted, updated, deleted
+                clean_rows, delete_keys = changes
+                for batch_inserted, batch_updated in tuner.load_in_chunks(
+                    clean_rows,
+                    lambda chunk: self._load_rows(
+                        table_name, config, final_column_names, chunk
+                    ),
+                ):
+                    inserted += batch_inserted
+                    updated += batch_updated
+                if delete_keys:
+                    self._delete_keys(
+                        self.supabase_conn.cursor(),
+                        table_name,
+                        primary_key,
+                        delete_keys,
+                        config,
+                    )
+                self.supabase_conn.commit()
+                upserted += len(clean_rows)
+                deleted += len(delete_keys)
+
+            stats = run_pipeline(tuner.fetch_batches(phc_cursor), transform, load)
+            logger.info("[PIPE] %s: %s", table_name.upper(), describe_utilisation(stats))
+            self._store_batch_tuner(tuner)
+
+            self._purge_old_rows(table_name, config, retention_start)
+            new_watermark = max(max_date_seen or watermark, watermark)
+            self._update_watermark(table_name, new_watermark)
+            self._update_change_version(table_name, ct_state["current_version"])
+
+            logger.info(
+                "[OK] %s: %s inserted, %s updated, %s unchanged, %s deleted "
+                "(change version %s -> %s)",
+                table_name.upper(),
+                inserted,
+                updated,
+                upserted - inserted - updated,
+                deleted,
+                ct_state["last_version"],
+                ct_state["current_version"],
+            )
+            return {
+                "success": True,
+                "rows": upserted,
+                "inserted": inserted,
+                "updated": updated,
+                "unchanged": upserted - inserted - updated,
+                "deleted": deleted,
+                "description": config.get("description"),
+                "watermark": new_watermark.isoformat(),
+                "change_version": ct_state["current_version"],
+            }
+
+        except Exception as exc:
+            logger.error(
+                "[ERROR] Change tracking sync failed for %s: %s", table_name.upper(), exc
+            )
+            if self.supabase_conn:
+                self.supabase_conn.rollback()
+            return {
+                "success": False,
+                "rows": 0,
+                "description": config.get("description"),
+                "error": str(exc),
+            }
+
+    # ------------------------------------------------------------------
+    # Delete detection
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _local_window_source(table_name: str, config: dict) -> tuple[str, str] | None:
+        """FROM clause (aliased "child") and document-date expression in Supabase.
+
+        BI/FI take the date from their parent, same as retention. Lines whose
+        header is gone have no date and are removed by _purge_old_rows.
+        """
+        retention_column = config.get("retention_column")
+        parent_table = config.get("parent_source_table")
+        if retention_column:
+            return f'phc."{table_name}" AS child', f'child."{retention_column}"'
+        if parent_table and parent_table in TABLE_CONFIGS:
+            parent_config = TABLE_CONFIGS[parent_table]
+            parent_key = config["parent_source_key_column"]
+            child_fk = config.get("column_mappings", {}).get(parent_key, parent_key)
+            return (
+                f'phc."{table_name}" AS child JOIN phc."{parent_table}" AS parent '
+                f'ON parent."{parent_config["primary_key"]}" = child."{child_fk}"',
+                f'parent."{parent_config["retention_column"]}"',
+            )
+        return None
+
+    def _local_window_keys(
+        self, table_name: str, config: dict, days: list[date]
+    ) -> set[str] | None:
+        """Primary keys in Supabase whose document date is one of days."""
+        source = self._local_window_source(table_name, config)
+        if source is None:
+            return None
+        from_sql, date_expr = source
+        cursor = self.supabase_conn.cursor()
+        cursor.execute(
+            f'SELECT child."{config["primary_key"]}" FROM {from_sql} '
+            f"WHERE {date_expr} = ANY(%s::date[])",
+            (days,),
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+    def _local_day_counts(
+        self, table_name: str, config: dict, start_date: date
+    ) -> dict[date, int] | None:
+        """Rows per document day in Supabase since start_date."""
+        source = self._local_window_source(table_name, config)
+        if source is None:
+            return None
+        from_sql, date_expr = source
+        cursor = self.supabase_conn.cursor()
+        cursor.execute(
+            f"SELECT {date_expr}, COUNT(*) FROM {from_sql} "
+            f"WHERE {date_expr} >= %s GROUP BY {date_expr}",
+            (start_date,),
+        )
+        return dict(cursor.fetchall())
+
+    def _phc_day_counts(self, window_query: str, config: dict) -> dict[date, int]:
+        """Rows per document day returned by the PHC window query."""
+        date_column = (
+            "parent_date" if config.get("parent_source_table") else config["source_date_column"]
+        )
+        phc_cursor = self.phc_conn.cursor()
+        phc_cursor.execute(
+            f"SELECT CAST(w.[{date_column}] AS DATE), COUNT(*) "
+            f"FROM ({window_query}) AS w GROUP BY CAST(w.[{date_column}] AS DATE)"
+        )
+        return {
+            coerce_to_date(day): row_count
+            for day, row_count in phc_cursor.fetchall()
+            if day is not None
+        }
+
+    def _delete_missing_rows(
+        self,
+        table_name: str,
+        column_names: list[str],
+        config: dict,
+        start_date: date,
+    ) -> int:
+        """Delete rows in the window that PHC no longer returns.
+
+        Runs after the window's rows were loaded, so Supabase holds every
+        PHC row of each day plus any orphans: one count-per-day query on each
+        side finds the days with orphans. Keys are then read only for those
+        days - from PHC through the incremental query (wrapped in a keys-only
+        SELECT, so filters like anulado apply) - diffed with a hash set and
+        the orphans removed in one statement.
+        """
+        local_counts = self._local_day_counts(table_name, config, start_date)
+        if not local_counts:
+            return 0
+
+        window_query, _, _ = self._build_incremental_query(
+            table_name, column_names, config, start_date.strftime("%Y-%m-%d")
+        )
+        phc_counts = self._phc_day_counts(window_query, config)
+        days = sorted(
+            day for day, row_count in local_counts.items() if row_count > phc_counts.get(day, 0)
+        )
+        if not days:
+            return 0
+
+        local_keys = self._local_window_keys(table_name, config, days)
+        source_pk = self._source_primary_key(config)
+        phc_cursor = self.phc_conn.cursor()
+        phc_cursor.execute(
+            f"SELECT w.[{source_pk}] FROM ({window_query} AND ({self._day_filter(config, days)})) AS w"
+        )
+        phc_keys = set()
+        while True:
+            rows = phc_cursor.fetchmany(10000)
+            if not rows:
+                break
+            phc_keys.update(str(row[0]).strip() for row in rows if row[0] is not None)
+
+        orphans = list(local_keys - phc_keys)
+        if not orphans:
+            return 0
+        window_rows = sum(local_counts.values())
+        if len(orphans) > max(50, DELETE_DETECTION_MAX_RATIO * window_rows):
+            logger.warning(
+                "[WARN] %s: %s of %s rows missing in PHC since %s - not deleting",
+                table_name.upper(),
+                len(orphans),
+                window_rows,
+                start_date,
+            )
+            return 0
+
+        self._delete_keys(
+            self.supabase_conn.cursor(), table_name, config["primary_key"], orphans, config
+        )
+        self.supabase_conn.commit()
+        logger.info(
+            "[DEL] %s: removed %s rows no longer in PHC (%s days checked since %s)",
+            table_name.upper(),
+            len(orphans),
+            len(days),
+            start_date,
+        )
+        return len(orphans)
+
+    # ------------------------------------------------------------------
+    # Day checksums
+    # ------------------------------------------------------------------
+    def _phc_day_aggregates(
+        self, window_query: str, column_names: list[str], config: dict
+    ) -> dict[date, tuple[int, int | None]]:
+        """Row count + CHECKSUM_AGG(BINARY_CHECKSUM(...)) per document day in PHC."""
+        date_column = (
+            "parent_date" if config.get("parent_source_table") else config["source_date_column"]
+        )
+        checksum_columns = ", ".join(f"w.[{col}]" for col in column_names)
+        phc_cursor = self.phc_conn.cursor()
+        phc_cursor.execute(
+            f"SELECT CAST(w.[{date_column}] AS DATE), COUNT(*), "
+            f"CHECKSUM_AGG(BINARY_CHECKSUM({checksum_columns})) "
+            f"FROM ({window_query}) AS w GROUP BY CAST(w.[{date_column}] AS DATE)"
+        )
+        return {
+            coerce_to_date(day): (row_count, checksum)
+            for day, row_count, checksum in phc_cursor.fetchall()
+            if day is not None
+        }
+
+    def _local_day_aggregates(
+        self, table_name: str, config: dict, start_date: date
+    ) -> dict[date, tuple[int, str | None]]:
+        """Row count + md5 over the sorted row_hash values per document day in Supabase."""
+        from_sql, date_expr = self._local_window_source(table_name, config)
+        cursor = self.supabase_conn.cursor()
+        cursor.execute(
+            f"SELECT {date_expr}, COUNT(*), "
+            f'md5(string_agg(child."{ROW_HASH_COLUMN}", \'\' ORDER BY child."{ROW_HASH_COLUMN}")) '
+            f"FROM {from_sql} WHERE {date_expr} >= %s GROUP BY {date_expr}",
+            (start_date,),
+        )
+        return {day: (row_count, digest) for day, row_count, digest in cursor.fetchall()}
+
+    def _changed_days(
+        self,
+        table_name: str,
+        start_date: date,
+        phc_days: dict,
+        local_days: dict,
+    ) -> list[date]:
+        """Days whose PHC or Supabase aggregate differs from the last stored sync.
+
+        PHC's BINARY_CHECKSUM and the Postgres row_hash digest cannot be
+        compared with each other, so each side is compared with its own value
+        recorded right after the previous sync of that day.
+        """
+        cursor = self.supabase_conn.cursor()
+        cursor.execute(
+            """
+            SELECT day, phc_rows, phc_checksum, local_rows, local_hash
+            FROM phc.sync_day_checksums
+            WHERE table_name = %s AND day >= %s
+            """,
+            (table_name, start_date),
+        )
+        stored = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+        return sorted(
+            day
+            for day, phc_aggregate in phc_days.items()
+            if stored.get(day) != (*phc_aggregate, *local_days.get(day, (0, None)))
+        )
+
+    def _store_day_checksums(
+        self,
+        table_name: str,
+        config: dict,
+        start_date: date,
+        phc_days: dict,
+    ) -> None:
+        local_days = self._local_day_aggregates(table_name, config, start_date)
+        cursor = self.supabase_conn.cursor()
+        cursor.execute(
+            "DELETE FROM phc.sync_day_checksums WHERE table_name = %s AND day >= %s",
+            (table_name, start_date),
+        )
+        psycopg2.extras.execute_values(
+            cursor,
+            "INSERT INTO phc.sync_day_checksums "
+            "(table_name, day, phc_rows, phc_checksum, local_rows, local_hash) VALUES %s",
+            [
+                (table_name, day, phc_rows, phc_checksum, *local_days.get(day, (0, None)))
+                for day, (phc_rows, phc_checksum) in phc_days.items()
+            ],
+        )
         self.supabase_conn.commit()
 
+    @staticmethod
+    def _day_filter(config: dict, days: list[date]) -> str:
+        """T-SQL predicate restricting the incremental query to whole days."""
+        if config.get("parent_source_table"):
+            column = f"parent.[{config['parent_source_date_column']}]"
+        else:
+            column = f"[{config['source_date_column']}]"
+        return " OR ".join(
+            f"({range_predicate(column, day, day + timedelta(days=1))})" for day in days
+        )
+
     def _run_incremental_for_table(
         self,
         table_name: str,
         config: dict,
         overlap_days: int,
         retention_months: int,
+        overlap_seconds: int = DEFAULT_CHANGE_OVERLAP_SECONDS,
     ) -> dict:
         logger.info(
             "[SYNC] Incremental sync for %s (%s)",
@@ -684,111 +1803,204 @@ class SelectiveSync:
         try:
             self._ensure_target_table(table_name, config)
 
+            ct_state = None
+            if USE_CHANGE_TRACKING and config.get("supports_incremental", False):
+                ct_state = self._change_tracking_state(table_name, config)
+                if ct_state is None:
+                    logger.info(
+                        "[INFO] %s: change tracking not enabled, using watermarks",
+                        table_name.upper(),
+                    )
+                elif ct_state["last_version"] is not None:
+                    return self._run_change_tracking_for_table(
+                        table_name, config, retention_months, ct_state
+                    )
+
             columns = config["columns"]
             column_names = list(columns.keys())
-            column_mappings = config.get("column_mappings", {})
-            primary_key = config.get("primary_key")
 
             retention_start = self._retention_anchor(retention_months)
 
             watermark = retention_start
             start_date = None
             start_date_str = None
+            checksum_start = None
+            change_mode = (
+                config.get("supports_incremental", False)
+                and incremental_mode(config) == "changes"
+            )
+            change_watermark: datetime | None = None
+            change_since: datetime | None = None
 
             if config.get("supports_incremental", False):
                 watermark = self._get_watermark(table_name, retention_start)
                 start_date = max(
                     retention_start, watermark - timedelta(days=overlap_days)
                 )
+                checksum_start = start_date
+                if change_mode:
+                    change_watermark = self._get_change_watermark(table_name)
+                    if change_watermark:
+                        # Edits to any document still inside retention are picked up
+                        change_since = change_watermark - timedelta(seconds=overlap_seconds)
+                        start_date = retention_start
                 start_date_str = start_date.strftime("%Y-%m-%d")
 
-            query, date_idx, extra_date_idx = self._build_incremental_query(
-                table_name,
-                column_names,
-                config,
-                start_date_str,
-            )
+            phc_days = None
+            changed_days = None
+            skip_extract = False
+            if USE_DAY_CHECKSUMS and checksum_start:
+                # Change mode compares the recent date window too: it catches
+                # deletes and edits that did not stamp usrdata/usrhora
+                checksum_query, _, _ = self._build_incremental_query(
+                    table_name,
+                    column_names,
+                    config,
+                    checksum_start.strftime("%Y-%m-%d"),
+                )
+                phc_days = self._phc_day_aggregates(checksum_query, column_names, config)
+                local_days = self._local_day_aggregates(table_name, config, checksum_start)
+                changed_days = self._changed_days(
+                    table_name, checksum_start, phc_days, local_days
+                )
+                logger.info(
+                    "[SYNC] %s: %s of %s days changed since %s",
+                    table_name.upper(),
+                    len(changed_days),
+                    len(phc_days),
+                    checksum_start,
+                )
 
-            phc_cursor = self.phc_conn.cursor()
-            phc_cursor.execute(query)
+            change_indexes: list[tuple[int, int]] = []
+            if change_mode:
+                query, date_idx, extra_date_idx, change_indexes = self._build_change_query(
+                    table_name,
+                    column_names,
+                    config,
+                    start_date_str,
+                    change_since,
+                    changed_days,
+                )
+            else:
+                query, date_idx, extra_date_idx = self._build_incremental_query(
+                    table_name,
+                    column_names,
+                    config,
+                    start_date_str,
+                )
+                if changed_days is not None:
+                    if not changed_days:
+                        skip_extract = True
+                    elif len(changed_days) < len(phc_days):
+                        query += f" AND ({self._day_filter(config, changed_days)})"
 
-            final_column_names = [column_mappings.get(col, col) for col in column_names]
-            placeholders = ",".join(["%s"] * len(final_column_names))
-            column_list_pg = ",".join([f'"{col}"' for col in final_column_names])
+            phc_cursor = self.phc_conn.cursor()
+            if not skip_extract:
+                phc_cursor.execute(query)
 
-            update_columns = [col for col in final_column_names if col != primary_key]
-            if primary_key:
-                if update_columns:
-                    update_clause = ", ".join(
-                        [f'"{col}" = EXCLUDED."{col}"' for col in update_columns]
-                    )
-                    insert_sql = (
-                        f'INSERT INTO phc."{table_name}" ({column_list_pg}) '
-                        f"VALUES ({placeholders}) "
-                        f'ON CONFLICT ("{primary_key}") DO UPDATE SET {update_clause}'
-                    )
-                else:
-                    # No special handling needed - all tables use PK for DO NOTHING
-                    insert_sql = (
-                        f'INSERT INTO phc."{table_name}" ({column_list_pg}) '
-                        f"VALUES ({placeholders}) "
-                        f'ON CONFLICT ("{primary_key}") DO NOTHING'
-                    )
-            else:
-                insert_sql = f'INSERT INTO phc."{table_name}" ({column_list_pg}) VALUES ({placeholders})'
+            final_column_names = self._target_column_names(
+                config, self._partition_columns.get(table_name)
+            )
+            if config.get("load_mode", "upsert") == "copy":
+                self._prepare_staging_table(table_name)
 
-            batch_size = 1000
+            tuner = self._batch_tuner(table_name)
             total_rows = 0
+            inserted = 0
+            updated = 0
             max_date_seen: date | None = None
+            max_change_seen: datetime | None = None
 
-            while True:
-                rows = phc_cursor.fetchmany(batch_size)
-                if not rows:
-                    break
+            def transform(rows) -> list[tuple]:
+                nonlocal max_date_seen, max_change_seen
+                if change_indexes:
+                    batch_max_change = self._max_change_timestamp(rows, change_indexes)
+                    if batch_max_change and (
+                        max_change_seen is None or batch_max_change > max_change_seen
+                    ):
+                        max_change_seen = batch_max_change
 
                 clean_rows, batch_max_date = self._prepare_clean_rows(
-                    table_name,
-                    columns,
-                    column_names,
-                    rows,
-                    column_mappings,
-                    date_idx,
-                    extra_date_idx,
+                    table_name, config, rows, date_idx, extra_date_idx
                 )
+                if batch_max_date:
+                    if max_date_seen is None or batch_max_date > max_date_seen:
+                        max_date_seen = batch_max_date
+                return clean_rows
 
+            def load(clean_rows: list[tuple]) -> None:
+                nonlocal total_rows, inserted, updated
                 if not clean_rows:
-                    continue
-
-                supabase_cursor = self.supabase_conn.cursor()
-                supabase_cursor.executemany(insert_sql, clean_rows)
+                    return
+                for batch_inserted, batch_updated in tuner.load_in_chunks(
+                    clean_rows,
+                    lambda chunk: self._load_rows(
+                        table_name, config, final_column_names, chunk
+                    ),
+                ):
+                    inserted += batch_inserted
+                    updated += batch_updated
                 self.supabase_conn.commit()
-
                 total_rows += len(clean_rows)
 
-                if batch_max_date:
-                    if max_date_seen is None or batch_max_date > max_date_seen:
-                        max_date_seen = batch_max_date
+            if skip_extract:
+                batches = iter(())
+            else:
+                batches = tuner.fetch_batches(phc_cursor)
+            stats = run_pipeline(batches, transform, load)
+            logger.info("[PIPE] %s: %s", table_name.upper(), describe_utilisation(stats))
+            self._store_batch_tuner(tuner)
+
+            deleted = 0
+            if DETECT_DELETES and checksum_start:
+                # Only the recent date window, also in change mode: diffing the
+                # whole retention year every run is run_reconcile.py's job
+                deleted = self._delete_missing_rows(
+                    table_name, column_names, config, checksum_start
+                )
+
+            if phc_days is not None:
+                self._store_day_checksums(table_name, config, checksum_start, phc_days)
 
             self._purge_old_rows(table_name, config, retention_start)
 
+            new_change_watermark = max_change_seen or change_watermark
             if config.get("supports_incremental", False):
-                new_watermark = max_date_seen or watermark
-                self._update_watermark(table_name, new_watermark)
+                # Skipped or partial extracts see fewer days; never move the watermark back
+                new_watermark = max(max_date_seen or watermark, watermark)
+                self._update_watermark(table_name, new_watermark, new_change_watermark)
+                if ct_state:
+                    # Baseline done: later runs read the change stream from here
+                    self._update_change_version(table_name, ct_state["current_version"])
 
             logger.info(
-                "[OK] %s: %s rows processed (watermark=%s)",
+                "[OK] %s: %s rows processed - %s inserted, %s updated, %s unchanged "
+                "(watermark=%s%s)",
                 table_name.upper(),
                 total_rows,
+                inserted,
+                updated,
+                total_rows - inserted - updated,
                 max_date_seen.isoformat() if max_date_seen else watermark.isoformat(),
+                f", changed since {change_since.isoformat(sep=' ')}" if change_since else "",
             )
 
-            return {
+            result = {
                 "success": True,
                 "rows": total_rows,
+                "inserted": inserted,
+                "updated": updated,
+                "unchanged": total_rows - inserted - updated,
+                "deleted": deleted,
                 "description": config.get("description"),
                 "watermark": (max_date_seen or watermark).isoformat(),
                 "query_start": start_date_str,
             }
+            if change_mode:
+                result["change_watermark"] = (
+                    new_change_watermark.isoformat(sep=" ") if new_change_watermark else None
+                )
+            return result
 
         except Exception as exc:
             logger.error(
@@ -803,6 +2015,56 @@ class SelectiveSync:
                 "error": str(exc),
             }
 
+    # ------------------------------------------------------------------
+    # Multi-table scheduling
+    # ------------------------------------------------------------------
+    def _table_dependencies(self, table_names: list[str]) -> dict[str, set[str]]:
+        """Child tables (bi, fi) wait for their parent_source_table."""
+        dependencies = {}
+        for table_name in table_names:
+            parent = TABLE_CONFIGS.get(table_name, {}).get("parent_source_table")
+            dependencies[table_name] = {parent} if parent else set()
+        return dependencies
+
+    def _run_tables_in_parallel(
+        self, table_names: list[str], run_one, max_workers: int | None = None
+    ) -> dict:
+        """Run run_one(worker, table_name, config) per table via the DAG scheduler.
+
+        Each table gets its own SelectiveSync with dedicated PHC and Supabase
+        connections, so the result dicts keep the same shape as sequential runs.
+        """
+
+        def run_table(table_name: str) -> dict:
+            config = TABLE_CONFIGS[table_name]
+            worker = SelectiveSync()
+            try:
+                if not worker.connect_phc() or not worker.connect_supabase():
+                    return {
+                        "success": False,
+                        "rows": 0,
+                        "description": config.get("description"),
+                        "error": "Database connection failed",
+                    }
+                return run_one(worker, table_name, config)
+            finally:
+                worker.close_connections()
+
+        workers = max_workers or DEFAULT_MAX_WORKERS
+        if table_names:
+            logger.info(
+                "[SYNC] Running %s tables with up to %s workers",
+                len(table_names),
+                workers,
+            )
+        return run_table_dag(
+            table_names, self._table_dependencies(table_names), run_table, workers
+        )
+
+    @staticmethod
+    def _in_table_order(results: dict, table_names: list[str]) -> dict:
+        return {name: results[name] for name in table_names if name in results}
+
     def sync_fast_bo_bi_watermarked(
         self, overlap_days: int = 3, retention_months: int = 12
     ) -> dict:
@@ -847,7 +2109,10 @@ class SelectiveSync:
             self.close_connections()
 
     def sync_fast_all_tables_3days(
-        self, overlap_days: int = 3, retention_months: int = 12
+        self,
+        overlap_days: int = 3,
+        retention_months: int = 12,
+        max_workers: int | None = None,
     ) -> dict:
         """Run a fast incremental sync for ALL tables (CL, BO, BI, FT, FO, FI, FL) using watermarks."""
         logger.info(
@@ -861,7 +2126,9 @@ class SelectiveSync:
         try:
             self._ensure_watermark_table()
             results = {}
-            for table_name in ("cl", "bo", "bi", "ft", "fo", "fi", "fl"):
+            to_sync = []
+            table_names = ["cl", "bo", "bi", "ft", "fo", "fi", "fl"]
+            for table_name in table_names:
                 config = TABLE_CONFIGS.get(table_name)
                 if not config:
                     logger.warning(
@@ -891,13 +2158,18 @@ class SelectiveSync:
                     }
                     continue
 
-                results[table_name] = self._run_incremental_for_table(
-                    table_name,
-                    config,
-                    overlap_days,
-                    retention_months,
+                to_sync.append(table_name)
+
+            results.update(
+                self._run_tables_in_parallel(
+                    to_sync,
+                    lambda worker, name, cfg: worker._run_incremental_for_table(
+                        name, cfg, overlap_days, retention_months
+                    ),
+                    max_workers,
                 )
-            return results
+            )
+            return self._in_table_order(results, table_names)
         finally:
             self.close_connections()
 
@@ -1046,7 +2318,6 @@ class SelectiveSync:
 
             columns = config["columns"]
             column_names = list(columns.keys())
-            column_mappings = config.get("column_mappings", {})
             primary_key = config.get("primary_key")
 
             # Today at 00:00:00 (local system time)
@@ -1065,86 +2336,43 @@ class SelectiveSync:
             phc_cursor = self.phc_conn.cursor()
             phc_cursor.execute(query)
 
-            final_column_names = [column_mappings.get(col, col) for col in column_names]
-            placeholders = ",".join(["%s"] * len(final_column_names))
-            column_list_pg = ",".join([f'"{col}"' for col in final_column_names])
-
-            update_columns = [col for col in final_column_names if col != primary_key]
-            if primary_key:
-                if update_columns:
-                    update_clause = ", ".join(
-                        [f'"{col}" = EXCLUDED."{col}"' for col in update_columns]
-                    )
-                    insert_sql = (
-                        f'INSERT INTO phc."{table_name}" ({column_list_pg}) '
-                        f"VALUES ({placeholders}) "
-                        f'ON CONFLICT ("{primary_key}") DO UPDATE SET {update_clause}'
-                    )
-                else:
-                    # No special handling needed - all tables use PK for DO NOTHING
-                    insert_sql = (
-                        f'INSERT INTO phc."{table_name}" ({column_list_pg}) '
-                        f"VALUES ({placeholders}) "
-                        f'ON CONFLICT ("{primary_key}") DO NOTHING'
-                    )
-            else:
-                insert_sql = (
-                    f'INSERT INTO phc."{table_name}" ({column_list_pg}) '
-                    f"VALUES ({placeholders})"
-                )
+            final_column_names = self._target_column_names(
+                config, self._partition_columns.get(table_name)
+            )
+            insert_sql = self._build_upsert_sql(
+                table_name, final_column_names, primary_key
+            )
 
             supabase_cursor = self.supabase_conn.cursor()
+            tuner = self._batch_tuner(table_name, fetch_rows=5000)
             row_count = 0
+            touched_index = (
+                final_column_names.index(config["touched_column"])
+                if config.get("touched_column")
+                else None
+            )
 
-            while True:
-                rows = phc_cursor.fetchmany(5000)
-                if not rows:
-                    break
-
-                batch = []
-                for row in rows:
-                    processed_row = []
-                    for i, value in enumerate(row):
-                        # Skip the extra_date_idx column - it's only used for filtering, not insertion
-                        if extra_date_idx is not None and i == extra_date_idx:
-                            continue
-                        if i == date_idx:
-                            if value:
-                                if isinstance(value, datetime):
-                                    processed_row.append(value.strftime("%Y-%m-%d"))
-                                elif isinstance(value, date):
-                                    processed_row.append(value.strftime("%Y-%m-%d"))
-                                else:
-                                    processed_row.append(value)
-                            else:
-                                processed_row.append(None)
-                        else:
-                            # Special handling for marca field (stored as VARCHAR "DD.MM.YYYY")
-                            if (
-                                table_name == "bo"
-                                and i < len(column_names)
-                                and column_names[i] == "marca"
-                            ):
-                                if value:
-                                    parsed_date = self._parse_marca_date(value)
-                                    processed_row.append(
-                                        parsed_date.strftime("%Y-%m-%d")
-                                        if parsed_date
-                                        else None
-                                    )
-                                else:
-                                    processed_row.append(None)
-                            else:
-                                processed_row.append(value)
-                    batch.append(tuple(processed_row))
-
-                if batch:
-                    psycopg2.extras.execute_batch(
-                        supabase_cursor, insert_sql, batch, page_size=1000
+            def write(chunk: list[tuple]) -> None:
+                self._delete_moved_rows_in_batch(
+                    supabase_cursor, table_name, primary_key, final_column_names, chunk
+                )
+                psycopg2.extras.execute_batch(
+                    supabase_cursor, insert_sql, chunk, page_size=len(chunk)
+                )
+                if touched_index is not None:
+                    record_touched_documents(
+                        supabase_cursor, [row[touched_index] for row in chunk]
                     )
-                    row_count += len(batch)
+
+            for rows in tuner.fetch_batches(phc_cursor):
+                batch, _ = self._prepare_clean_rows(
+                    table_name, config, rows, date_idx, extra_date_idx
+                )
+                tuner.load_in_chunks(batch, write)
+                row_count += len(batch)
 
             self.supabase_conn.commit()
+            self._store_batch_tuner(tuner)
 
             # Update watermark
             self._update_watermark(table_name, datetime.now())
@@ -1172,16 +2400,22 @@ class SelectiveSync:
                 "description": config.get("description"),
             }
 
-    def sync_incremental_year(self, overlap_days: int = 3, retention_months: int = 12):
+    def sync_incremental_year(
+        self,
+        overlap_days: int = 3,
+        retention_months: int = 12,
+        max_workers: int | None = None,
+    ):
         """Incremental sync for the current year"""
         if not self.connect_phc() or not self.connect_supabase():
             return {}
 
         try:
             self._ensure_watermark_table()
-            tables = ["cl", "bo", "bi", "ft", "fo", "fi", "fl"]
+            table_names = ["cl", "bo", "bi", "ft", "fo", "fi", "fl"]
             results = {}
-            for table_name in tables:
+            to_sync = []
+            for table_name in table_names:
                 config = TABLE_CONFIGS.get(table_name)
                 if not config:
                     continue
@@ -1208,16 +2442,80 @@ class SelectiveSync:
                     }
                     continue
 
-                results[table_name] = self._run_incremental_for_table(
-                    table_name,
-                    config,
-                    overlap_days,
-                    retention_months,
+                to_sync.append(table_name)
+
+            results.update(
+                self._run_tables_in_parallel(
+                    to_sync,
+                    lambda worker, name, cfg: worker._run_incremental_for_table(
+                        name, cfg, overlap_days, retention_months
+                    ),
+                    max_workers,
                 )
-            return results
+            )
+            return self._in_table_order(results, table_names)
         finally:
             self.close_connections()
 
+    def _partition_queries(
+        self, table_name: str, select_sql: str, filter_condition: str | None, config: dict
+    ) -> list[str]:
+        """Split a full-reload query into monthly ranges of its document date.
+
+        Child tables (BI/FI) are split by their parent's date; a final range
+        picks up rows without a date (or without a parent) so the partitions
+        cover exactly the rows of the original query. Returns the single
+        unsplit query when the table has no date column or fits in one month.
+        """
+        source_date_column = config.get("source_date_column")
+        parent_table = config.get("parent_source_table")
+        where = f"({filter_condition})" if filter_condition else "1 = 1"
+        query = select_sql if not filter_condition else f"{select_sql} WHERE {filter_condition}"
+
+        phc_cursor = self.phc_conn.cursor()
+        if parent_table:
+            parent_key = config["parent_source_key_column"]
+            parent_date = config["parent_source_date_column"]
+            phc_cursor.execute(
+                f"SELECT MIN([{parent_date}]), MAX([{parent_date}]) FROM [{parent_table}] "
+                f"WHERE [{parent_key}] IN (SELECT [{parent_key}] FROM [{table_name}] WHERE {where})"
+            )
+        elif source_date_column:
+            phc_cursor.execute(
+                f"SELECT MIN([{source_date_column}]), MAX([{source_date_column}]) "
+                f"FROM [{table_name}] WHERE {where}"
+            )
+        else:
+            return [query]
+
+        first, last = phc_cursor.fetchone()
+        first, last = coerce_to_date(first), coerce_to_date(last)
+        if first is None or last is None:
+            return [query]
+        ranges = month_ranges(first, last)
+        if len(ranges) < 2:
+            return [query]
+
+        if parent_table:
+            predicates = [
+                f"[{parent_key}] IN (SELECT [{parent_key}] FROM [{parent_table}] "
+                f"WHERE {range_predicate(f'[{parent_date}]', start, end)})"
+                for start, end in ranges
+            ]
+            predicates.append(
+                f"([{parent_key}] IS NULL OR [{parent_key}] NOT IN (SELECT [{parent_key}] "
+                f"FROM [{parent_table}] WHERE [{parent_date}] IS NOT NULL "
+                f"AND [{parent_key}] IS NOT NULL))"
+            )
+        else:
+            predicates = [
+                range_predicate(f"[{source_date_column}]", start, end)
+                for start, end in ranges
+            ]
+            predicates.append(f"[{source_date_column}] IS NULL")
+
+        return [f"{select_sql} WHERE {where} AND {predicate}" for predicate in predicates]
+
     def sync_table_selective(self, table_name, config):
         """Sync table with selective columns and filtering"""
         try:
@@ -1238,29 +2536,58 @@ class SelectiveSync:
             for col, col_type in columns.items():
                 final_col_name = column_mappings.get(col, col)
                 column_defs.append(f'"{final_col_name}" {col_type}')
+            column_defs.append(f'"{ROW_HASH_COLUMN}" TEXT')
 
-            # Add primary key constraint if defined
+            # Primary key and indexes are added after the bulk load
             primary_key = config.get("primary_key")
-            if primary_key:
-                column_defs.append(f'PRIMARY KEY ("{primary_key}")')
 
-            create_sql = f'''
-                CREATE TABLE IF NOT EXISTS phc."{table_name}" (
-                    {", ".join(column_defs)}
-                )
-            '''
+            # ETL_PARTITION_INTERVAL: the shadow (and so the new live table) is partitioned
+            partition_column = self._configured_partition_column(config)
+            parent_table = config.get("parent_source_table")
+            if partition_column and parent_table:
+                column_defs.append(f'"{partition_column}" DATE')
 
-            # Drop and recreate table (to handle column name changes)
-            supabase_cursor.execute(f'DROP TABLE IF EXISTS phc."{table_name}" CASCADE')
-            supabase_cursor.execute(create_sql)
+            # Load into a shadow table; the live table stays readable until the swap
+            shadow_table = create_shadow_table(
+                supabase_cursor, table_name, column_defs, partition_column
+            )
+            if partition_column:
+                ensure_partitions(
+                    supabase_cursor,
+                    shadow_table,
+                    partition_column,
+                    _current_year_start_date(),
+                    date.today(),
+                )
             self.supabase_conn.commit()
+            self._partition_columns[table_name] = partition_column
+
+            logger.info(f"   [OK] Shadow table ready ({shadow_table})")
 
-            logger.info(f"   [OK] Table ready (recreated)")
+            final_column_names = self._target_column_names(config, partition_column)
+            if not primary_key:
+                # No primary key - rows are loaded as-is (may cause duplicates)
+                logger.warning(
+                    f"   ⚠️  No primary key defined for {table_name} - duplicates may occur"
+                )
 
             # Build selective query
             column_list = ", ".join([f"[{col}]" for col in column_names])
 
-            query = f"SELECT {column_list} FROM [{table_name}]"
+            parent_date_index = None
+            if partition_column and parent_table:
+                # Partitioned child: fetch the parent's date as a trailing column
+                parent_key = config["parent_source_key_column"]
+                column_list += (
+                    f", (SELECT parent.[{config['parent_source_date_column']}] "
+                    f"FROM [{parent_table}] AS parent "
+                    f"WHERE parent.[{parent_key}] = [{table_name}].[{parent_key}]) AS parent_date"
+                )
+                parent_date_index = len(column_names)
+
+            select_sql = f"SELECT {column_list} FROM [{table_name}]"
+            query = select_sql
+            filter_condition = None
             if config.get("filter"):
                 # Handle dynamic filters (functions) vs static filters (strings)
                 filter_condition = config["filter"]
@@ -1270,177 +2597,128 @@ class SelectiveSync:
 
             logger.info(f"   Query: {query}")
 
-            # Execute query and get data
-            phc_cursor.execute(query)
-
-            batch_size = 1000
+            tuner = self._batch_tuner(table_name)
             total_rows = 0
             batch_num = 0
 
-            print(f"   Fetching data from PHC...", flush=True)
+            # Large tables: fetch monthly ranges on parallel PHC connections
+            queries = [query]
+            if DEFAULT_EXTRACT_WORKERS > 1:
+                queries = self._partition_queries(
+                    table_name, select_sql, filter_condition, config
+                )
+
+            if len(queries) > 1:
+                print(
+                    f"   Fetching data from PHC ({len(queries)} ranges, "
+                    f"{min(DEFAULT_EXTRACT_WORKERS, len(queries))} connections)...",
+                    flush=True,
+                )
+                # Parallel range fetches keep the learned fetch size fixed
+                batches = iter_partitioned_batches(
+                    self._open_phc_connection, queries, tuner.fetch_rows
+                )
+            else:
+                print(f"   Fetching data from PHC...", flush=True)
+                phc_cursor.execute(query)
+                batches = tuner.fetch_batches(phc_cursor)
 
-            while True:
-                rows = phc_cursor.fetchmany(batch_size)
-                if not rows:
-                    break
+            # Find PK column index for the per-batch duplicate check
+            pk_index = None
+            if primary_key:
+                for i, col in enumerate(column_names):
+                    if column_mappings.get(col, col) == primary_key:
+                        pk_index = i
+                        break
 
+            def transform(rows) -> list[tuple]:
+                nonlocal batch_num
                 batch_num += 1
 
                 # Clean and prepare data
-                clean_rows = []
-                for row in rows:
-                    clean_row = []
-                    for i, val in enumerate(row):
-                        col_name = column_names[i]
-                        col_type = columns[col_name].upper()
-
-                        if val is None:
-                            # Special handling for vendnm in CL table - default to IMACX
-                            if table_name == "cl" and col_name == "vendnm":
-                                clean_row.append("IMACX")
-                            # Special handling for ccusto in BI table - default to ID-Impressão Digital
-                            elif table_name == "bi" and col_name == "ccusto":
-                                clean_row.append("ID-Impressão Digital")
-                            else:
-                                clean_row.append(None)
-                        else:
-                            # Convert based on target column type
-                            if "INTEGER" in col_type:
-                                try:
-                                    clean_row.append(
-                                        int(float(val)) if val is not None else None
-                                    )
-                                except (ValueError, TypeError):
-                                    clean_row.append(None)
-                            elif "NUMERIC" in col_type:
-                                try:
-                                    # Correctly handle 0 values
-                                    clean_row.append(
-                                        float(val) if val is not None else None
-                                    )
-                                except (ValueError, TypeError):
-                                    clean_row.append(None)
-                            elif "BOOLEAN" in col_type:
-                                clean_row.append(bool(val) if val is not None else None)
-                            elif "DATE" in col_type:
-                                # Special handling for marca field (stored as VARCHAR "DD.MM.YYYY")
-                                if table_name == "bo" and col_name == "marca":
-                                    parsed_date = self._parse_marca_date(val)
-                                    clean_row.append(parsed_date)
-                                else:
-                                    # Regular date handling
-                                    parsed_date = self._coerce_to_date(val)
-                                    clean_row.append(parsed_date)
-                            else:
-                                str_val = str(val).strip() if val else None
-                                # Special handling for vendnm in CL table - default to IMACX if empty
-                                if (
-                                    table_name == "cl"
-                                    and col_name == "vendnm"
-                                    and not str_val
-                                ):
-                                    clean_row.append("IMACX")
-                                # Special handling for ccusto in BI table - default to ID-Impressão Digital if empty
-                                elif (
-                                    table_name == "bi"
-                                    and col_name == "ccusto"
-                                    and not str_val
-                                ):
-                                    clean_row.append("ID-Impressão Digital")
-                                else:
-                                    clean_row.append(str_val)
-
-                    clean_rows.append(tuple(clean_row))
+                clean_rows, _ = self._prepare_clean_rows(
+                    table_name, config, rows, None, parent_date_index
+                )
 
                 # Validate for duplicate primary keys in batch
-                if clean_rows:
-                    primary_key = config.get("primary_key")
-                    if primary_key:
-                        # Find PK column index
-                        pk_index = None
-                        for i, col in enumerate(column_names):
-                            final_col = column_mappings.get(col, col)
-                            if final_col == primary_key:
-                                pk_index = i
-                                break
-
-                        if pk_index is not None:
-                            # Check for duplicates in batch
-                            pk_values = [row[pk_index] for row in clean_rows]
-                            unique_pk_values = set(pk_values)
-                            if len(pk_values) != len(unique_pk_values):
-                                duplicate_count = len(pk_values) - len(unique_pk_values)
-                                logger.warning(
-                                    f"   ⚠️  Batch {batch_num}: {duplicate_count} duplicate PK values detected in source data"
-                                )
-
-                # Insert batch with conflict handling
-                if clean_rows:
-                    placeholders = ",".join(["%s"] * len(column_names))
-                    final_column_names = [
-                        column_mappings.get(col, col) for col in column_names
-                    ]
-                    column_list_pg = ",".join(
-                        [f'"{col}"' for col in final_column_names]
-                    )
-
-                    # Build INSERT with ON CONFLICT if primary key exists
-                    primary_key = config.get("primary_key")
-                    if primary_key:
-                        # Build update clause for all columns except primary key
-                        update_cols = [
-                            f'"{col}" = EXCLUDED."{col}"'
-                            for col in final_column_names
-                            if col != primary_key
-                        ]
-                        if update_cols:
-                            update_clause = ", ".join(update_cols)
-                            insert_sql = (
-                                f'INSERT INTO phc."{table_name}" ({column_list_pg}) VALUES ({placeholders}) '
-                                f'ON CONFLICT ("{primary_key}") DO UPDATE SET {update_clause}'
-                            )
-                        else:
-                            # No updatable columns - just ignore conflicts
-                            insert_sql = (
-                                f'INSERT INTO phc."{table_name}" ({column_list_pg}) VALUES ({placeholders}) '
-                                f'ON CONFLICT ("{primary_key}") DO NOTHING'
-                            )
-                    else:
-                        # No primary key - use plain INSERT (may cause duplicates)
+                if clean_rows and pk_index is not None:
+                    pk_values = [row[pk_index] for row in clean_rows]
+                    unique_pk_values = set(pk_values)
+                    if len(pk_values) != len(unique_pk_values):
+                        duplicate_count = len(pk_values) - len(unique_pk_values)
                         logger.warning(
-                            f"   ⚠️  No primary key defined for {table_name} - duplicates may occur"
+                            f"   ⚠️  Batch {batch_num}: {duplicate_count} duplicate PK values detected in source data"
                         )
-                        insert_sql = f'INSERT INTO phc."{table_name}" ({column_list_pg}) VALUES ({placeholders})'
+                return clean_rows
 
-                    supabase_cursor.executemany(insert_sql, clean_rows)
-                    self.supabase_conn.commit()
+            def load(clean_rows: list[tuple]) -> None:
+                nonlocal total_rows
+                # COPY batch straight into the shadow table (duplicates resolved at finalize)
+                if not clean_rows:
+                    return
+                tuner.load_in_chunks(
+                    clean_rows,
+                    lambda chunk: self._copy_rows(
+                        supabase_cursor,
+                        f'phc."{shadow_table}"',
+                        config,
+                        final_column_names,
+                        chunk,
+                    ),
+                )
+                self.supabase_conn.commit()
 
-                    total_rows += len(clean_rows)
+                total_rows += len(clean_rows)
 
-                    # Show progress every batch
-                    print(
-                        f"   [BATCH] Batch {batch_num}: {total_rows:,} rows synced...",
-                        end="\r",
-                        flush=True,
-                    )
+                # Show progress every batch
+                print(
+                    f"   [BATCH] {total_rows:,} rows synced...",
+                    end="\r",
+                    flush=True,
+                )
+
+            # Fetch, clean and insert overlap (bounded queues between stages)
+            stats = run_pipeline(batches, transform, load)
 
             # Clear progress line and show final result
-            print(f"   [OK] Completed: {total_rows:,} rows synced" + " " * 20)
+            print(f"   [OK] Completed: {total_rows:,} rows loaded" + " " * 20)
+            logger.info(f"[PIPE] {table_name}: {describe_utilisation(stats)}")
+            self._store_batch_tuner(tuner)
+
+            # Build keys/indexes on the full table, then promote it atomically
+            finalize_shadow_table(supabase_cursor, table_name, primary_key, partition_column)
+            self.supabase_conn.commit()
+            swap_in_shadow(self.supabase_conn, table_name)
+            # Rows arrived before the copied rollup triggers: rebuild that source
+            queue_table_rebuild(supabase_cursor, table_name)
+            self.supabase_conn.commit()
+            if config.get("touched_column"):
+                # Every document may have changed; rematch them all after the sync
+                ensure_touched_table(supabase_cursor)
+                record_table_touched(supabase_cursor, table_name, config["touched_column"])
+                self.supabase_conn.commit()
+
             logger.info(f"[OK] {table_name}: {total_rows:,} rows synced")
             return True, total_rows
 
         except Exception as e:
             logger.error(f"[ERROR] Error syncing {table_name}: {e}")
+            if self.supabase_conn:
+                self.supabase_conn.rollback()
+                try:
+                    self.supabase_conn.cursor().execute(
+                        f'DROP TABLE IF EXISTS phc."{shadow_name(table_name)}" CASCADE'
+                    )
+                    self.supabase_conn.commit()
+                except Exception:
+                    self.supabase_conn.rollback()
             return False, 0
 
-    def sync_configured_tables(self):
+    def sync_configured_tables(self, max_workers: int | None = None):
         """Sync all configured tables"""
         if not self.connect_phc() or not self.connect_supabase():
             return False
 
-        results = {}
-        success_count = 0
-
         total_tables = len(TABLE_CONFIGS)
         logger.info(f"[SYNC] Syncing {total_tables} configured tables")
         print(f"\n{'=' * 80}")
@@ -1449,19 +2727,24 @@ class SelectiveSync:
         )
         print(f"{'=' * 80}\n")
 
-        for idx, (table_name, config) in enumerate(TABLE_CONFIGS.items(), 1):
+        table_positions = {name: idx for idx, name in enumerate(TABLE_CONFIGS, 1)}
+
+        def sync_one(worker, table_name, config):
             print(
-                f"[{idx}/{total_tables}] {table_name.upper()} - {config['description']}"
+                f"[{table_positions[table_name]}/{total_tables}] {table_name.upper()} - {config['description']}"
             )
-            success, row_count = self.sync_table_selective(table_name, config)
-            results[table_name] = {
+            success, row_count = worker.sync_table_selective(table_name, config)
+            return {
                 "success": success,
                 "rows": row_count,
                 "description": config["description"],
             }
-            if success:
-                success_count += 1
-            print()  # Add spacing between tables
+
+        results = self._run_tables_in_parallel(
+            list(TABLE_CONFIGS.keys()), sync_one, max_workers
+        )
+        success_count = sum(1 for result in results.values() if result["success"])
+        print()  # Add spacing after table progress
 
         self.close_connections()
 
@@ -0,0 +1,395 @@
+"""
+Shadow-table swap for full reloads
+A full reload fills phc."<table>__shadow" (no indexes while loading), then
+builds the primary key and the live table's secondary indexes on it and
+promotes it with a rename inside one transaction. Readers keep seeing the
+old table until the commit and never see a half-loaded one.
+
+Objects that point at the live table are carried over to the new one:
+dependent views (recreated from pg_get_viewdef, in dependency order),
+foreign keys in both directions, grants, row level security and policies,
+triggers and comments. Triggers are attached after the load, so they do not
+fire for the reloaded rows; callers that keep derived data in sync through
+them must queue a rebuild themselves (see sales_rollups.queue_table_rebuild).
+A partitioned shadow (ETL_PARTITION_INTERVAL) is promoted the same way and
+its partitions lose the shadow suffix too.
+"""
+
+import logging
+
+from partitions import create_partitioned_table
+
+logger = logging.getLogger(__name__)
+
+SHADOW_SUFFIX = "__shadow"
+
+_DEPENDENT_VIEWS_SQL = """
+WITH RECURSIVE deps AS (
+    SELECT v.oid, 1 AS depth
+    FROM pg_depend d
+    JOIN pg_rewrite r ON r.oid = d.objid
+    JOIN pg_class v ON v.oid = r.ev_class
+    WHERE d.classid = 'pg_rewrite'::regclass
+      AND d.refobjid = %(rel)s::regclass
+      AND v.oid <> d.refobjid
+  UNION
+    SELECT v.oid, deps.depth + 1
+    FROM deps
+    JOIN pg_depend d ON d.refobjid = deps.oid
+    JOIN pg_rewrite r ON r.oid = d.objid
+    JOIN pg_class v ON v.oid = r.ev_class
+    WHERE d.classid = 'pg_rewrite'::regclass
+      AND v.oid <> deps.oid
+)
+SELECT c.oid,
+       quote_ident(n.nspname) || '.' || quote_ident(c.relname),
+       c.relkind,
+       pg_get_viewdef(c.oid),
+       c.reloptions,
+       MAX(deps.depth)
+FROM deps
+JOIN pg_class c ON c.oid = deps.oid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+GROUP BY c.oid, n.nspname, c.relname, c.relkind, c.reloptions
+ORDER BY MAX(deps.depth), c.oid
+"""
+
+
+def shadow_name(table_name: str) -> str:
+    return f"{table_name}{SHADOW_SUFFIX}"
+
+
+def _qualified(table_name: str) -> str:
+    return f'phc."{table_name}"'
+
+
+def _table_exists(cursor, table_name: str) -> bool:
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (_qualified(table_name),))
+    return cursor.fetchone()[0]
+
+
+def _grant_statements(cursor, relation: str, target: str) -> list[str]:
+    """GRANTs reproducing relation's ACL on target."""
+    cursor.execute(
+        """
+        SELECT a.privilege_type,
+               CASE WHEN a.grantee = 0 THEN 'PUBLIC'
+                    ELSE quote_ident(pg_get_userbyid(a.grantee)) END
+        FROM pg_class c, aclexplode(c.relacl) AS a
+        WHERE c.oid = %s::regclass
+        """,
+        (relation,),
+    )
+    return [
+        f"GRANT {privilege} ON {target} TO {grantee}"
+        for privilege, grantee in cursor.fetchall()
+    ]
+
+
+def create_shadow_table(
+    cursor, table_name: str, column_defs: list[str], partition_column: str | None = None
+) -> str:
+    """(Re)create an empty heap for the reload - no keys, no indexes.
+
+    With partition_column the shadow is range-partitioned (default partition
+    only; the caller adds the ranges).
+    """
+    shadow = shadow_name(table_name)
+    cursor.execute(f"DROP TABLE IF EXISTS {_qualified(shadow)} CASCADE")
+    if partition_column:
+        create_partitioned_table(cursor, shadow, column_defs, partition_column)
+    else:
+        cursor.execute(f"CREATE TABLE {_qualified(shadow)} ({', '.join(column_defs)})")
+    return shadow
+
+
+def finalize_shadow_table(
+    cursor,
+    table_name: str,
+    primary_key: str | None,
+    partition_column: str | None = None,
+) -> None:
+    """Deduplicate, add the primary key and copy indexes/grants/RLS/triggers/comments from live.
+
+    Duplicate source keys keep one row: the one stored last physically. The
+    source has no modification column to order by, and parallel range
+    extraction loads in no defined order, so which copy survives is not
+    specified - duplicates only arise when PHC returns a key twice during
+    the read. A partitioned shadow gets (key, partition column) as primary key.
+    """
+    shadow = _qualified(shadow_name(table_name))
+    live = _qualified(table_name)
+
+    if primary_key:
+        # ctid is only unique within one partition, so order by (tableoid, ctid)
+        cursor.execute(
+            f"""
+            DELETE FROM {shadow} AS older
+            USING {shadow} AS newer
+            WHERE older."{primary_key}" = newer."{primary_key}"
+              AND (older.tableoid, older.ctid) < (newer.tableoid, newer.ctid)
+            """
+        )
+        if cursor.rowcount:
+            logger.warning(
+                "[WARN] %s: dropped %s duplicate source rows", table_name, cursor.rowcount
+            )
+        key_columns = f'"{primary_key}"'
+        if partition_column:
+            key_columns += f', "{partition_column}"'
+        cursor.execute(
+            f'ALTER TABLE {shadow} ADD CONSTRAINT "{table_name}{SHADOW_SUFFIX}_pkey" '
+            f"PRIMARY KEY ({key_columns})"
+        )
+
+    if not _table_exists(cursor, table_name):
+        cursor.execute(f"ANALYZE {shadow}")
+        return
+
+    # Secondary indexes: same definition, temporary name until the swap
+    cursor.execute(
+        """
+        SELECT ic.relname, i.indisunique, pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        JOIN pg_class ic ON ic.oid = i.indexrelid
+        WHERE i.indrelid = %s::regclass AND NOT i.indisprimary
+        """,
+        (live,),
+    )
+    for index_name, is_unique, index_def in cursor.fetchall():
+        # "CREATE [UNIQUE] INDEX name ON table USING ..." - keep everything from USING
+        _, index_body = index_def.split(" USING ", 1)
+        if is_unique and partition_column and partition_column not in index_body:
+            logger.warning(
+                "[WARN] %s: unique index %s skipped - it lacks the partition column",
+                table_name,
+                index_name,
+            )
+            continue
+        unique = "UNIQUE " if is_unique else ""
+        cursor.execute(
+            f'CREATE {unique}INDEX "{index_name}{SHADOW_SUFFIX}" ON {shadow} USING {index_body}'
+        )
+
+    for statement in _grant_statements(cursor, live, shadow):
+        cursor.execute(statement)
+
+    cursor.execute(
+        "SELECT relrowsecurity, relforcerowsecurity FROM pg_class WHERE oid = %s::regclass",
+        (live,),
+    )
+    row_security, force_row_security = cursor.fetchone()
+    if row_security:
+        cursor.execute(f"ALTER TABLE {shadow} ENABLE ROW LEVEL SECURITY")
+    if force_row_security:
+        cursor.execute(f"ALTER TABLE {shadow} FORCE ROW LEVEL SECURITY")
+    cursor.execute(
+        """
+        SELECT quote_ident(policyname), permissive,
+               array_to_string(ARRAY(SELECT quote_ident(r) FROM unnest(roles) AS r), ', '),
+               cmd, qual, with_check
+        FROM pg_policies
+        WHERE schemaname = 'phc' AND tablename = %s
+        """,
+        (table_name,),
+    )
+    for policy, permissive, roles, cmd, qual, with_check in cursor.fetchall():
+        statement = f"CREATE POLICY {policy} ON {shadow} AS {permissive} FOR {cmd} TO {roles}"
+        if qual:
+            statement += f" USING ({qual})"
+        if with_check:
+            statement += f" WITH CHECK ({with_check})"
+        cursor.execute(statement)
+
+    _copy_triggers(cursor, live, shadow)
+    _copy_comments(cursor, live, shadow)
+
+    cursor.execute(f"ANALYZE {shadow}")
+
+
+def _copy_triggers(cursor, live: str, shadow: str) -> None:
+    """Recreate live's user triggers (and their enabled state) on the shadow."""
+    cursor.execute(
+        """
+        SELECT quote_ident(t.tgname), pg_get_triggerdef(t.oid), t.tgenabled,
+               quote_ident(n.nspname) || '.' || quote_ident(c.relname)
+        FROM pg_trigger t
+        JOIN pg_class c ON c.oid = t.tgrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE t.tgrelid = %s::regclass AND NOT t.tgisinternal AND t.tgparentid = 0
+        """,
+        (live,),
+    )
+    for trigger, definition, enabled, qualified_live in cursor.fetchall():
+        # pg_get_triggerdef always schema-qualifies: "... ON phc.ft ..."
+        cursor.execute(definition.replace(f" ON {qualified_live} ", f" ON {shadow} ", 1))
+        if enabled == "D":
+            cursor.execute(f"ALTER TABLE {shadow} DISABLE TRIGGER {trigger}")
+
+
+def _copy_comments(cursor, live: str, shadow: str) -> None:
+    """Table and column comments of live, on the shadow's matching columns."""
+    cursor.execute("SELECT obj_description(%s::regclass, 'pg_class')", (live,))
+    comment = cursor.fetchone()[0]
+    if comment is not None:
+        cursor.execute(f"COMMENT ON TABLE {shadow} IS %s", (comment,))
+    cursor.execute(
+        """
+        SELECT quote_ident(a.attname), col_description(a.attrelid, a.attnum)
+        FROM pg_attribute a
+        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+          AND col_description(a.attrelid, a.attnum) IS NOT NULL
+          AND EXISTS (
+              SELECT 1 FROM pg_attribute s
+              WHERE s.attrelid = %s::regclass AND s.attname = a.attname AND NOT s.attisdropped
+          )
+        """,
+        (live, shadow),
+    )
+    for column, column_comment in cursor.fetchall():
+        cursor.execute(f"COMMENT ON COLUMN {shadow}.{column} IS %s", (column_comment,))
+
+
+def swap_in_shadow(conn, table_name: str) -> None:
+    """Atomically replace phc.<table> with its finalized shadow table.
+
+    Runs in one transaction: capture dependents, drop the live table,
+    rename the shadow into place and recreate views and foreign keys.
+    Foreign keys come back NOT VALID and are validated after the commit,
+    so the exclusive lock is only held for the catalogue changes.
+    """
+    cursor = conn.cursor()
+    live = _qualified(table_name)
+    shadow = _qualified(shadow_name(table_name))
+
+    if not _table_exists(cursor, table_name):
+        cursor.execute(f'ALTER TABLE {shadow} RENAME TO "{table_name}"')
+        _rename_shadow_indexes(cursor, table_name)
+        conn.commit()
+        return
+
+    cursor.execute(f"LOCK TABLE {live} IN ACCESS EXCLUSIVE MODE")
+
+    cursor.execute(_DEPENDENT_VIEWS_SQL, {"rel": live})
+    views = cursor.fetchall()
+    view_grants = []
+    for _, view_name, _, _, _, _ in views:
+        view_grants.extend(_grant_statements(cursor, view_name, view_name))
+
+    cursor.execute(
+        """
+        SELECT conrelid::regclass::text, quote_ident(conname), pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE contype = 'f'
+          AND (conrelid = %(rel)s::regclass OR confrelid = %(rel)s::regclass)
+        """,
+        {"rel": live},
+    )
+    foreign_keys = cursor.fetchall()
+
+    cursor.execute(f"DROP TABLE {live} CASCADE")
+    cursor.execute(f'ALTER TABLE {shadow} RENAME TO "{table_name}"')
+    _rename_shadow_indexes(cursor, table_name)
+
+    restored_keys = []
+    for relation, constraint, definition in foreign_keys:
+        # A key referencing columns that are no longer unique (e.g. after
+        # partitioning changed the primary key) must not abort the swap
+        cursor.execute("SAVEPOINT restore_fk")
+        try:
+            cursor.execute(
+                f"ALTER TABLE {relation} ADD CONSTRAINT {constraint} {definition} NOT VALID"
+            )
+            restored_keys.append((relation, constraint))
+        except Exception as exc:
+            cursor.execute("ROLLBACK TO SAVEPOINT restore_fk")
+            logger.warning("[WARN] %s on %s not restored: %s", constraint, relation, exc)
+    for _, view_name, relkind, definition, options, _ in views:
+        kind = "MATERIALIZED VIEW" if relkind == "m" else "VIEW"
+        with_options = f" WITH ({', '.join(options)})" if options else ""
+        cursor.execute(f"CREATE {kind} {view_name}{with_options} AS {definition}")
+    for statement in view_grants:
+        cursor.execute(statement)
+
+    conn.commit()
+    logger.info(
+        "[OK] %s swapped in (%s views, %s foreign keys restored)",
+        table_name,
+        len(views),
+        len(restored_keys),
+    )
+
+    for relation, constraint in restored_keys:
+        try:
+            cursor.execute(f"ALTER TABLE {relation} VALIDATE CONSTRAINT {constraint}")
+            conn.commit()
+        except Exception as exc:
+            conn.rollback()
+            logger.warning(
+                "[WARN] %s on %s left NOT VALID: %s", constraint, relation, exc
+            )
+
+
+def _rename_shadow_indexes(cursor, table_name: str) -> None:
+    """Give the promoted table's indexes, primary key and partitions their live names."""
+    _rename_shadow_partitions(cursor, table_name)
+    cursor.execute(
+        """
+        SELECT ic.relname, i.indisprimary
+        FROM pg_index i
+        JOIN pg_class ic ON ic.oid = i.indexrelid
+        WHERE i.indrelid = %s::regclass
+        """,
+        (_qualified(table_name),),
+    )
+    for index_name, is_primary in cursor.fetchall():
+        if not index_name.endswith(SHADOW_SUFFIX) and not is_primary:
+            continue
+        if is_primary:
+            cursor.execute(
+                f'ALTER TABLE {_qualified(table_name)} RENAME CONSTRAINT "{index_name}" '
+                f'TO "{table_name}_pkey"'
+            )
+        else:
+            cursor.execute(
+                f'ALTER INDEX phc."{index_name}" RENAME TO "{index_name[: -len(SHADOW_SUFFIX)]}"'
+            )
+
+
+def _rename_shadow_partitions(cursor, table_name: str) -> None:
+    cursor.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+        """,
+        (_qualified(table_name),),
+    )
+    for (partition,) in cursor.fetchall():
+        if SHADOW_SUFFIX not in partition:
+            continue
+        live_partition = partition.replace(SHADOW_SUFFIX, "", 1)
+        cursor.execute(f'ALTER TABLE phc."{partition}" RENAME TO "{live_partition}"')
+        # Partition indexes are named after the shadow too (e.g. bo__shadow_p2025_pkey)
+        cursor.execute(
+            """
+            SELECT ic.relname, con.conname IS NOT NULL
+            FROM pg_index i
+            JOIN pg_class ic ON ic.oid = i.indexrelid
+            LEFT JOIN pg_constraint con ON con.conindid = i.indexrelid
+            WHERE i.indrelid = %s::regclass
+            """,
+            (_qualified(live_partition),),
+        )
+        for index_name, is_constraint in cursor.fetchall():
+            if SHADOW_SUFFIX not in index_name:
+                continue
+            new_name = index_name.replace(SHADOW_SUFFIX, "", 1)
+            if is_constraint:
+                cursor.execute(
+                    f'ALTER TABLE phc."{live_partition}" RENAME CONSTRAINT "{index_name}" '
+                    f'TO "{new_name}"'
+                )
+            else:
+                cursor.execute(f'ALTER INDEX phc."{index_name}" RENAME TO "{new_name}"')
@@ -0,0 +1,184 @@
+"""
+Reduced quote embedding storage
+quote_embedding_vectors can hold each vector in one of three forms, chosen
+with EMBEDDING_STORAGE (generate_quote_embeddings.py) or converted in place
+(reduce_quote_embeddings.py):
+
+- full:    embedding          vector(1536)  float4, 6 KB per vector
+- halfvec: embedding_half     halfvec(1536) float2, 3 KB per vector
+- pca:     embedding_reduced  vector(256)   float4, 1 KB per vector
+
+The pca form is a linear projection fitted here in NumPy (truncated SVD of
+the unit-length embeddings, not mean-centred, so cosine similarities - and
+the search threshold - keep roughly their full-vector values). Its
+components are stored in quote_embedding_projection_components and
+project_quote_embedding() applies them to the query in SQL at search time.
+"""
+
+import json
+
+try:
+    import numpy as np
+except ImportError:  # optional - only the pca form and the evaluation need it
+    np = None
+
+STORAGE_MODES = ("full", "halfvec", "pca")
+REDUCED_DIMENSIONS = 256  # quote_embedding_vectors.embedding_reduced is vector(256)
+
+# Storage mode -> (quote_embedding_vectors column, pg_copy column type)
+STORAGE_COLUMNS = {
+    "full": ("embedding", "VECTOR"),
+    "halfvec": ("embedding_half", "HALFVEC"),
+    "pca": ("embedding_reduced", "VECTOR"),
+}
+
+# Bytes per stored component
+STORAGE_COMPONENT_BYTES = {"full": 4, "halfvec": 2, "pca": 4}
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("NumPy is required for reduced embeddings (pip install numpy)")
+
+
+def parse_vector(value) -> list[float]:
+    """pgvector value as returned by PostgREST / psycopg2 ('[0.1,...]') or a list."""
+    if isinstance(value, str):
+        return json.loads(value)
+    return list(value)
+
+
+def format_vector(values) -> str:
+    """pgvector text input ('[0.1,...]')."""
+    return "[" + ",".join(repr(float(value)) for value in values) + "]"
+
+
+def normalize_rows(vectors):
+    """Rows scaled to unit length (zero rows left as they are)."""
+    _require_numpy()
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def to_halfvec(vectors):
+    """The values a halfvec column gives back (rounded to float16)."""
+    _require_numpy()
+    return np.asarray(vectors, dtype=np.float16).astype(np.float32)
+
+
+class Projection:
+    """Linear map from full embeddings to `dimensions` components."""
+
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        components,
+        explained_variance: float,
+        sample_count: int,
+    ):
+        _require_numpy()
+        self.name = name
+        self.model = model
+        self.components = np.asarray(components, dtype=np.float32)
+        self.explained_variance = explained_variance
+        self.sample_count = sample_count
+
+    @property
+    def dimensions(self) -> int:
+        return self.components.shape[0]
+
+    @property
+    def source_dimensions(self) -> int:
+        return self.components.shape[1]
+
+    def project(self, vectors):
+        """(n, source_dimensions) -> (n, dimensions); same as project_quote_embedding() in SQL."""
+        return np.asarray(vectors, dtype=np.float32) @ self.components.T
+
+
+def fit_projection(vectors, dimensions: int, name: str, model: str) -> Projection:
+    """
+    Fit the projection onto the top `dimensions` singular vectors.
+
+    Needs at least `dimensions` vectors; a few thousand distinct quote texts
+    fit in memory and take seconds.
+    """
+    matrix = normalize_rows(vectors)
+    if matrix.shape[0] < dimensions:
+        raise ValueError(
+            f"Need at least {dimensions} vectors to fit {dimensions} components, "
+            f"got {matrix.shape[0]}"
+        )
+    _, singular_values, components = np.linalg.svd(matrix, full_matrices=False)
+    energy = singular_values**2
+    explained = float(energy[:dimensions].sum() / energy.sum())
+    return Projection(name, model, components[:dimensions], explained, matrix.shape[0])
+
+
+def fetch_full_vectors(conn, limit: int | None = None):
+    """(content_hashes, vectors) of the rows still stored full or as halfvec."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT content_hash, COALESCE(embedding, embedding_half::vector(1536))::real[]
+            FROM public.quote_embedding_vectors
+            WHERE embedding IS NOT NULL OR embedding_half IS NOT NULL
+            ORDER BY content_hash
+            LIMIT %s
+            """,
+            (limit,),
+        )
+        rows = cursor.fetchall()
+    finally:
+        conn.commit()
+        cursor.close()
+    return [row[0] for row in rows], [row[1] for row in rows]
+
+
+def fetch_active_projection(conn) -> Projection | None:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT p.name, p.model, p.explained_variance, p.sample_count, c.weights::real[]
+            FROM public.quote_embedding_projections p
+            JOIN public.quote_embedding_projection_components c ON c.projection_name = p.name
+            WHERE p.is_active
+            ORDER BY c.component
+            """
+        )
+        rows = cursor.fetchall()
+    finally:
+        conn.commit()
+        cursor.close()
+    if not rows:
+        return None
+    name, model, explained, samples = rows[0][:4]
+    return Projection(name, model, [row[4] for row in rows], explained, samples)
+
+
+def cosine_top_k(corpus, queries, k: int, exclude=None):
+    """
+    Indices of the k corpus rows most cosine-similar to each query, best first.
+
+    `exclude` (one corpus index per query, or None) drops the query's own row.
+    """
+    corpus = normalize_rows(corpus)
+    queries = normalize_rows(queries)
+    scores = queries @ corpus.T
+    if exclude is not None:
+        scores[np.arange(len(queries)), exclude] = -np.inf
+    k = min(k, corpus.shape[0])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def recall_at_k(exact, approx) -> float:
+    """Mean share of the exact top-k found in the approximate top-k."""
+    hits = [len(set(e) & set(a)) / len(e) for e, a in zip(exact.tolist(), approx.tolist())]
+    return sum(hits) / len(hits) if hits else 0.0
@@ -0,0 +1,503 @@
+-- Migration: Monthly sales rollups for analytics RPCs
+-- Date: 2025-12-14
+-- Description:
+--   - phc.ft_monthly_rollup / phc.fi_monthly_rollup: per-month sums of phc.ft/fi ("live")
+--     and phc."2years_ft"/"2years_fi" ("2years"), a few thousand rows instead of the fact tables
+--   - Maintained by the ETL (scripts/etl_core/sales_rollups.py): triggers on the fact tables
+--     queue touched months in phc.sales_rollup_dirty_months, post_sync_views.py recomputes them
+--   - get_department_rankings_ytd() and get_cost_center_multi_year_ytd() read the rollups
+--     instead of the fact tables (same signatures and results, so the app is unchanged)
+
+-- ============================================
+-- Step 1: Rollup tables (the ETL creates them too)
+-- ============================================
+CREATE TABLE IF NOT EXISTS phc.ft_monthly_rollup (
+    source TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    customer_id INTEGER,
+    document_type TEXT,
+    anulado TEXT,
+    net_value NUMERIC NOT NULL,
+    documents BIGINT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS phc.fi_monthly_rollup (
+    source TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    cost_center TEXT,
+    salesperson_name TEXT,
+    document_type TEXT,
+    anulado TEXT,
+    net_value NUMERIC NOT NULL,
+    lines BIGINT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_ft_monthly_rollup_period ON phc.ft_monthly_rollup (source, year, month);
+CREATE INDEX IF NOT EXISTS idx_fi_monthly_rollup_period ON phc.fi_monthly_rollup (source, year, month);
+
+CREATE TABLE IF NOT EXISTS phc.sales_rollup_dirty_months (
+    source TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    PRIMARY KEY (source, year, month)
+);
+
+-- Initial build, so the RPCs below have data before the next post-sync run
+-- (which attaches the triggers and rebuilds both sources once more)
+DELETE FROM phc.ft_monthly_rollup;
+DELETE FROM phc.fi_monthly_rollup;
+
+INSERT INTO phc.ft_monthly_rollup
+    (source, year, month, customer_id, document_type, anulado, net_value, documents)
+SELECT 'live', EXTRACT(YEAR FROM ft.invoice_date)::int, EXTRACT(MONTH FROM ft.invoice_date)::int,
+       ft.customer_id, ft.document_type, ft.anulado, COALESCE(SUM(ft.net_value), 0), COUNT(*)
+FROM phc.ft
+WHERE ft.invoice_date IS NOT NULL
+GROUP BY 2, 3, 4, 5, 6
+UNION ALL
+SELECT '2years', EXTRACT(YEAR FROM ft.invoice_date)::int, EXTRACT(MONTH FROM ft.invoice_date)::int,
+       ft.customer_id, ft.document_type, ft.anulado, COALESCE(SUM(ft.net_value), 0), COUNT(*)
+FROM phc."2years_ft" ft
+WHERE ft.invoice_date IS NOT NULL
+GROUP BY 2, 3, 4, 5, 6;
+
+INSERT INTO phc.fi_monthly_rollup
+    (source, year, month, cost_center, salesperson_name, document_type, anulado, net_value, lines)
+SELECT 'live', EXTRACT(YEAR FROM ft.invoice_date)::int, EXTRACT(MONTH FROM ft.invoice_date)::int,
+       fi.cost_center, fi.salesperson_name, ft.document_type, ft.anulado,
+       COALESCE(SUM(fi.net_liquid_value), 0), COUNT(*)
+FROM phc.fi
+JOIN phc.ft ON ft.invoice_id = fi.invoice_id
+WHERE ft.invoice_date IS NOT NULL
+GROUP BY 2, 3, 4, 5, 6, 7
+UNION ALL
+SELECT '2years', EXTRACT(YEAR FROM ft.invoice_date)::int, EXTRACT(MONTH FROM ft.invoice_date)::int,
+       fi.cost_center, fi.salesperson_name, ft.document_type, ft.anulado,
+       COALESCE(SUM(fi.net_liquid_value), 0), COUNT(*)
+FROM phc."2years_fi" fi
+JOIN phc."2years_ft" ft ON ft.invoice_id = fi.invoice_id
+WHERE ft.invoice_date IS NOT NULL
+GROUP BY 2, 3, 4, 5, 6, 7;
+
+GRANT SELECT ON phc.ft_monthly_rollup TO authenticated;
+GRANT SELECT ON phc.fi_monthly_rollup TO authenticated;
+
+-- ============================================
+-- Step 2: Department rankings (YTD) from the invoice rollup
+-- ============================================
+-- Same department mapping, years and Factura / Nota de Crédito rules as
+-- before; the invoice figures and invoiced customers come from
+-- phc.ft_monthly_rollup, quotes (phc.bo / "2years_bo") are read as before
+CREATE OR REPLACE FUNCTION public.get_department_rankings_ytd()
+ RETURNS TABLE(departamento text, faturacao numeric, faturacao_anterior numeric, faturacao_variacao numeric, notas_credito numeric, notas_credito_anterior numeric, notas_credito_variacao numeric, num_faturas bigint, num_faturas_anterior bigint, num_faturas_variacao numeric, num_notas bigint, num_notas_anterior bigint, num_notas_variacao numeric, ticket_medio numeric, ticket_medio_anterior numeric, ticket_medio_variacao numeric, orcamentos_valor numeric, orcamentos_valor_anterior numeric, orcamentos_valor_variacao numeric, orcamentos_qtd bigint, orcamentos_qtd_anterior bigint, orcamentos_qtd_variacao numeric, taxa_conversao numeric, taxa_conversao_anterior numeric, taxa_conversao_variacao numeric)
+ LANGUAGE sql
+ STABLE
+AS $function$
+WITH ft_rollup AS (
+  -- Invoices per customer and month from the rollup: 2025 from the live
+  -- tables, 2024 from the 2years snapshot (as phc.ft / phc."2years_ft" before)
+  SELECT
+    r.year,
+    COALESCE(NULLIF(UPPER(BTRIM(unm.department)), ''), 'IMACX') as departamento,
+    r.customer_id,
+    r.document_type,
+    (r.anulado IS NULL OR r.anulado = '' OR r.anulado = '0') as valida,
+    r.net_value,
+    r.documents
+  FROM phc.ft_monthly_rollup r
+  LEFT JOIN phc.cl ON r.customer_id = cl.customer_id
+  LEFT JOIN public.user_name_mapping unm
+    ON UPPER(BTRIM(cl.salesperson)) = UPPER(BTRIM(unm.initials))
+    AND unm.active = true
+    AND unm.sales = true
+  WHERE ((r.source = 'live' AND r.year = 2025) OR (r.source = '2years' AND r.year = 2024))
+    AND r.document_type IN ('Factura', 'Nota de Crédito')
+),
+ft_totals AS (
+  SELECT
+    year,
+    departamento,
+    -- Facturação (excluding anulado)
+    SUM(CASE WHEN document_type = 'Factura' AND valida THEN net_value ELSE 0 END) as faturacao,
+    -- Notas Crédito
+    ABS(SUM(CASE WHEN document_type = 'Nota de Crédito' THEN net_value ELSE 0 END)) as notas_credito,
+    -- Nº Faturas / Nº Notas Crédito (one rollup document per invoice_id)
+    SUM(CASE WHEN document_type = 'Factura' AND valida THEN documents ELSE 0 END)::bigint as num_faturas,
+    SUM(CASE WHEN document_type = 'Nota de Crédito' THEN documents ELSE 0 END)::bigint as num_notas
+  FROM ft_rollup
+  GROUP BY year, departamento
+),
+invoiced_customers AS (
+  SELECT DISTINCT year, customer_id
+  FROM ft_rollup
+  WHERE document_type = 'Factura' AND valida
+),
+current_year_data AS (
+  -- Current Year (2025) Metrics by Department
+  SELECT
+    departamento,
+    faturacao,
+    notas_credito,
+    num_faturas,
+    num_notas,
+    CASE WHEN num_faturas > 0 THEN faturacao / num_faturas ELSE 0 END as ticket_medio
+  FROM ft_totals
+  WHERE year = 2025
+),
+previous_year_data AS (
+  -- Previous Year (2024) Metrics by Department. The former cut-off
+  -- (invoice_date <= CURRENT_DATE) always kept the whole of 2024
+  SELECT
+    departamento,
+    faturacao as faturacao_anterior,
+    notas_credito as notas_credito_anterior,
+    num_faturas as num_faturas_anterior,
+    num_notas as num_notas_anterior,
+    CASE WHEN num_faturas > 0 THEN faturacao / num_faturas ELSE 0 END as ticket_medio_anterior
+  FROM ft_totals
+  WHERE year = 2024
+),
+orcamentos_current AS (
+  -- Current Year Orçamentos by Department
+  SELECT 
+    COALESCE(NULLIF(UPPER(BTRIM(unm.department)), ''), 'IMACX') as departamento,
+    SUM(bo.total_value) as orcamentos_valor,
+    COUNT(*) as orcamentos_qtd
+  FROM phc.bo
+  LEFT JOIN phc.cl ON bo.customer_id = cl.customer_id
+  LEFT JOIN public.user_name_mapping unm 
+    ON UPPER(BTRIM(cl.salesperson)) = UPPER(BTRIM(unm.initials))
+    AND unm.active = true
+    AND unm.sales = true
+  WHERE EXTRACT(YEAR FROM bo.document_date) = 2025
+    AND bo.document_type = 'Orçamento'
+  GROUP BY COALESCE(NULLIF(UPPER(BTRIM(unm.department)), ''), 'IMACX')
+),
+orcamentos_previous AS (
+  -- Previous Year Orçamentos by Department - from 2years_bo
+  SELECT 
+    COALESCE(NULLIF(UPPER(BTRIM(unm.department)), ''), 'IMACX') as departamento,
+    SUM(bo.total_value) as orcamentos_valor_anterior,
+    COUNT(*) as orcamentos_qtd_anterior
+  FROM phc."2years_bo" bo
+  LEFT JOIN phc.cl ON bo.customer_id = cl.customer_id
+  LEFT JOIN public.user_name_mapping unm 
+    ON UPPER(BTRIM(cl.salesperson)) = UPPER(BTRIM(unm.initials))
+    AND unm.active = true
+    AND unm.sales = true
+  WHERE EXTRACT(YEAR FROM bo.document_date) = 2024
+    AND bo.document_date <= DATE_TRUNC('year', CURRENT_DATE) + (CURRENT_DATE - DATE_TRUNC('year', CURRENT_DATE))
+    AND bo.document_type = 'Orçamento'
+  GROUP BY COALESCE(NULLIF(UPPER(BTRIM(unm.department)), ''), 'IMACX')
+),
+taxa_conversao AS (
+  -- Conversion Rate Calculation
+  SELECT 
+    COALESCE(NULLIF(UPPER(BTRIM(unm.department)), ''), 'IMACX') as departamento,
+    COUNT(DISTINCT CASE WHEN bo.document_type = 'Orçamento' THEN bo.customer_id END) as total_orcamentos_clientes,
+    COUNT(DISTINCT ic.customer_id) as total_faturas_clientes
+  FROM phc.bo
+  LEFT JOIN phc.cl ON bo.customer_id = cl.customer_id
+  LEFT JOIN public.user_name_mapping unm 
+    ON UPPER(BTRIM(cl.salesperson)) = UPPER(BTRIM(unm.initials))
+    AND unm.active = true
+    AND unm.sales = true
+  LEFT JOIN invoiced_customers ic ON bo.customer_id = ic.customer_id 
+    AND ic.year = 2025
+  WHERE EXTRACT(YEAR FROM bo.document_date) = 2025
+  GROUP BY COALESCE(NULLIF(UPPER(BTRIM(unm.department)), ''), 'IMACX')
+),
+taxa_conversao_anterior AS (
+  -- Previous Year Conversion Rate - from 2years tables
+  SELECT 
+    COALESCE(NULLIF(UPPER(BTRIM(unm.department)), ''), 'IMACX') as departamento,
+    COUNT(DISTINCT CASE WHEN bo.document_type = 'Orçamento' THEN bo.customer_id END) as total_orcamentos_clientes_anterior,
+    COUNT(DISTINCT ic.customer_id) as total_faturas_clientes_anterior
+  FROM phc."2years_bo" bo
+  LEFT JOIN phc.cl ON bo.customer_id = cl.customer_id
+  LEFT JOIN public.user_name_mapping unm 
+    ON UPPER(BTRIM(cl.salesperson)) = UPPER(BTRIM(unm.initials))
+    AND unm.active = true
+    AND unm.sales = true
+  LEFT JOIN invoiced_customers ic ON bo.customer_id = ic.customer_id 
+    AND ic.year = 2024
+  WHERE EXTRACT(YEAR FROM bo.document_date) = 2024
+    AND bo.document_date <= DATE_TRUNC('year', CURRENT_DATE) + (CURRENT_DATE - DATE_TRUNC('year', CURRENT_DATE))
+  GROUP BY COALESCE(NULLIF(UPPER(BTRIM(unm.department)), ''), 'IMACX')
+),
+combined_results AS (
+SELECT 
+  cy.departamento,
+  -- Facturação
+  cy.faturacao,
+  COALESCE(py.faturacao_anterior, 0) as faturacao_anterior,
+  CASE 
+    WHEN COALESCE(py.faturacao_anterior, 0) > 0 
+    THEN ROUND(((cy.faturacao - py.faturacao_anterior) / py.faturacao_anterior * 100)::numeric, 1)
+    ELSE 0 
+  END as faturacao_variacao,
+  -- Notas Crédito
+  cy.notas_credito,
+  COALESCE(py.notas_credito_anterior, 0) as notas_credito_anterior,
+  CASE 
+    WHEN COALESCE(py.notas_credito_anterior, 0) > 0 
+    THEN ROUND(((cy.notas_credito - py.notas_credito_anterior) / py.notas_credito_anterior * 100)::numeric, 1)
+    ELSE 0 
+  END as notas_credito_variacao,
+  -- Nº Faturas
+  cy.num_faturas,
+  COALESCE(py.num_faturas_anterior, 0) as num_faturas_anterior,
+  CASE 
+    WHEN COALESCE(py.num_faturas_anterior, 0) > 0 
+    THEN ROUND(((cy.num_faturas - py.num_faturas_anterior)::numeric / py.num_faturas_anterior * 100)::numeric, 1)
+    ELSE 0 
+  END as num_faturas_variacao,
+  -- Nº Notas
+  cy.num_notas,
+  COALESCE(py.num_notas_anterior, 0) as num_notas_anterior,
+  CASE 
+    WHEN COALESCE(py.num_notas_anterior, 0) > 0 
+    THEN ROUND(((cy.num_notas - py.num_notas_anterior)::numeric / py.num_notas_anterior * 100)::numeric, 1)
+    ELSE 0 
+  END as num_notas_variacao,
+  -- Ticket Médio
+  ROUND(cy.ticket_medio::numeric, 2) as ticket_medio,
+  ROUND(COALESCE(py.ticket_medio_anterior, 0)::numeric, 2) as ticket_medio_anterior,
+  CASE 
+    WHEN COALESCE(py.ticket_medio_anterior, 0) > 0 
+    THEN ROUND(((cy.ticket_medio - py.ticket_medio_anterior) / py.ticket_medio_anterior * 100)::numeric, 1)
+    ELSE 0 
+  END as ticket_medio_variacao,
+  -- Orçamentos Valor
+  COALESCE(oc.orcamentos_valor, 0) as orcamentos_valor,
+  COALESCE(op.orcamentos_valor_anterior, 0) as orcamentos_valor_anterior,
+  CASE 
+    WHEN COALESCE(op.orcamentos_valor_anterior, 0) > 0 
+    THEN ROUND(((COALESCE(oc.orcamentos_valor, 0) - op.orcamentos_valor_anterior) / op.orcamentos_valor_anterior * 100)::numeric, 1)
+    ELSE 0 
+  END as orcamentos_valor_variacao,
+  -- Orçamentos QTD
+  COALESCE(oc.orcamentos_qtd, 0) as orcamentos_qtd,
+  COALESCE(op.orcamentos_qtd_anterior, 0) as orcamentos_qtd_anterior,
+  CASE 
+    WHEN COALESCE(op.orcamentos_qtd_anterior, 0) > 0 
+    THEN ROUND(((COALESCE(oc.orcamentos_qtd, 0) - op.orcamentos_qtd_anterior)::numeric / op.orcamentos_qtd_anterior * 100)::numeric, 1)
+    ELSE 0 
+  END as orcamentos_qtd_variacao,
+  -- Taxa Conversão
+  CASE 
+    WHEN COALESCE(tc.total_orcamentos_clientes, 0) > 0 
+    THEN ROUND((tc.total_faturas_clientes::numeric / tc.total_orcamentos_clientes * 100)::numeric, 1)
+    ELSE 0 
+  END as taxa_conversao,
+  CASE 
+    WHEN COALESCE(tca.total_orcamentos_clientes_anterior, 0) > 0 
+    THEN ROUND((tca.total_faturas_clientes_anterior::numeric / tca.total_orcamentos_clientes_anterior * 100)::numeric, 1)
+    ELSE 0 
+  END as taxa_conversao_anterior,
+  CASE 
+    WHEN COALESCE(tca.total_orcamentos_clientes_anterior, 0) > 0 
+    THEN ROUND((
+      (tc.total_faturas_clientes::numeric / tc.total_orcamentos_clientes * 100) -
+      (tca.total_faturas_clientes_anterior::numeric / tca.total_orcamentos_clientes_anterior * 100)
+    )::numeric, 1)
+    ELSE 0 
+  END as taxa_conversao_variacao
+FROM current_year_data cy
+LEFT JOIN previous_year_data py ON cy.departamento = py.departamento
+LEFT JOIN orcamentos_current oc ON cy.departamento = oc.departamento
+LEFT JOIN orcamentos_previous op ON cy.departamento = op.departamento
+LEFT JOIN taxa_conversao tc ON cy.departamento = tc.departamento
+LEFT JOIN taxa_conversao_anterior tca ON cy.departamento = tca.departamento
+-- Add a TOTAL row
+UNION ALL
+SELECT 
+  'TOTAL' as departamento,
+  SUM(cy.faturacao),
+  SUM(COALESCE(py.faturacao_anterior, 0)),
+  CASE 
+    WHEN SUM(COALESCE(py.faturacao_anterior, 0)) > 0 
+    THEN ROUND(((SUM(cy.faturacao) - SUM(py.faturacao_anterior)) / SUM(py.faturacao_anterior) * 100)::numeric, 1)
+    ELSE 0 
+  END,
+  SUM(cy.notas_credito),
+  SUM(COALESCE(py.notas_credito_anterior, 0)),
+  CASE 
+    WHEN SUM(COALESCE(py.notas_credito_anterior, 0)) > 0 
+    THEN ROUND(((SUM(cy.notas_credito) - SUM(py.notas_credito_anterior)) / SUM(py.notas_credito_anterior) * 100)::numeric, 1)
+    ELSE 0 
+  END,
+  SUM(cy.num_faturas),
+  SUM(COALESCE(py.num_faturas_anterior, 0)),
+  CASE 
+    WHEN SUM(COALESCE(py.num_faturas_anterior, 0)) > 0 
+    THEN ROUND(((SUM(cy.num_faturas) - SUM(py.num_faturas_anterior))::numeric / SUM(py.num_faturas_anterior) * 100)::numeric, 1)
+    ELSE 0 
+  END,
+  SUM(cy.num_notas),
+  SUM(COALESCE(py.num_notas_anterior, 0)),
+  CASE 
+    WHEN SUM(COALESCE(py.num_notas_anterior, 0)) > 0 
+    THEN ROUND(((SUM(cy.num_notas) - SUM(py.num_notas_anterior))::numeric / SUM(py.num_notas_anterior) * 100)::numeric, 1)
+    ELSE 0 
+  END,
+  ROUND((SUM(cy.faturacao) / NULLIF(SUM(cy.num_faturas), 0))::numeric, 2),
+  ROUND((SUM(COALESCE(py.faturacao_anterior, 0)) / NULLIF(SUM(py.num_faturas_anterior), 0))::numeric, 2),
+  CASE 
+    WHEN (SUM(COALESCE(py.faturacao_anterior, 0)) / NULLIF(SUM(py.num_faturas_anterior), 0)) > 0 
+    THEN ROUND((((SUM(cy.faturacao) / NULLIF(SUM(cy.num_faturas), 0)) - 
+                 (SUM(py.faturacao_anterior) / NULLIF(SUM(py.num_faturas_anterior), 0))) / 
+                 (SUM(py.faturacao_anterior) / NULLIF(SUM(py.num_faturas_anterior), 0)) * 100)::numeric, 1)
+    ELSE 0 
+  END,
+  SUM(COALESCE(oc.orcamentos_valor, 0)),
+  SUM(COALESCE(op.orcamentos_valor_anterior, 0)),
+  CASE 
+    WHEN SUM(COALESCE(op.orcamentos_valor_anterior, 0)) > 0 
+    THEN ROUND(((SUM(COALESCE(oc.orcamentos_valor, 0)) - SUM(op.orcamentos_valor_anterior)) / SUM(op.orcamentos_valor_anterior) * 100)::numeric, 1)
+    ELSE 0 
+  END,
+  SUM(COALESCE(oc.orcamentos_qtd, 0)),
+  SUM(COALESCE(op.orcamentos_qtd_anterior, 0)),
+  CASE 
+    WHEN SUM(COALESCE(op.orcamentos_qtd_anterior, 0)) > 0 
+    THEN ROUND(((SUM(COALESCE(oc.orcamentos_qtd, 0)) - SUM(op.orcamentos_qtd_anterior))::numeric / SUM(op.orcamentos_qtd_anterior) * 100)::numeric, 1)
+    ELSE 0 
+  END,
+  CASE 
+    WHEN SUM(COALESCE(tc.total_orcamentos_clientes, 0)) > 0 
+    THEN ROUND((SUM(tc.total_faturas_clientes)::numeric / SUM(tc.total_orcamentos_clientes) * 100)::numeric, 1)
+    ELSE 0 
+  END,
+  CASE 
+    WHEN SUM(COALESCE(tca.total_orcamentos_clientes_anterior, 0)) > 0 
+    THEN ROUND((SUM(tca.total_faturas_clientes_anterior)::numeric / SUM(tca.total_orcamentos_clientes_anterior) * 100)::numeric, 1)
+    ELSE 0 
+  END,
+  CASE 
+    WHEN SUM(COALESCE(tca.total_orcamentos_clientes_anterior, 0)) > 0 
+    THEN ROUND((
+      (SUM(tc.total_faturas_clientes)::numeric / SUM(tc.total_orcamentos_clientes) * 100) -
+      (SUM(tca.total_faturas_clientes_anterior)::numeric / SUM(tca.total_orcamentos_clientes_anterior) * 100)
+    )::numeric, 1)
+    ELSE 0 
+  END
+FROM current_year_data cy
+LEFT JOIN previous_year_data py ON cy.departamento = py.departamento
+LEFT JOIN orcamentos_current oc ON cy.departamento = oc.departamento
+LEFT JOIN orcamentos_previous op ON cy.departamento = op.departamento
+LEFT JOIN taxa_conversao tc ON cy.departamento = tc.departamento
+LEFT JOIN taxa_conversao_anterior tca ON cy.departamento = tca.departamento
+)
+SELECT * FROM combined_results
+ORDER BY 
+  CASE WHEN departamento = 'TOTAL' THEN 1 ELSE 0 END,
+  faturacao DESC;
+$function$;
+
+-- ============================================
+-- Step 3: Cost center sales up to a day from the line rollup
+-- ============================================
+-- Whole months before p_through come from phc.fi_monthly_rollup, the
+-- month of p_through (up to that day) from the fact tables of p_source
+CREATE OR REPLACE FUNCTION phc.cost_center_sales_through(
+    p_source TEXT,
+    p_year INTEGER,
+    p_through DATE
+)
+RETURNS TABLE(cost_center TEXT, vendas NUMERIC)
+LANGUAGE sql
+STABLE
+AS $function$
+WITH bounds AS (
+  SELECT
+    make_date(p_year, 1, 1) AS year_start,
+    LEAST(p_through, make_date(p_year, 12, 31)) AS through_day
+),
+sales AS (
+  SELECT r.cost_center, r.net_value AS vendas
+  FROM phc.fi_monthly_rollup r, bounds b
+  WHERE r.source = p_source
+    AND r.year = p_year
+    AND b.through_day >= b.year_start
+    AND r.month < EXTRACT(MONTH FROM b.through_day)
+    AND r.document_type IN ('Factura', 'Nota de Crédito')
+    AND (r.anulado IS NULL OR r.anulado != 'True')
+  UNION ALL
+  SELECT fi.cost_center, fi.net_liquid_value
+  FROM phc.fi
+  INNER JOIN phc.ft ON fi.invoice_id = ft.invoice_id
+  CROSS JOIN bounds b
+  WHERE p_source = 'live'
+    AND ft.document_type IN ('Factura', 'Nota de Crédito')
+    AND (ft.anulado IS NULL OR ft.anulado != 'True')
+    AND ft.invoice_date >= GREATEST(DATE_TRUNC('month', b.through_day)::DATE, b.year_start)
+    AND ft.invoice_date <= b.through_day
+  UNION ALL
+  SELECT fi.cost_center, fi.net_liquid_value
+  FROM phc."2years_fi" fi
+  INNER JOIN phc."2years_ft" ft ON fi.invoice_id = ft.invoice_id
+  CROSS JOIN bounds b
+  WHERE p_source = '2years'
+    AND ft.document_type IN ('Factura', 'Nota de Crédito')
+    AND (ft.anulado IS NULL OR ft.anulado != 'True')
+    AND ft.invoice_date >= GREATEST(DATE_TRUNC('month', b.through_day)::DATE, b.year_start)
+    AND ft.invoice_date <= b.through_day
+)
+SELECT sales.cost_center, SUM(sales.vendas)
+FROM sales
+GROUP BY sales.cost_center;
+$function$;
+
+CREATE OR REPLACE FUNCTION public.get_cost_center_multi_year_ytd(current_year integer, current_month integer, current_day integer)
+ RETURNS TABLE(cost_center text, ano_atual numeric, ano_anterior numeric, ano_anterior_2 numeric)
+ LANGUAGE plpgsql
+ SECURITY DEFINER
+AS $function$
+DECLARE
+  year_minus_1 INTEGER;
+  year_minus_2 INTEGER;
+BEGIN
+  year_minus_1 := current_year - 1;
+  year_minus_2 := current_year - 2;
+  RETURN QUERY
+  WITH
+  -- Current Year Data (from fi and ft) - YTD
+  current_year_data AS (
+    SELECT s.cost_center, s.vendas
+    FROM phc.cost_center_sales_through('live', current_year, CURRENT_DATE) s
+    WHERE s.cost_center IN ('ID-Impressão Digital', 'BR-Brindes', 'IO-Impressão OFFSET')
+  ),
+  -- Year Minus 1 Data (from 2years_fi and 2years_ft) - YTD (same period)
+  year_minus_1_data AS (
+    SELECT s.cost_center, s.vendas
+    FROM phc.cost_center_sales_through(
+      '2years', year_minus_1, make_date(year_minus_1, current_month, current_day)
+    ) s
+    WHERE s.cost_center IN ('ID-Impressão Digital', 'BR-Brindes', 'IO-Impressão OFFSET')
+  ),
+  -- Year Minus 2 Data (from 2years_fi and 2years_ft) - YTD (same period)
+  year_minus_2_data AS (
+    SELECT s.cost_center, s.vendas
+    FROM phc.cost_center_sales_through(
+      '2years', year_minus_2, make_date(year_minus_2, current_month, current_day)
+    ) s
+    WHERE s.cost_center IN ('ID-Impressão Digital', 'BR-Brindes', 'IO-Impressão OFFSET')
+  ),
+  -- Merge all years
+  merged_data AS (
+    SELECT
+      COALESCE(cy.cost_center, y1.cost_center, y2.cost_center) as cost_center,
+      COALESCE(cy.vendas, 0) as ano_atual,
+      COALESCE(y1.vendas, 0) as ano_anterior,
+      COALESCE(y2.vendas, 0) as ano_anterior_2
+    FROM current_year_data cy
+    FULL OUTER JOIN year_minus_1_data y1 ON cy.cost_center = y1.cost_center
+    FULL OUTER JOIN year_minus_2_data y2 ON cy.cost_center = y2.cost_center
+  )
+  SELECT * FROM merged_data
+  ORDER BY ano_atual DESC;
+END;
+$function$;
@@ -0,0 +1,156 @@
+-- Migration: Content-addressed quote embeddings
+-- Date: 2025-12-14
+-- Description:
+--   - quote_embedding_vectors holds one vector per distinct (whitespace-normalised) description,
+--     keyed by its SHA-256; quote_embeddings rows reference it through content_hash
+--   - Existing vectors are moved over and the per-row copies are cleared
+--   - search_quotes_by_embedding() searches the distinct vectors and maps them back to quotes
+--   - Normalisation must match scripts/etl_core/embedding_cache.py (ASCII whitespace runs
+--     collapsed to one space, ends trimmed)
+
+-- ============================================
+-- Step 1: Hash function (same as content_hash() in Python)
+-- ============================================
+CREATE OR REPLACE FUNCTION public.quote_text_hash(p_text TEXT)
+RETURNS TEXT
+LANGUAGE sql
+IMMUTABLE
+PARALLEL SAFE
+SET search_path = public
+AS $function$
+  SELECT encode(
+    sha256(convert_to(btrim(regexp_replace(COALESCE(p_text, ''), '[ \t\n\r\f\v]+', ' ', 'g'), ' '), 'UTF8')),
+    'hex'
+  );
+$function$;
+
+-- ============================================
+-- Step 2: Distinct vectors
+-- ============================================
+CREATE TABLE IF NOT EXISTS public.quote_embedding_vectors (
+    content_hash TEXT PRIMARY KEY,
+    embedding vector(1536) NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_quote_embedding_vectors_hnsw
+ON public.quote_embedding_vectors
+USING hnsw (embedding vector_cosine_ops);
+
+GRANT SELECT ON public.quote_embedding_vectors TO authenticated;
+GRANT SELECT, INSERT, UPDATE ON public.quote_embedding_vectors TO service_role;
+
+COMMENT ON TABLE public.quote_embedding_vectors IS 'One embedding per distinct normalised quote description (SHA-256 content_hash)';
+
+-- ============================================
+-- Step 3: quote_embeddings references the vector by hash
+-- ============================================
+ALTER TABLE public.quote_embeddings ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+UPDATE public.quote_embeddings
+SET content_hash = public.quote_text_hash(description)
+WHERE content_hash IS NULL
+  AND description_embedding IS NOT NULL;
+
+INSERT INTO public.quote_embedding_vectors (content_hash, embedding)
+SELECT DISTINCT ON (content_hash) content_hash, description_embedding
+FROM public.quote_embeddings
+WHERE description_embedding IS NOT NULL
+ORDER BY content_hash, id
+ON CONFLICT (content_hash) DO NOTHING;
+
+-- The per-row copies are no longer read
+UPDATE public.quote_embeddings
+SET description_embedding = NULL
+WHERE description_embedding IS NOT NULL;
+
+DROP INDEX IF EXISTS public.idx_quote_embeddings_vector;
+
+CREATE INDEX IF NOT EXISTS idx_quote_embeddings_content_hash
+ON public.quote_embeddings (content_hash);
+
+COMMENT ON COLUMN public.quote_embeddings.content_hash IS 'quote_embedding_vectors.content_hash of the normalised description';
+COMMENT ON COLUMN public.quote_embeddings.description_embedding IS 'Deprecated: vectors live in quote_embedding_vectors';
+
+-- ============================================
+-- Step 4: Semantic search over the distinct vectors
+-- ============================================
+CREATE OR REPLACE FUNCTION search_quotes_by_embedding(
+    query_embedding vector(1536),
+    match_count INT DEFAULT 20,
+    similarity_threshold FLOAT DEFAULT 0.3
+)
+RETURNS TABLE (
+    document_number TEXT,
+    document_date DATE,
+    total_value NUMERIC,
+    description_preview TEXT,
+    qty_lines JSONB,
+    similarity FLOAT
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, phc
+AS $$
+BEGIN
+    RETURN QUERY
+    WITH similar_vectors AS (
+        SELECT
+            v.content_hash,
+            (1 - (v.embedding <=> query_embedding))::FLOAT AS similarity
+        FROM quote_embedding_vectors v
+        WHERE (1 - (v.embedding <=> query_embedding)) >= similarity_threshold
+    ),
+    similar_embeddings AS (
+        SELECT DISTINCT ON (qe.document_number)
+            qe.document_number,
+            sv.similarity
+        FROM similar_vectors sv
+        JOIN quote_embeddings qe ON qe.content_hash = sv.content_hash
+        ORDER BY qe.document_number, sv.similarity DESC
+    ),
+    quote_data AS (
+        SELECT
+            bo.document_number,
+            bo.document_date,
+            bo.total_value,
+            jsonb_agg(
+                jsonb_build_object(
+                    'qty', bi.quantity,
+                    'total', bi.line_total,
+                    'unit_price', COALESCE(
+                        NULLIF(bi.unit_price, 0),
+                        CASE
+                            WHEN bi.quantity > 0 THEN ROUND(bi.line_total / bi.quantity, 2)
+                            ELSE NULL
+                        END
+                    ),
+                    'description', bi.description
+                )
+                ORDER BY bi.line_order, bi.line_number
+            ) AS lines,
+            STRING_AGG(
+                bi.description,
+                E'\n' ORDER BY bi.line_order, bi.line_number
+            ) AS all_descriptions
+        FROM phc.temp_quotes_bo bo
+        LEFT JOIN phc.temp_quotes_bi bi ON bo.document_id = bi.document_id
+        WHERE bo.document_number IN (SELECT se.document_number FROM similar_embeddings se)
+        GROUP BY bo.document_number, bo.document_date, bo.total_value
+    )
+    SELECT
+        qd.document_number,
+        qd.document_date,
+        qd.total_value,
+        LEFT(qd.all_descriptions, 500) AS description_preview,
+        COALESCE(qd.lines, '[]'::jsonb) AS qty_lines,
+        se.similarity
+    FROM quote_data qd
+    JOIN similar_embeddings se ON qd.document_number = se.document_number
+    ORDER BY se.similarity DESC
+    LIMIT match_count;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.quote_text_hash(TEXT) TO authenticated;
+GRANT EXECUTE ON FUNCTION public.quote_text_hash(TEXT) TO service_role;
@@ -0,0 +1,122 @@
+-- Migration: Keyset work queue for quote embeddings
+-- Date: 2025-12-14
+-- Description:
+--   - get_quote_texts_needing_embeddings(after_hash, limit): next distinct texts without a
+--     vector, in content_hash order after the caller's cursor (index scan + anti-join,
+--     O(limit) per page instead of re-reading quote_embeddings and temp_quotes_bi)
+--   - count_quote_texts_needing_embeddings(): total for progress / ETA
+--   - link_quote_embeddings(): one set-based insert of the missing quote_embeddings rows
+--   - phc.temp_quotes_bi gets an index on quote_text_hash(description) and on document_id
+--     (import_temp_quotes_bi.py recreates both after each import)
+
+-- ============================================
+-- Step 1: Indexes
+-- ============================================
+CREATE INDEX IF NOT EXISTS idx_temp_quotes_bi_content_hash
+ON phc.temp_quotes_bi (public.quote_text_hash(description))
+WHERE description IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_temp_quotes_bi_document_id
+ON phc.temp_quotes_bi (document_id);
+
+-- ============================================
+-- Step 2: Next page of texts to embed
+-- ============================================
+CREATE OR REPLACE FUNCTION public.get_quote_texts_needing_embeddings(
+    p_after_hash TEXT DEFAULT '',
+    p_limit INTEGER DEFAULT 500
+)
+RETURNS TABLE (
+    content_hash TEXT,
+    description TEXT
+)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public, phc
+AS $function$
+  SELECT texts.content_hash, texts.description
+  FROM (
+    SELECT DISTINCT ON (public.quote_text_hash(bi.description))
+      public.quote_text_hash(bi.description) AS content_hash,
+      bi.description
+    FROM phc.temp_quotes_bi bi
+    WHERE bi.description IS NOT NULL
+      AND public.quote_text_hash(bi.description) > COALESCE(p_after_hash, '')
+      AND EXISTS (
+        SELECT 1 FROM phc.temp_quotes_bo bo
+        WHERE bo.document_id = bi.document_id AND bo.document_number IS NOT NULL
+      )
+    ORDER BY public.quote_text_hash(bi.description)
+  ) texts
+  WHERE NOT EXISTS (
+    SELECT 1 FROM public.quote_embedding_vectors v WHERE v.content_hash = texts.content_hash
+  )
+  ORDER BY texts.content_hash
+  LIMIT p_limit;
+$function$;
+
+CREATE OR REPLACE FUNCTION public.count_quote_texts_needing_embeddings()
+RETURNS BIGINT
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public, phc
+AS $function$
+  SELECT COUNT(DISTINCT public.quote_text_hash(bi.description))
+  FROM phc.temp_quotes_bi bi
+  JOIN phc.temp_quotes_bo bo ON bo.document_id = bi.document_id
+  WHERE bi.description IS NOT NULL
+    AND bo.document_number IS NOT NULL
+    AND NOT EXISTS (
+      SELECT 1 FROM public.quote_embedding_vectors v
+      WHERE v.content_hash = public.quote_text_hash(bi.description)
+    );
+$function$;
+
+-- ============================================
+-- Step 3: Link quote lines to their vectors
+-- ============================================
+CREATE OR REPLACE FUNCTION public.link_quote_embeddings()
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, phc
+AS $function$
+DECLARE
+  v_linked INTEGER;
+BEGIN
+  INSERT INTO public.quote_embeddings (document_number, description, content_hash)
+  SELECT DISTINCT ON (bo.document_number, bi.description)
+    bo.document_number::TEXT,
+    bi.description,
+    v.content_hash
+  FROM phc.temp_quotes_bi bi
+  JOIN phc.temp_quotes_bo bo ON bo.document_id = bi.document_id
+  JOIN public.quote_embedding_vectors v ON v.content_hash = public.quote_text_hash(bi.description)
+  WHERE bi.description IS NOT NULL
+    AND bo.document_number IS NOT NULL
+    AND NOT EXISTS (
+      SELECT 1 FROM public.quote_embeddings qe
+      WHERE qe.document_number = bo.document_number::TEXT
+        AND qe.description = bi.description
+        AND qe.content_hash = v.content_hash
+    )
+  ORDER BY bo.document_number, bi.description
+  ON CONFLICT (document_number, description) DO UPDATE
+  SET content_hash = EXCLUDED.content_hash,
+      description_embedding = NULL,
+      updated_at = NOW();
+
+  GET DIAGNOSTICS v_linked = ROW_COUNT;
+  RETURN v_linked;
+END;
+$function$;
+
+-- Service role only: these drive the ETL, not the app
+REVOKE ALL ON FUNCTION public.get_quote_texts_needing_embeddings(TEXT, INTEGER) FROM PUBLIC;
+REVOKE ALL ON FUNCTION public.count_quote_texts_needing_embeddings() FROM PUBLIC;
+REVOKE ALL ON FUNCTION public.link_quote_embeddings() FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.get_quote_texts_needing_embeddings(TEXT, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION public.count_quote_texts_needing_embeddings() TO service_role;
+GRANT EXECUTE ON FUNCTION public.link_quote_embeddings() TO service_role;
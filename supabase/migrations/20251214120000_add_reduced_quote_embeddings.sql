@@ -0,0 +1,261 @@
+-- Migration: Reduced storage for quote embeddings (halfvec / PCA)
+-- Date: 2025-12-14
+-- Description:
+--   - quote_embedding_vectors can keep each vector as full vector(1536), halfvec(1536)
+--     (half the size) or vector(256) projected with a fitted PCA (a sixth of the size);
+--     each form has its own HNSW index, which only covers the rows stored that way
+--   - quote_embedding_projections / _components hold the projection fitted by
+--     scripts/etl/reduce_quote_embeddings.py; project_quote_embedding() applies the
+--     active one to the search query
+--   - convert_quote_embedding_storage(storage) converts the stored vectors in place
+--   - search_quotes_by_embedding() runs an ordered k-NN over each form (so each HNSW
+--     index is used) and applies the similarity threshold to those candidates
+--   - Requires pgvector 0.7+ (halfvec)
+
+-- ============================================
+-- Step 1: Reduced columns
+-- ============================================
+ALTER TABLE public.quote_embedding_vectors ALTER COLUMN embedding DROP NOT NULL;
+ALTER TABLE public.quote_embedding_vectors ADD COLUMN IF NOT EXISTS embedding_half halfvec(1536);
+ALTER TABLE public.quote_embedding_vectors ADD COLUMN IF NOT EXISTS embedding_reduced vector(256);
+
+ALTER TABLE public.quote_embedding_vectors DROP CONSTRAINT IF EXISTS quote_embedding_vectors_has_vector;
+ALTER TABLE public.quote_embedding_vectors ADD CONSTRAINT quote_embedding_vectors_has_vector
+CHECK (embedding IS NOT NULL OR embedding_half IS NOT NULL OR embedding_reduced IS NOT NULL);
+
+CREATE INDEX IF NOT EXISTS idx_quote_embedding_vectors_half_hnsw
+ON public.quote_embedding_vectors
+USING hnsw (embedding_half halfvec_cosine_ops);
+
+CREATE INDEX IF NOT EXISTS idx_quote_embedding_vectors_reduced_hnsw
+ON public.quote_embedding_vectors
+USING hnsw (embedding_reduced vector_cosine_ops);
+
+GRANT UPDATE, DELETE ON public.quote_embedding_vectors TO service_role;
+
+COMMENT ON COLUMN public.quote_embedding_vectors.embedding IS 'Full float4 embedding (EMBEDDING_STORAGE=full)';
+COMMENT ON COLUMN public.quote_embedding_vectors.embedding_half IS 'Half-precision embedding (EMBEDDING_STORAGE=halfvec)';
+COMMENT ON COLUMN public.quote_embedding_vectors.embedding_reduced IS 'Embedding projected by the active quote_embedding_projections row (EMBEDDING_STORAGE=pca)';
+
+-- ============================================
+-- Step 2: Fitted projections
+-- ============================================
+CREATE TABLE IF NOT EXISTS public.quote_embedding_projections (
+    name TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    source_dimensions INTEGER NOT NULL DEFAULT 1536 CHECK (source_dimensions = 1536),
+    dimensions INTEGER NOT NULL DEFAULT 256 CHECK (dimensions = 256),
+    explained_variance REAL,
+    sample_count INTEGER,
+    is_active BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- At most one active projection
+CREATE UNIQUE INDEX IF NOT EXISTS idx_quote_embedding_projections_active
+ON public.quote_embedding_projections (is_active)
+WHERE is_active;
+
+CREATE TABLE IF NOT EXISTS public.quote_embedding_projection_components (
+    projection_name TEXT NOT NULL REFERENCES public.quote_embedding_projections (name) ON DELETE CASCADE,
+    component INTEGER NOT NULL,
+    weights vector(1536) NOT NULL,
+    PRIMARY KEY (projection_name, component)
+);
+
+GRANT SELECT ON public.quote_embedding_projections TO authenticated;
+GRANT SELECT ON public.quote_embedding_projection_components TO authenticated;
+GRANT SELECT, INSERT, UPDATE, DELETE ON public.quote_embedding_projections TO service_role;
+GRANT SELECT, INSERT, UPDATE, DELETE ON public.quote_embedding_projection_components TO service_role;
+
+COMMENT ON TABLE public.quote_embedding_projections IS 'PCA projections of quote embeddings to 256 dimensions (fitted by scripts/etl/reduce_quote_embeddings.py)';
+
+-- ============================================
+-- Step 3: Project a full vector with the active projection (NULL when none is active)
+-- ============================================
+CREATE OR REPLACE FUNCTION public.project_quote_embedding(p_embedding vector(1536))
+RETURNS vector(256)
+LANGUAGE sql
+STABLE
+SET search_path = public
+AS $function$
+  -- <#> is the negative inner product: one dot product per component
+  SELECT (array_agg(-(p_embedding <#> c.weights) ORDER BY c.component))::vector(256)
+  FROM public.quote_embedding_projections p
+  JOIN public.quote_embedding_projection_components c ON c.projection_name = p.name
+  WHERE p.is_active;
+$function$;
+
+-- ============================================
+-- Step 4: Convert the stored vectors
+-- ============================================
+CREATE OR REPLACE FUNCTION public.convert_quote_embedding_storage(p_storage TEXT)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $function$
+DECLARE
+  v_converted INTEGER;
+  v_dropped INTEGER;
+BEGIN
+  IF p_storage = 'full' THEN
+    UPDATE quote_embedding_vectors
+    SET embedding = embedding_half::vector(1536), embedding_half = NULL, embedding_reduced = NULL
+    WHERE embedding IS NULL AND embedding_half IS NOT NULL;
+    GET DIAGNOSTICS v_converted = ROW_COUNT;
+
+    -- A projection cannot be undone: these texts are embedded again
+    -- (from the generator's local cache when it has them)
+    DELETE FROM quote_embedding_vectors
+    WHERE embedding IS NULL AND embedding_half IS NULL;
+    GET DIAGNOSTICS v_dropped = ROW_COUNT;
+    IF v_dropped > 0 THEN
+      RAISE NOTICE '% PCA-only vectors removed; run generate_quote_embeddings.py to restore them', v_dropped;
+    END IF;
+
+  ELSIF p_storage = 'halfvec' THEN
+    UPDATE quote_embedding_vectors
+    SET embedding_half = embedding::halfvec(1536), embedding = NULL, embedding_reduced = NULL
+    WHERE embedding IS NOT NULL;
+    GET DIAGNOSTICS v_converted = ROW_COUNT;
+
+  ELSIF p_storage = 'pca' THEN
+    IF NOT EXISTS (SELECT 1 FROM quote_embedding_projections WHERE is_active) THEN
+      RAISE EXCEPTION 'No active projection: run reduce_quote_embeddings.py fit --activate first';
+    END IF;
+    UPDATE quote_embedding_vectors
+    SET embedding_reduced = project_quote_embedding(COALESCE(embedding, embedding_half::vector(1536))),
+        embedding = NULL,
+        embedding_half = NULL
+    WHERE embedding IS NOT NULL OR embedding_half IS NOT NULL;
+    GET DIAGNOSTICS v_converted = ROW_COUNT;
+
+  ELSE
+    RAISE EXCEPTION 'Unknown storage %, expected full, halfvec or pca', p_storage;
+  END IF;
+
+  RETURN v_converted;
+END;
+$function$;
+
+REVOKE ALL ON FUNCTION public.convert_quote_embedding_storage(TEXT) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.convert_quote_embedding_storage(TEXT) TO service_role;
+GRANT EXECUTE ON FUNCTION public.project_quote_embedding(vector) TO authenticated;
+GRANT EXECUTE ON FUNCTION public.project_quote_embedding(vector) TO service_role;
+
+-- ============================================
+-- Step 5: Semantic search over every storage form
+-- ============================================
+CREATE OR REPLACE FUNCTION search_quotes_by_embedding(
+    query_embedding vector(1536),
+    match_count INT DEFAULT 20,
+    similarity_threshold FLOAT DEFAULT 0.3
+)
+RETURNS TABLE (
+    document_number TEXT,
+    document_date DATE,
+    total_value NUMERIC,
+    description_preview TEXT,
+    qty_lines JSONB,
+    similarity FLOAT
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, phc
+AS $$
+DECLARE
+    query_half halfvec(1536) := query_embedding::halfvec(1536);
+    query_reduced vector(256) := project_quote_embedding(query_embedding);
+    -- Vectors are shared between quotes and a quote can have several, so each
+    -- form returns more nearest vectors than the quotes asked for
+    candidate_count INT := GREATEST(match_count * 5, 100);
+BEGIN
+    -- An HNSW scan returns at most ef_search rows (1000 at most)
+    PERFORM set_config('hnsw.ef_search', LEAST(candidate_count, 1000)::TEXT, true);
+
+    RETURN QUERY
+    WITH scored_vectors AS (
+        -- One ordered k-NN per form, so each uses its HNSW index; the
+        -- threshold is applied to the candidates. A row stored in two forms
+        -- is scored twice and collapsed by similar_embeddings.
+        (
+            SELECT v.content_hash, (1 - (v.embedding <=> query_embedding))::FLOAT AS similarity
+            FROM quote_embedding_vectors v
+            WHERE v.embedding IS NOT NULL
+            ORDER BY v.embedding <=> query_embedding
+            LIMIT candidate_count
+        )
+        UNION ALL
+        (
+            SELECT v.content_hash, (1 - (v.embedding_half <=> query_half))::FLOAT
+            FROM quote_embedding_vectors v
+            WHERE v.embedding_half IS NOT NULL
+            ORDER BY v.embedding_half <=> query_half
+            LIMIT candidate_count
+        )
+        UNION ALL
+        (
+            SELECT v.content_hash, (1 - (v.embedding_reduced <=> query_reduced))::FLOAT
+            FROM quote_embedding_vectors v
+            WHERE v.embedding_reduced IS NOT NULL
+              AND query_reduced IS NOT NULL
+            ORDER BY v.embedding_reduced <=> query_reduced
+            LIMIT candidate_count
+        )
+    ),
+    similar_vectors AS (
+        SELECT sv.content_hash, sv.similarity
+        FROM scored_vectors sv
+        WHERE sv.similarity >= similarity_threshold
+    ),
+    similar_embeddings AS (
+        SELECT DISTINCT ON (qe.document_number)
+            qe.document_number,
+            sv.similarity
+        FROM similar_vectors sv
+        JOIN quote_embeddings qe ON qe.content_hash = sv.content_hash
+        ORDER BY qe.document_number, sv.similarity DESC
+    ),
+    quote_data AS (
+        SELECT
+            bo.document_number,
+            bo.document_date,
+            bo.total_value,
+            jsonb_agg(
+                jsonb_build_object(
+                    'qty', bi.quantity,
+                    'total', bi.line_total,
+                    'unit_price', COALESCE(
+                        NULLIF(bi.unit_price, 0),
+                        CASE
+                            WHEN bi.quantity > 0 THEN ROUND(bi.line_total / bi.quantity, 2)
+                            ELSE NULL
+                        END
+                    ),
+                    'description', bi.description
+                )
+                ORDER BY bi.line_order, bi.line_number
+            ) AS lines,
+            STRING_AGG(
+                bi.description,
+                E'\n' ORDER BY bi.line_order, bi.line_number
+            ) AS all_descriptions
+        FROM phc.temp_quotes_bo bo
+        LEFT JOIN phc.temp_quotes_bi bi ON bo.document_id = bi.document_id
+        WHERE bo.document_number IN (SELECT se.document_number FROM similar_embeddings se)
+        GROUP BY bo.document_number, bo.document_date, bo.total_value
+    )
+    SELECT
+        qd.document_number,
+        qd.document_date,
+        qd.total_value,
+        LEFT(qd.all_descriptions, 500) AS description_preview,
+        COALESCE(qd.lines, '[]'::jsonb) AS qty_lines,
+        se.similarity
+    FROM quote_data qd
+    JOIN similar_embeddings se ON qd.document_number = se.document_number
+    ORDER BY se.similarity DESC
+    LIMIT match_count;
+END;
+$$;